@@ -7,6 +7,7 @@ from alembic import context
 
 from src.config import settings
 from src.models import Base
+from src.online_migrations import PROGRESS_TABLE
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -33,6 +34,11 @@ def get_url():
     return settings.database_url
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # Служебная таблица пакетных миграций не описана в моделях
+    return not (type_ == "table" and name == PROGRESS_TABLE)
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -49,6 +55,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -64,19 +71,25 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    configuration = config.get_section(config.config_ini_section)
-    configuration["sqlalchemy.url"] = get_url()
-    connectable = engine_from_config(
-        configuration,
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
-
-        with context.begin_transaction():
-            context.run_migrations()
+    # Схема одинакова на всех шардах: мигрируем основную БД и каждый шард
+    for database_url in [get_url(), *settings.shard_urls]:
+        configuration = config.get_section(config.config_ini_section)
+        configuration["sqlalchemy.url"] = database_url
+        connectable = engine_from_config(
+            configuration,
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+        )
+
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                include_object=include_object,
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
 
 
 if context.is_offline_mode():
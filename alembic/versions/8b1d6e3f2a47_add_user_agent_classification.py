@@ -0,0 +1,182 @@
+"""add_user_agent_classification
+
+Revision ID: 8b1d6e3f2a47
+Revises: 4f2a9c1e7b30
+Create Date: 2026-10-19 11:03:18.274590
+
+"""
+
+import re
+from itertools import batched
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8b1d6e3f2a47"
+down_revision = "4f2a9c1e7b30"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10_000
+
+# Классификатор заморожен на момент ревизии: изменения src/user_agents.py
+# не должны менять результат уже написанной миграции.
+# Значения - коды BrowserFamily / OSFamily / DeviceType.
+_BOT_PATTERNS = [
+    (re.compile(r"TelegramBot", re.I), 20),
+    (re.compile(r"Slack(bot|-ImgProxy)", re.I), 21),
+    (re.compile(r"WhatsApp", re.I), 22),
+    (re.compile(r"Discordbot", re.I), 23),
+    (re.compile(r"facebookexternalhit|Facebot|meta-externalagent", re.I), 24),
+    (re.compile(r"Twitterbot", re.I), 25),
+    (re.compile(r"vkShare", re.I), 26),
+    (re.compile(r"Googlebot|Google-InspectionTool|APIs-Google", re.I), 40),
+    (re.compile(r"bingbot|BingPreview", re.I), 41),
+    (re.compile(r"YandexBot|YandexMobileBot|YandexImages", re.I), 42),
+    (
+        re.compile(
+            r"^(curl|Wget|python-requests|python-httpx|aiohttp|Go-http-client"
+            r"|okhttp|Java|axios|node-fetch|libwww-perl)",
+            re.I,
+        ),
+        60,
+    ),
+    (
+        re.compile(
+            r"bot\b|crawl|spider|slurp|preview|HeadlessChrome|Lighthouse|monitor",
+            re.I,
+        ),
+        99,
+    ),
+]
+_BROWSER_PATTERNS = [
+    (re.compile(r"Edg(e|A|iOS)?/"), 4),
+    (re.compile(r"OPR/|Opera"), 5),
+    (re.compile(r"YaBrowser/"), 6),
+    (re.compile(r"SamsungBrowser/"), 7),
+    (re.compile(r"Firefox/|FxiOS/"), 2),
+    (re.compile(r"Chrome/|CriOS/|Chromium/"), 1),
+    (re.compile(r"MSIE |Trident/"), 8),
+    (re.compile(r"Version/[\d.]+.*Safari/"), 3),
+]
+_OS_PATTERNS = [
+    (re.compile(r"iPhone|iPad|iPod"), 3),
+    (re.compile(r"Android"), 4),
+    (re.compile(r"Windows"), 1),
+    (re.compile(r"CrOS"), 6),
+    (re.compile(r"Mac OS X|Macintosh"), 2),
+    (re.compile(r"Linux|X11"), 5),
+]
+_DESKTOP_OS = {1, 2, 5, 6}
+_TABLET_PATTERN = re.compile(r"iPad|Tablet|Android(?!.*Mobile)")
+_MOBILE_PATTERN = re.compile(r"Mobile|iPhone|iPod|Android")
+
+DEVICE_DESKTOP, DEVICE_MOBILE, DEVICE_TABLET, DEVICE_BOT = 1, 2, 3, 4
+
+
+def _first_match(patterns: list[tuple[re.Pattern, int]], value: str) -> int:
+    for pattern, result in patterns:
+        if pattern.search(value):
+            return result
+    return 0
+
+
+def _classify(user_agent: str) -> tuple[int, int, int, bool]:
+    """(family, os, device, is_bot) - same rules as classify_user_agent."""
+    os_family = _first_match(_OS_PATTERNS, user_agent)
+    bot_family = _first_match(_BOT_PATTERNS, user_agent)
+    if bot_family:
+        return bot_family, os_family, DEVICE_BOT, True
+
+    family = _first_match(_BROWSER_PATTERNS, user_agent)
+    if _TABLET_PATTERN.search(user_agent):
+        device = DEVICE_TABLET
+    elif _MOBILE_PATTERN.search(user_agent):
+        device = DEVICE_MOBILE
+    elif os_family in _DESKTOP_OS:
+        device = DEVICE_DESKTOP
+    else:
+        device = 0
+    return family, os_family, device, False
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column(
+        "clicks",
+        sa.Column("ua_family", sa.SmallInteger(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "clicks",
+        sa.Column("ua_os", sa.SmallInteger(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "clicks",
+        sa.Column("ua_device", sa.SmallInteger(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "clicks",
+        sa.Column("is_bot", sa.Boolean(), server_default=sa.false(), nullable=False),
+    )
+    # ### end Alembic commands ###
+
+    # Классифицируем уникальные UA в Python и складываем во временную таблицу
+    # (живет до конца сессии, переживает коммиты autocommit_block)
+    conn = op.get_bind()
+    op.execute(
+        "CREATE TEMP TABLE ua_classification ("
+        "user_agent text PRIMARY KEY, family smallint NOT NULL, "
+        "os smallint NOT NULL, device smallint NOT NULL, is_bot boolean NOT NULL)"
+    )
+    insert = sa.text(
+        "INSERT INTO ua_classification VALUES (:user_agent, :family, :os, :device, :is_bot)"
+    )
+    user_agents = conn.execute(
+        sa.text(
+            "SELECT DISTINCT user_agent FROM clicks WHERE user_agent <> ''"
+        ).execution_options(yield_per=BATCH_SIZE)
+    )
+    for chunk in batched(user_agents.scalars(), BATCH_SIZE):
+        rows = []
+        for user_agent in chunk:
+            family, os_family, device, is_bot = _classify(user_agent)
+            if family or os_family or device or is_bot:
+                rows.append(
+                    {
+                        "user_agent": user_agent,
+                        "family": family,
+                        "os": os_family,
+                        "device": device,
+                        "is_bot": is_bot,
+                    }
+                )
+        if rows:
+            conn.execute(insert, rows)
+    op.execute("ANALYZE ua_classification")
+
+    # Один проход по clicks диапазонами id, коммит после каждой пачки
+    max_id = conn.execute(sa.text("SELECT coalesce(max(id), 0) FROM clicks")).scalar()
+    with op.get_context().autocommit_block():
+        for start in range(1, max_id + 1, BATCH_SIZE):
+            conn.execute(
+                sa.text(
+                    "UPDATE clicks c SET ua_family = u.family, ua_os = u.os, "
+                    "ua_device = u.device, is_bot = u.is_bot "
+                    "FROM ua_classification u "
+                    "WHERE c.user_agent = u.user_agent "
+                    "AND c.id BETWEEN :start AND :end"
+                ),
+                {"start": start, "end": start + BATCH_SIZE - 1},
+            )
+        conn.exec_driver_sql("DROP TABLE ua_classification")
+
+
+def downgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_column("clicks", "is_bot")
+    op.drop_column("clicks", "ua_device")
+    op.drop_column("clicks", "ua_os")
+    op.drop_column("clicks", "ua_family")
+    # ### end Alembic commands ###
@@ -0,0 +1,31 @@
+"""add_shard_map
+
+Revision ID: b4d7e2f9a815
+Revises: 3c7f1a9e5d20
+Create Date: 2026-10-19 16:40:12.377904
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b4d7e2f9a815"
+down_revision = "3c7f1a9e5d20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Карту читают только с шарда 0; пустая таблица - бакеты поровну
+    op.create_table(
+        "shard_map",
+        sa.Column("bucket", sa.SmallInteger(), autoincrement=False, nullable=False),
+        sa.Column("shard", sa.SmallInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("bucket"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("shard_map")
@@ -0,0 +1,175 @@
+"""dictionary_encode_clicks
+
+Revision ID: c5e8a2b9d613
+Revises: 8b1d6e3f2a47
+Create Date: 2026-10-19 12:27:55.618004
+
+Workers of the previous version keep inserting text user agents, referers
+and IPs while the backfill runs. A temporary trigger encodes their rows on
+insert; it is created before the backfill reads max(id), and creating it
+waits for in-flight inserts, so every row is converted by one or the other
+before the text columns are dropped.
+
+The backfill rewrites every clicks row, so the table ends up about twice its
+size: dead versions stay in the file and plain VACUUM only marks them
+reusable. Run `pg_repack --table=clicks` (online) or `VACUUM FULL clicks`
+(ACCESS EXCLUSIVE for the whole rewrite) on every shard afterwards.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "c5e8a2b9d613"
+down_revision = "8b1d6e3f2a47"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10_000
+
+# Некорректные IP (мусор из X-Forwarded-For) превращаем в NULL, а не роняем миграцию
+SAFE_INET_FUNCTION = """
+CREATE OR REPLACE FUNCTION pg_temp.safe_inet(value text) RETURNS inet AS $$
+BEGIN
+    RETURN value::inet;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+# Кодирует строки, которые вставляют воркеры прежней версии во время миграции
+ENCODE_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION clicks_dictionary_encode() RETURNS trigger AS $$
+BEGIN
+    IF NEW.user_agent <> '' THEN
+        INSERT INTO user_agents (value, value_hash)
+        VALUES (NEW.user_agent, md5(NEW.user_agent)::uuid)
+        ON CONFLICT (value_hash) DO NOTHING;
+        SELECT id INTO NEW.user_agent_id FROM user_agents
+        WHERE value_hash = md5(NEW.user_agent)::uuid;
+    END IF;
+    IF NEW.referer <> '' THEN
+        INSERT INTO referers (value, value_hash)
+        VALUES (NEW.referer, md5(NEW.referer)::uuid)
+        ON CONFLICT (value_hash) DO NOTHING;
+        SELECT id INTO NEW.referer_id FROM referers
+        WHERE value_hash = md5(NEW.referer)::uuid;
+    END IF;
+    BEGIN
+        NEW.ip_inet := NEW.ip_address::inet;
+    EXCEPTION WHEN others THEN
+        NEW.ip_inet := NULL;
+    END;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def _update_in_batches(sql: str) -> None:
+    """Run an UPDATE over clicks.id ranges, committing after every batch.
+
+    Covers rows committed when the block starts; newer rows must be handled
+    by a trigger created (and committed) before the call.
+    """
+    conn = op.get_bind()
+    with op.get_context().autocommit_block():
+        max_id = conn.execute(
+            sa.text("SELECT coalesce(max(id), 0) FROM clicks")
+        ).scalar()
+        for start in range(1, max_id + 1, BATCH_SIZE):
+            conn.execute(
+                sa.text(sql), {"start": start, "end": start + BATCH_SIZE - 1}
+            )
+
+
+def upgrade() -> None:
+    for table in ("user_agents", "referers"):
+        op.create_table(
+            table,
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("value", sa.Text(), nullable=False),
+            sa.Column("value_hash", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("value_hash"),
+        )
+    op.add_column("clicks", sa.Column("user_agent_id", sa.Integer(), nullable=True))
+    op.add_column("clicks", sa.Column("referer_id", sa.Integer(), nullable=True))
+    op.add_column("clicks", sa.Column("ip_inet", postgresql.INET(), nullable=True))
+    op.execute(ENCODE_TRIGGER_FUNCTION)
+    op.execute(
+        "CREATE TRIGGER clicks_dictionary_encode BEFORE INSERT ON clicks "
+        "FOR EACH ROW EXECUTE FUNCTION clicks_dictionary_encode()"
+    )
+
+    # Колонки и триггер фиксируются до сканирования clicks: дальше вставки
+    # прежних воркеров идут параллельно с миграцией и кодируются триггером
+    with op.get_context().autocommit_block():
+        # Словари из уже сохраненных значений
+        op.execute(
+            "INSERT INTO user_agents (value, value_hash) "
+            "SELECT DISTINCT user_agent, md5(user_agent)::uuid FROM clicks "
+            "WHERE user_agent IS NOT NULL AND user_agent <> '' "
+            "ON CONFLICT (value_hash) DO NOTHING"
+        )
+        op.execute(
+            "INSERT INTO referers (value, value_hash) "
+            "SELECT DISTINCT referer, md5(referer)::uuid FROM clicks "
+            "WHERE referer IS NOT NULL AND referer <> '' "
+            "ON CONFLICT (value_hash) DO NOTHING"
+        )
+        op.execute(SAFE_INET_FUNCTION)
+
+    # Переносим данные пачками, чтобы не держать блокировку на всей таблице
+    _update_in_batches(
+        "UPDATE clicks c SET "
+        "user_agent_id = (SELECT ua.id FROM user_agents ua "
+        "WHERE ua.value_hash = md5(c.user_agent)::uuid), "
+        "referer_id = (SELECT r.id FROM referers r "
+        "WHERE r.value_hash = md5(c.referer)::uuid), "
+        "ip_inet = pg_temp.safe_inet(c.ip_address) "
+        "WHERE c.id BETWEEN :start AND :end"
+    )
+
+    op.execute("DROP TRIGGER clicks_dictionary_encode ON clicks")
+    op.execute("DROP FUNCTION clicks_dictionary_encode()")
+    op.drop_column("clicks", "user_agent")
+    op.drop_column("clicks", "referer")
+    op.drop_column("clicks", "ip_address")
+    op.alter_column("clicks", "ip_inet", new_column_name="ip_address")
+    op.create_foreign_key(
+        "clicks_user_agent_id_fkey", "clicks", "user_agents", ["user_agent_id"], ["id"]
+    )
+    op.create_foreign_key(
+        "clicks_referer_id_fkey", "clicks", "referers", ["referer_id"], ["id"]
+    )
+    print(
+        "⚠️ clicks переписана целиком и раздута примерно вдвое: "
+        "выполните pg_repack --table=clicks или VACUUM FULL clicks"
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("clicks_referer_id_fkey", "clicks", type_="foreignkey")
+    op.drop_constraint("clicks_user_agent_id_fkey", "clicks", type_="foreignkey")
+    op.alter_column("clicks", "ip_address", new_column_name="ip_inet")
+    op.add_column("clicks", sa.Column("ip_address", sa.String(length=45), nullable=True))
+    op.add_column("clicks", sa.Column("user_agent", sa.Text(), nullable=True))
+    op.add_column("clicks", sa.Column("referer", sa.Text(), nullable=True))
+
+    _update_in_batches(
+        "UPDATE clicks c SET "
+        "user_agent = (SELECT ua.value FROM user_agents ua WHERE ua.id = c.user_agent_id), "
+        "referer = (SELECT r.value FROM referers r WHERE r.id = c.referer_id), "
+        "ip_address = host(c.ip_inet) "
+        "WHERE c.id BETWEEN :start AND :end"
+    )
+
+    op.drop_column("clicks", "ip_inet")
+    op.drop_column("clicks", "referer_id")
+    op.drop_column("clicks", "user_agent_id")
+    op.drop_table("referers")
+    op.drop_table("user_agents")
@@ -0,0 +1,48 @@
+"""add_url_expiry
+
+Revision ID: e7a3c9d14b52
+Revises: c5e8a2b9d613
+Create Date: 2026-10-19 14:02:31.284519
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.online_migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = "e7a3c9d14b52"
+down_revision = "c5e8a2b9d613"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "urls", sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True)
+    )
+
+    # ON DELETE CASCADE: NOT VALID не сканирует clicks под блокировкой,
+    # проверка существующих строк идет отдельно и не блокирует запись
+    op.drop_constraint("clicks_url_id_fkey", "clicks", type_="foreignkey")
+    op.execute(
+        "ALTER TABLE clicks ADD CONSTRAINT clicks_url_id_fkey "
+        "FOREIGN KEY (url_id) REFERENCES urls (id) ON DELETE CASCADE NOT VALID"
+    )
+    # Своя транзакция: иначе ACCESS EXCLUSIVE от ALTER выше держался бы
+    # все время сканирования clicks
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE clicks VALIDATE CONSTRAINT clicks_url_id_fkey")
+    # CONCURRENTLY: обычный CREATE INDEX блокирует запись в urls на всю сборку
+    create_index_concurrently(
+        "ix_urls_expires_at", "urls", ["expires_at"], where="expires_at IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_urls_expires_at", "urls")
+    op.drop_constraint("clicks_url_id_fkey", "clicks", type_="foreignkey")
+    op.create_foreign_key("clicks_url_id_fkey", "clicks", "urls", ["url_id"], ["id"])
+    op.drop_column("urls", "expires_at")
@@ -0,0 +1,45 @@
+"""add_click_counters_and_sampling
+
+Revision ID: f2b8d4a61c07
+Revises: e7a3c9d14b52
+Create Date: 2026-10-19 15:11:47.902341
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.online_migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = "f2b8d4a61c07"
+down_revision = "e7a3c9d14b52"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Без default: у старых строк и у строк, которые старые воркеры пишут до
+    # конца выкладки, вес NULL - "еще не учтена в счетчиках". Новый код всегда
+    # задает вес, а старые строки досчитывает src.click_counters пачками после
+    # выкладки, а не одним INSERT ... SELECT по всей clicks в этой транзакции.
+    op.add_column("clicks", sa.Column("sample_weight", sa.Float(), nullable=True))
+    op.create_table(
+        "url_click_counters",
+        sa.Column("url_id", sa.Integer(), nullable=False),
+        sa.Column("total", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("bot_total", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("last_click", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["url_id"], ["urls.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("url_id"),
+    )
+    create_index_concurrently(
+        "ix_clicks_uncounted", "clicks", ["id"], where="sample_weight IS NULL"
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_clicks_uncounted", "clicks")
+    op.drop_table("url_click_counters")
+    op.drop_column("clicks", "sample_weight")
@@ -0,0 +1,88 @@
+"""Refreshing stats of many links: one batch request against a request per link.
+
+    uv run python -m benchmarks.batch_stats --links 500
+
+Creates `--links` links, then refreshes their stats the way the /links page
+does (POST /api/v1/stats/batch in chunks of BATCH_STATS_MAX_CODES) and the way
+it used to (GET /api/v1/stats/{code} for every link, 6 at a time like a
+browser's per-host connection limit). Requests go through the ASGI stack to
+the configured database; caches are cleared before every round, so each
+round is cold. The links are deleted at the end.
+"""
+
+import argparse
+import asyncio
+import time
+from itertools import batched
+
+import httpx
+from sqlalchemy import delete
+
+from src.config import settings
+from src.main import app
+from src.models import URL
+from src.routes.stats import stats_cache
+from src.schemas import URLCreate
+from src.services import create_url, url_cache
+from src.sharding import shard_router
+
+BROWSER_CONNECTIONS = 6
+
+
+async def per_link(client: httpx.AsyncClient, codes: list[str]) -> None:
+    semaphore = asyncio.Semaphore(BROWSER_CONNECTIONS)
+
+    async def fetch(code: str) -> None:
+        async with semaphore:
+            response = await client.get(f"/api/v1/stats/{code}")
+            response.raise_for_status()
+
+    await asyncio.gather(*(fetch(code) for code in codes))
+
+
+async def batch(client: httpx.AsyncClient, codes: list[str]) -> None:
+    for chunk in batched(codes, settings.batch_stats_max_codes):
+        response = await client.post(
+            "/api/v1/stats/batch", json={"short_codes": list(chunk)}
+        )
+        response.raise_for_status()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Batch stats benchmark")
+    parser.add_argument("--links", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    urls = [
+        await create_url(URLCreate(original_url=f"https://example.com/bench/{i}"))
+        for i in range(args.links)
+    ]
+    codes = [url.short_code for url in urls]
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for name, refresh in (("по ссылке", per_link), ("пачкой", batch)):
+                timings = []
+                for _ in range(args.rounds):
+                    stats_cache.clear()
+                    url_cache.clear()
+                    started = time.perf_counter()
+                    await refresh(client, codes)
+                    timings.append(time.perf_counter() - started)
+                print(f"{args.links} ссылок {name}: {min(timings) * 1000:.0f} мс")
+    finally:
+        for shard, shard_urls in shard_router.group(
+            urls, lambda url: url.short_code
+        ).items():
+            async with shard.session() as db:
+                await db.execute(
+                    delete(URL).where(URL.id.in_([url.id for url in shard_urls]))
+                )
+                await db.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
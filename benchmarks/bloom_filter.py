@@ -0,0 +1,65 @@
+"""Bloom filter of short codes at production scale.
+
+    uv run python -m benchmarks.bloom_filter --codes 50000000
+
+Builds a filter sized like ShortCodeFilter does (1.5x headroom) from random
+8-character codes, then measures the real false positive rate on codes that
+were never added and the cost of a lookup.
+"""
+
+import argparse
+import random
+import string
+import time
+
+from src.bloom import BloomFilter
+
+ALPHABET = string.ascii_letters + string.digits
+BATCH = 1_000_000
+
+
+def random_codes(rng: random.Random, count: int, length: int = 8) -> list[str]:
+    return ["".join(rng.choices(ALPHABET, k=length)) for _ in range(count)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bloom filter benchmark")
+    parser.add_argument("--codes", type=int, default=50_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--probes", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    bloom = BloomFilter(int(args.codes * 1.5), args.error_rate)
+    print(
+        f"Фильтр: {bloom.memory_bytes / 1024 / 1024:.1f} МБ, "
+        f"{bloom.size / args.codes:.1f} бит на код, k={bloom.hash_count}"
+    )
+
+    # Добавленные коды - длины 8, пробы - длины 9: множества не пересекаются
+    rng = random.Random(42)
+    hashing = 0.0
+    added = 0
+    while added < args.codes:
+        batch = random_codes(rng, min(BATCH, args.codes - added))
+        started = time.perf_counter()
+        bloom.update(batch)
+        hashing += time.perf_counter() - started
+        added += len(batch)
+    print(
+        f"Построение: {hashing:.1f} с на хеширование "
+        f"({hashing / args.codes * 1e6:.2f} мкс на код)"
+    )
+
+    probes = random_codes(rng, args.probes, length=9)
+    started = time.perf_counter()
+    false_positives = sum(1 for code in probes if code in bloom)
+    elapsed = time.perf_counter() - started
+    print(
+        f"Промахи: FPR {false_positives / args.probes:.4%} "
+        f"(ожидаемый {bloom.false_positive_rate:.4%}), "
+        f"{elapsed / args.probes * 1e6:.2f} мкс на проверку"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Size and scan cost of dictionary-encoded clicks against the old layout.
+
+    uv run python -m benchmarks.click_storage --rows 5000000
+
+Fills two scratch tables with the same synthetic clicks: the old layout
+(User-Agent, Referer and IP as text) and the current one (dictionary IDs and
+inet). Prints their on-disk size and the best of several full scans
+grouped by user agent, then drops the tables.
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from src.database import engine
+
+USER_AGENTS = 500
+REFERERS = 2000
+
+SETUP = [
+    "CREATE UNLOGGED TABLE bench_user_agents (id int PRIMARY KEY, value text)",
+    "CREATE UNLOGGED TABLE bench_referers (id int PRIMARY KEY, value text)",
+    "CREATE UNLOGGED TABLE bench_clicks_compact (id bigint PRIMARY KEY, "
+    "url_id int, ip_address inet, user_agent_id int, referer_id int, "
+    "created_at timestamptz)",
+    "CREATE UNLOGGED TABLE bench_clicks_wide (id bigint PRIMARY KEY, "
+    "url_id int, ip_address varchar(45), user_agent text, referer text, "
+    "created_at timestamptz)",
+    "INSERT INTO bench_user_agents SELECT i, 'Mozilla/5.0 (Windows NT 10.0; "
+    "Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/' || i || "
+    f"'.0.0.0 Safari/537.36' FROM generate_series(1, {USER_AGENTS}) i",
+    "INSERT INTO bench_referers SELECT i, 'https://news' || i || "
+    "'.example.com/articles/some-long-slug?utm_source=newsletter' "
+    f"FROM generate_series(1, {REFERERS}) i",
+    # 30% переходов без Referer, как у прямых заходов
+    "INSERT INTO bench_clicks_compact SELECT g, g % 10000, "
+    "('10.' || (g >> 16) % 256 || '.' || (g >> 8) % 256 || '.' || g % 256)::inet, "
+    f"1 + (g * 7919) % {USER_AGENTS}, "
+    f"CASE WHEN g % 10 < 3 THEN NULL ELSE 1 + (g * 104729) % {REFERERS} END, "
+    "now() - g * interval '1 second' FROM generate_series(1::bigint, :rows) g",
+    "INSERT INTO bench_clicks_wide SELECT c.id, c.url_id, host(c.ip_address), "
+    "ua.value, r.value, c.created_at FROM bench_clicks_compact c "
+    "LEFT JOIN bench_user_agents ua ON ua.id = c.user_agent_id "
+    "LEFT JOIN bench_referers r ON r.id = c.referer_id",
+]
+TABLES = [
+    "bench_clicks_wide",
+    "bench_clicks_compact",
+    "bench_user_agents",
+    "bench_referers",
+]
+
+# Топ браузеров: по строке в старой схеме, по ID + словарь в новой
+SCANS = {
+    "bench_clicks_wide": "SELECT user_agent, count(*) FROM bench_clicks_wide "
+    "GROUP BY user_agent ORDER BY 2 DESC LIMIT 10",
+    "bench_clicks_compact": "SELECT ua.value, top.clicks FROM ("
+    "SELECT user_agent_id, count(*) AS clicks FROM bench_clicks_compact "
+    "GROUP BY user_agent_id ORDER BY 2 DESC LIMIT 10) top "
+    "JOIN bench_user_agents ua ON ua.id = top.user_agent_id",
+}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Click storage benchmark")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"DROP TABLE IF EXISTS {', '.join(TABLES)}"))
+        try:
+            started = time.perf_counter()
+            for statement in SETUP:
+                await conn.execute(text(statement), {"rows": args.rows})
+            for table in TABLES:
+                await conn.execute(text(f"VACUUM ANALYZE {table}"))
+            print(
+                f"Заполнено {args.rows} переходов за "
+                f"{time.perf_counter() - started:.1f} с"
+            )
+
+            for table, scan in SCANS.items():
+                size = await conn.scalar(
+                    text(f"SELECT pg_total_relation_size('{table}')")
+                )
+                row_bytes = await conn.scalar(
+                    text(f"SELECT avg(pg_column_size(t)) FROM {table} t")
+                )
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    await conn.execute(text(scan))
+                    timings.append(time.perf_counter() - started)
+                print(
+                    f"{table}: {size / 1024 / 1024:.1f} МБ, "
+                    f"{row_bytes:.0f} байт на строку, "
+                    f"скан с группировкой {min(timings) * 1000:.0f} мс"
+                )
+        finally:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {', '.join(TABLES)}"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
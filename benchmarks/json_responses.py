@@ -0,0 +1,114 @@
+"""JSON response paths of the hot API routes.
+
+    uv run python -m benchmarks.json_responses --requests 20000
+
+Compares returning a model through `response_model` (FastAPI validates it
+again, runs jsonable_encoder and renders with FastJSONResponse) with
+returning ready bytes from model_dump_json / TypeAdapter.dump_json, as
+/shorten and /stats/batch do. Measures the serialization alone and whole
+requests through the ASGI stack, without a network or a database.
+"""
+
+import argparse
+import asyncio
+import time
+import timeit
+from datetime import datetime, timezone
+
+import httpx
+from fastapi import FastAPI, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from src.responses import FastJSONResponse
+from src.schemas import URLResponse, URLStats, URLStatsDTO
+
+NOW = datetime.now(timezone.utc)
+URL = URLResponse(
+    id=123456,
+    original_url="https://example.com/articles/2026/10/some-long-article-slug",
+    short_code="aB3dE5gH",
+    created_at=NOW,
+    expires_at=None,
+    short_url="https://vibe.example/aB3dE5gH",
+)
+STATS = [
+    URLStatsDTO(
+        url_id=i,
+        short_code=f"code{i:04d}",
+        original_url=f"https://example.com/articles/{i}",
+        short_url=f"https://vibe.example/code{i:04d}",
+        total_clicks=i * 17,
+        created_at=NOW,
+        last_click=NOW,
+    )
+    for i in range(100)
+]
+STATS_LIST = TypeAdapter(list[URLStatsDTO])
+
+app = FastAPI(default_response_class=FastJSONResponse)
+
+
+@app.get("/model/url", response_model=URLResponse)
+async def model_url():
+    return URL
+
+
+@app.get("/bytes/url", response_model=URLResponse)
+async def bytes_url():
+    return Response(URL.model_dump_json(), media_type="application/json")
+
+
+@app.get("/model/stats", response_model=list[URLStats])
+async def model_stats():
+    return STATS
+
+
+@app.get("/bytes/stats", response_model=list[URLStats])
+async def bytes_stats():
+    return Response(STATS_LIST.dump_json(STATS), media_type="application/json")
+
+
+def serialization(number: int) -> None:
+    cases = {
+        "URLResponse: jsonable_encoder + to_json": lambda: FastJSONResponse(
+            jsonable_encoder(URL)
+        ),
+        "URLResponse: model_dump_json": lambda: URL.model_dump_json(),
+        "100 x URLStats: jsonable_encoder + to_json": lambda: FastJSONResponse(
+            jsonable_encoder(STATS)
+        ),
+        "100 x URLStats: TypeAdapter.dump_json": lambda: STATS_LIST.dump_json(STATS),
+    }
+    for name, case in cases.items():
+        elapsed = min(timeit.repeat(case, number=number, repeat=5))
+        print(f"{name}: {elapsed / number * 1e6:.1f} мкс")
+
+
+async def requests(number: int) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for path in ("/model/url", "/bytes/url", "/model/stats", "/bytes/stats"):
+            for _ in range(100):  # прогрев
+                await client.get(path)
+            started = time.perf_counter()
+            for _ in range(number):
+                await client.get(path)
+            elapsed = time.perf_counter() - started
+            print(f"GET {path}: {elapsed / number * 1e6:.0f} мкс на запрос")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON response benchmark")
+    parser.add_argument("--serializations", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=5_000)
+    args = parser.parse_args()
+
+    serialization(args.serializations)
+    asyncio.run(requests(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Static asset pipeline and prerendered pages.
+
+    python -m src.assets dist/static  # выгрузить ассеты для nginx (gzip_static)
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+from dataclasses import dataclass
+
+from fastapi import Request, Response
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from src.config import settings
+from src.responses import etag_matches
+
+STATIC_DIR = "src/web/static"
+TEMPLATES_DIR = "src/web/templates"
+STATIC_PREFIX = "/static"
+# Страница -> шаблон; данных из запроса в них нет, рендерим один раз
+PAGES = {"/": "index.html", "/links": "links.html", "/stats": "stats.html"}
+
+# Содержимое по адресу с отпечатком никогда не меняется
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Старые адреса без отпечатка (favicon у браузеров, закладки) - ненадолго
+SHORT_LIVED = "public, max-age=3600"
+# Страницы всегда перепроверяются по ETag: после деплоя сразу новые ассеты
+REVALIDATE = "no-cache"
+
+# Уже сжатые форматы повторно не сжимаем
+INCOMPRESSIBLE = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".woff", ".woff2", ".gz"}
+
+
+class RangeNotSatisfiable(ValueError):
+    """The requested byte range starts past the end of the body."""
+
+
+@dataclass(slots=True)
+class Asset:
+    """A file or page held in memory with its precompressed variants."""
+
+    media_type: str
+    etag: str
+    # Content-Encoding -> тело; "identity" есть всегда
+    bodies: dict[str, bytes]
+
+
+def fingerprint(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=6).hexdigest()
+
+
+def compress(body: bytes) -> dict[str, bytes]:
+    """Identity body plus every encoding that actually makes it smaller."""
+    bodies = {"identity": body}
+    compressed = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(compressed) < len(body):
+        bodies["gzip"] = compressed
+    return bodies
+
+
+def accepted_encodings(request: Request) -> set[str]:
+    """Codings from Accept-Encoding that the client didn't refuse with q=0."""
+    accepted = set()
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.partition(";")
+        q = params.strip().removeprefix("q=")
+        try:
+            if params and float(q) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def byte_range(request: Request, etag: str, size: int) -> tuple[int, int] | None:
+    """Single `Range: bytes=` of the request as inclusive (start, end).
+
+    None means the whole body: no Range, several ranges, a malformed one or
+    an If-Range naming another version. Raises RangeNotSatisfiable if the
+    range starts past the end.
+    """
+    header = request.headers.get("range")
+    if not header or request.headers.get("if-range", etag) != etag:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+
+    if start is None:
+        # bytes=-N: последние N байт
+        if end is None:
+            return None
+        if end == 0:
+            raise RangeNotSatisfiable
+        return max(size - end, 0), size - 1
+    if end is not None and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+class AssetPipeline:
+    """Fingerprinted, precompressed static files and prerendered pages.
+
+    `build` reads every file under `static_dir` once, names it
+    `name.<hash>.ext` and keeps identity and gzip bodies in memory. Static
+    files answer HEAD and single byte ranges, as StaticFiles did. Templates
+    link assets through
+    `static_url()`, so a changed file gets a new URL and the old one can be
+    cached forever. Pages have no per-request data, so they are rendered at
+    build time too and served with an ETag; the workers never touch the
+    filesystem or Jinja while serving.
+    """
+
+    def __init__(
+        self,
+        static_dir: str,
+        templates_dir: str,
+        prefix: str,
+        page_globals: dict | None = None,
+    ):
+        self.static_dir = static_dir
+        self.templates_dir = templates_dir
+        self.prefix = prefix
+        # Значения конфигурации, которые страницы встраивают в свой JS
+        self.page_globals = page_globals or {}
+        # Имя файла -> адрес с отпечатком
+        self.manifest: dict[str, str] = {}
+        self._files: dict[str, Asset] = {}
+        self._fingerprinted: set[str] = set()
+        self._pages: dict[str, Asset] = {}
+
+    def static_url(self, name: str) -> str:
+        return self.manifest[name]
+
+    def build(self) -> None:
+        manifest, files, fingerprinted = {}, {}, set()
+        for root, _, filenames in os.walk(self.static_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    body = f.read()
+                stem, ext = os.path.splitext(name)
+                digest = fingerprint(body)
+                hashed_name = f"{stem}.{digest}{ext}"
+                asset = Asset(
+                    media_type=mimetypes.guess_type(name)[0]
+                    or "application/octet-stream",
+                    etag=f'"{digest}"',
+                    bodies=(
+                        {"identity": body}
+                        if ext.lower() in INCOMPRESSIBLE
+                        else compress(body)
+                    ),
+                )
+                files[name] = files[hashed_name] = asset
+                fingerprinted.add(hashed_name)
+                manifest[name] = f"{self.prefix}/{hashed_name}"
+
+        self.manifest, self._files, self._fingerprinted = manifest, files, fingerprinted
+
+        env = Environment(
+            loader=FileSystemLoader(self.templates_dir),
+            autoescape=select_autoescape(),
+        )
+        env.globals.update(self.page_globals)
+        env.globals["static_url"] = self.static_url
+        pages = {}
+        for path, template in PAGES.items():
+            body = env.get_template(template).render(page_path=path).encode()
+            pages[path] = Asset(
+                media_type="text/html; charset=utf-8",
+                etag=f'"{fingerprint(body)}"',
+                bodies=compress(body),
+            )
+        self._pages = pages
+        print(f"🎨 Ассеты собраны: {len(manifest)} файлов, {len(pages)} страниц")
+
+    def static_response(self, request: Request, name: str) -> Response:
+        asset = self._files.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        cache_control = IMMUTABLE if name in self._fingerprinted else SHORT_LIVED
+        return self._respond(request, asset, cache_control, ranges=True)
+
+    def page_response(self, request: Request, path: str) -> Response:
+        return self._respond(request, self._pages[path], REVALIDATE)
+
+    @staticmethod
+    def _respond(
+        request: Request, asset: Asset, cache_control: str, ranges: bool = False
+    ) -> Response:
+        headers = {
+            "ETag": asset.etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if ranges:
+            headers["Accept-Ranges"] = "bytes"
+        if etag_matches(request, asset.etag):
+            return Response(status_code=304, headers=headers)
+
+        status_code = 200
+        body = asset.bodies["identity"]
+        size = len(body)
+        try:
+            requested = byte_range(request, asset.etag, size) if ranges else None
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if requested is not None:
+            # Диапазон считаем по несжатому телу
+            start, end = requested
+            status_code = 206
+            body = body[start : end + 1]
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        elif "gzip" in asset.bodies and "gzip" in accepted_encodings(request):
+            body = asset.bodies["gzip"]
+            headers["Content-Encoding"] = "gzip"
+
+        if request.method == "HEAD":
+            # Starlette не перезаписывает переданный Content-Length
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(
+            body, status_code=status_code, media_type=asset.media_type, headers=headers
+        )
+
+    def export(self, out_dir: str) -> None:
+        """Write fingerprinted files with .gz siblings for a static server."""
+        for name in self._fingerprinted:
+            asset = self._files[name]
+            path = os.path.join(out_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            suffixes = {"identity": "", "gzip": ".gz"}
+            for encoding, body in asset.bodies.items():
+                with open(path + suffixes[encoding], "wb") as f:
+                    f.write(body)
+        print(f"📦 Ассеты выгружены в {out_dir}")
+
+
+# Глобальный экземпляр (собирается при старте приложения)
+assets = AssetPipeline(
+    STATIC_DIR,
+    TEMPLATES_DIR,
+    STATIC_PREFIX,
+    page_globals={"batch_stats_max_codes": settings.batch_stats_max_codes},
+)
+
+
+if __name__ == "__main__":
+    assets.build()
+    assets.export(sys.argv[1] if len(sys.argv) > 1 else "dist/static")
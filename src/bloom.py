@@ -0,0 +1,63 @@
+import hashlib
+import math
+from collections.abc import Iterable
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives)."""
+
+    def __init__(
+        self, capacity: int, error_rate: float = 0.01, bits: bytes | None = None
+    ):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        if bits is not None:
+            if len(bits) != len(self.bits):
+                raise ValueError("Bloom filter bits do not match its parameters")
+            self.bits[:] = bits
+
+    def _positions(self, key: str) -> list[int]:
+        # Двойное хеширование: k позиций из одного 128-битного дайджеста
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[str]) -> None:
+        """Add many keys; the same as add() in a loop, with fewer lookups."""
+        bits, size, hash_count = self.bits, self.size, self.hash_count
+        blake2b, from_bytes = hashlib.blake2b, int.from_bytes
+        added = 0
+        for key in keys:
+            digest = blake2b(key.encode(), digest_size=16).digest()
+            h1 = from_bytes(digest[:8], "little")
+            h2 = from_bytes(digest[8:], "little") | 1
+            for i in range(hash_count):
+                position = (h1 + i * h2) % size
+                bits[position >> 3] |= 1 << (position & 7)
+            added += 1
+        self.count += added
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Expected false positive rate for the current number of items."""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
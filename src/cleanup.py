@@ -0,0 +1,250 @@
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import Integer, any_, bindparam, delete, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.database import engine
+from src.invalidation import cache_invalidator
+from src.models import URL, Click
+from src.sharding import Shard, shard_router
+
+# Ключ advisory-lock: очистку одновременно ведет только один процесс
+CLEANUP_LOCK_ID = 0x56494245_434C4E  # "VIBE" "CLN"
+LOCK_NOT_AVAILABLE = "55P03"
+
+# Без pg_read_all_stats строки pg_stat_replication видны, но replay_lag в них
+# NULL - лаг читался бы как 0. Поэтому вместе с лагом проверяем само право.
+REPLICATION_LAG_SQL = text(
+    "SELECT pg_has_role('pg_read_all_stats', 'USAGE') AS visible, "
+    "coalesce(max(extract(epoch FROM replay_lag)), 0) AS lag "
+    "FROM pg_stat_replication"
+)
+
+
+@dataclass
+class CleanupMetrics:
+    """Progress of the expired links cleanup in this process."""
+
+    running: bool = False
+    runs: int = 0
+    links_deleted: int = 0
+    clicks_deleted: int = 0
+    batches: int = 0
+    lock_timeouts: int = 0
+    throttled_seconds: float = 0.0
+    replication_lag: float = 0.0
+    # False: роли приложения не хватает pg_read_all_stats, лаг не виден
+    replication_lag_visible: bool | None = None
+    last_run_at: datetime | None = None
+    last_run_seconds: float | None = None
+    last_error: str | None = None
+
+
+class ExpiredLinksCleaner:
+    """Deletes expired links and their clicks in small set-based batches.
+
+    Clicks go first, `click_batch_size` rows per transaction, so no statement
+    holds locks or generates WAL for long. Between batches the job sleeps and
+    waits while replicas lag behind. The links themselves are deleted last
+    (ON DELETE CASCADE catches clicks recorded in the meantime) and evicted
+    from every worker's caches. Reading the replicas' lag needs the
+    pg_read_all_stats role; without it the lag is not throttled on and
+    `replication_lag_visible` turns False.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        link_batch_size: int,
+        click_batch_size: int,
+        batch_pause: float,
+        max_replication_lag: float,
+        lock_timeout_ms: int,
+    ):
+        self.interval = interval
+        self.link_batch_size = link_batch_size
+        self.click_batch_size = click_batch_size
+        self.batch_pause = batch_pause
+        self.max_replication_lag = max_replication_lag
+        self.lock_timeout_ms = lock_timeout_ms
+        self.metrics = CleanupMetrics()
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> int:
+        """Delete all currently expired links; returns how many were deleted.
+
+        Returns 0 right away if another process holds the cleanup lock.
+        """
+        async with engine.connect() as lock_conn:
+            locked = await lock_conn.scalar(
+                select(func.pg_try_advisory_lock(CLEANUP_LOCK_ID))
+            )
+            await lock_conn.commit()
+            if not locked:
+                return 0
+
+            started = time.monotonic()
+            self.metrics.running = True
+            self.metrics.last_run_at = datetime.now(timezone.utc)
+            deleted = 0
+            try:
+                for shard in shard_router.shards:
+                    while url_ids := await self._expired_batch(shard):
+                        await self._delete_clicks(shard, url_ids)
+                        deleted += await self._delete_urls(shard, url_ids)
+                        await self._throttle(shard)
+                self.metrics.last_error = None
+            except Exception as e:
+                self.metrics.last_error = str(e)
+                raise
+            finally:
+                self.metrics.running = False
+                self.metrics.runs += 1
+                self.metrics.last_run_seconds = round(time.monotonic() - started, 3)
+                await lock_conn.execute(
+                    select(func.pg_advisory_unlock(CLEANUP_LOCK_ID))
+                )
+                await lock_conn.commit()
+            return deleted
+
+    async def _expired_batch(self, shard: Shard) -> list[int]:
+        async with shard.session() as db:
+            result = await db.execute(
+                select(URL.id)
+                .where(URL.expires_at <= func.now())
+                .order_by(URL.expires_at)
+                .limit(self.link_batch_size)
+            )
+            return list(result.scalars())
+
+    async def _delete_clicks(self, shard: Shard, url_ids: list[int]) -> None:
+        """Delete clicks of the links, click_batch_size rows per transaction."""
+        batch = (
+            select(Click.id)
+            .where(
+                Click.url_id
+                == any_(bindparam("url_ids", url_ids, type_=ARRAY(Integer)))
+            )
+            .limit(self.click_batch_size)
+        )
+        while True:
+            try:
+                async with shard.session() as db:
+                    await self._set_lock_timeout(db)
+                    result = await db.execute(delete(Click).where(Click.id.in_(batch)))
+                    await db.commit()
+            except DBAPIError as e:
+                if getattr(e.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                    raise
+                # Не ждем блокировку в очереди (за нами встали бы запросы)
+                self.metrics.lock_timeouts += 1
+                await asyncio.sleep(self.batch_pause * 10)
+                continue
+
+            self.metrics.batches += 1
+            self.metrics.clicks_deleted += result.rowcount
+            if result.rowcount < self.click_batch_size:
+                return
+            await self._throttle(shard)
+
+    async def _delete_urls(self, shard: Shard, url_ids: list[int]) -> int:
+        async with shard.session() as db:
+            await self._set_lock_timeout(db)
+            result = await db.execute(
+                delete(URL)
+                .where(
+                    URL.id
+                    == any_(bindparam("url_ids", url_ids, type_=ARRAY(Integer))),
+                    URL.expires_at <= func.now(),
+                )
+                .returning(URL.short_code)
+            )
+            short_codes = set(result.scalars())
+            await db.commit()
+        await cache_invalidator.publish_after_commit("url", short_codes)
+        self.metrics.links_deleted += len(short_codes)
+        return len(short_codes)
+
+    async def _set_lock_timeout(self, db: AsyncSession) -> None:
+        await db.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"))
+
+    async def _throttle(self, shard: Shard) -> None:
+        """Pause between batches and wait for the shard's replicas to catch up."""
+        await asyncio.sleep(self.batch_pause)
+        while True:
+            async with shard.session() as db:
+                visible, lag = (await db.execute(REPLICATION_LAG_SQL)).one()
+            if not visible and self.metrics.replication_lag_visible is not False:
+                print(
+                    f"⚠️ Очистка не видит лаг реплик {shard}: "
+                    "нужна роль pg_read_all_stats"
+                )
+            self.metrics.replication_lag_visible = visible
+            lag = float(lag)
+            self.metrics.replication_lag = lag
+            if lag <= self.max_replication_lag:
+                return
+            wait = min(lag, 5.0)
+            self.metrics.throttled_seconds += wait
+            await asyncio.sleep(wait)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                deleted = await self.run_once()
+                if deleted:
+                    print(
+                        f"🗑️ Удалено просроченных ссылок: {deleted} "
+                        f"(переходов: {self.metrics.clicks_deleted} всего)"
+                    )
+            except Exception as e:
+                print(f"❌ Ошибка очистки просроченных ссылок: {e}")
+
+    def stats(self) -> dict:
+        return asdict(self.metrics)
+
+
+# Глобальный экземпляр очистки
+expired_links_cleaner = ExpiredLinksCleaner(
+    interval=settings.cleanup_interval,
+    link_batch_size=settings.cleanup_link_batch_size,
+    click_batch_size=settings.cleanup_click_batch_size,
+    batch_pause=settings.cleanup_batch_pause,
+    max_replication_lag=settings.cleanup_max_replication_lag,
+    lock_timeout_ms=settings.cleanup_lock_timeout_ms,
+)
+
+
+async def _main() -> None:
+    try:
+        deleted = await expired_links_cleaner.run_once()
+        print(f"🗑️ Удалено просроченных ссылок: {deleted}")
+        for name, value in expired_links_cleaner.stats().items():
+            print(f"  {name}: {value}")
+    finally:
+        await shard_router.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,142 @@
+import asyncio
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select, text
+
+from src.config import settings
+from src.database import engine
+from src.sharding import Shard, shard_router
+
+# Ключ advisory-lock: досчет ведет только один процесс
+COUNTERS_LOCK_ID = 0x56494245_434E54  # "VIBE" "CNT"
+
+# Строки с sample_weight IS NULL записал код до появления счетчиков. Пачка
+# помечается весом 1 и добавляется в счетчики одним запросом, поэтому
+# прерванный досчет не учитывает строку дважды.
+CATCH_UP_SQL = text(
+    "WITH batch AS ("
+    "  UPDATE clicks SET sample_weight = 1 WHERE id IN ("
+    "    SELECT id FROM clicks WHERE sample_weight IS NULL AND id > :last_id"
+    "    ORDER BY id LIMIT :limit FOR UPDATE SKIP LOCKED)"
+    "  RETURNING id, url_id, is_bot, created_at"
+    "), counted AS ("
+    "  INSERT INTO url_click_counters AS c (url_id, total, bot_total, last_click)"
+    "  SELECT url_id, count(*), count(*) FILTER (WHERE is_bot), max(created_at)"
+    "  FROM batch GROUP BY url_id ORDER BY url_id"
+    "  ON CONFLICT (url_id) DO UPDATE SET total = c.total + excluded.total, "
+    "  bot_total = c.bot_total + excluded.bot_total, "
+    "  last_click = greatest(c.last_click, excluded.last_click)"
+    ") SELECT count(*) AS rows, max(id) AS last_id FROM batch"
+)
+
+
+@dataclass
+class CounterCatchUpMetrics:
+    """Progress of counting pre-counter clicks in this process."""
+
+    runs: int = 0
+    clicks_counted: int = 0
+    batches: int = 0
+    last_run_at: datetime | None = None
+    last_error: str | None = None
+
+
+class ClickCounterCatchUp:
+    """Adds clicks written before url_click_counters existed to the counters.
+
+    The counters migration leaves `sample_weight` NULL on old rows and on
+    rows written by old workers until the rollout finishes; the current
+    code always sets it. Every `interval` seconds one process walks the
+    NULL rows of each shard by click id (partial index ix_clicks_uncounted),
+    `batch_size` rows per transaction. Once the rollout is over the walk
+    finds nothing and costs a single index probe.
+    """
+
+    def __init__(self, interval: float, batch_size: int, batch_pause: float):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.metrics = CounterCatchUpMetrics()
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> int:
+        """Count all currently uncounted clicks; returns how many were counted.
+
+        Returns 0 right away if another process holds the lock.
+        """
+        async with engine.connect() as lock_conn:
+            locked = await lock_conn.scalar(
+                select(func.pg_try_advisory_lock(COUNTERS_LOCK_ID))
+            )
+            await lock_conn.commit()
+            if not locked:
+                return 0
+
+            self.metrics.last_run_at = datetime.now(timezone.utc)
+            counted = 0
+            try:
+                for shard in shard_router.shards:
+                    counted += await self._catch_up(shard)
+                self.metrics.last_error = None
+            except Exception as e:
+                self.metrics.last_error = str(e)
+                raise
+            finally:
+                self.metrics.runs += 1
+                await lock_conn.execute(
+                    select(func.pg_advisory_unlock(COUNTERS_LOCK_ID))
+                )
+                await lock_conn.commit()
+            return counted
+
+    async def _catch_up(self, shard: Shard) -> int:
+        counted, last_id = 0, 0
+        while True:
+            async with shard.session() as db:
+                result = await db.execute(
+                    CATCH_UP_SQL, {"last_id": last_id, "limit": self.batch_size}
+                )
+                rows, batch_last_id = result.one()
+                await db.commit()
+            if not rows:
+                return counted
+            counted += rows
+            last_id = batch_last_id
+            self.metrics.batches += 1
+            self.metrics.clicks_counted += rows
+            await asyncio.sleep(self.batch_pause)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                counted = await self.run_once()
+                if counted:
+                    print(f"🧮 Досчитано переходов до счетчиков: {counted}")
+            except Exception as e:
+                print(f"❌ Ошибка досчета счетчиков переходов: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return asdict(self.metrics)
+
+
+# Глобальный экземпляр досчета
+click_counter_catch_up = ClickCounterCatchUp(
+    interval=settings.counters_catch_up_interval,
+    batch_size=settings.counters_catch_up_batch_size,
+    batch_pause=settings.counters_catch_up_pause,
+)
@@ -0,0 +1,82 @@
+import math
+import random
+from dataclasses import dataclass
+from datetime import datetime
+
+from src.cache import LRUCache
+from src.config import settings
+
+
+@dataclass
+class LinkVelocity:
+    """Exponentially decayed click rate of one link."""
+
+    rate: float  # переходов в секунду
+    updated: float  # unix time последнего перехода
+
+
+class ClickSampler:
+    """Adaptive per-link sampling of raw click rows.
+
+    Exact totals are always counted (url_click_counters); this only decides
+    which clicks also get a full row in `clicks`. While a link's click rate
+    is below `threshold` clicks/s every click is stored. Above it each click
+    is kept with probability threshold / rate, so a viral link stores about
+    `threshold` rows per second however hot it gets. A kept row carries
+    sample_weight = 1 / probability, and weighted sums over the sample are
+    unbiased estimates of the full distributions.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        min_rate: float,
+        window: float,
+        max_links: int,
+    ):
+        self.threshold = threshold
+        self.min_rate = min_rate
+        self.window = window
+        self._links: LRUCache[int, LinkVelocity] = LRUCache(max_links)
+
+    def velocity(self, url_id: int, at: datetime) -> float:
+        """Register a click at `at` and return the link's current rate."""
+        timestamp = at.timestamp()
+        state = self._links.get(url_id)
+        if state is None:
+            state = LinkVelocity(rate=0.0, updated=timestamp)
+            self._links.set(url_id, state)
+        # Спул может отдать переходы не строго по порядку - не уходим в минус
+        elapsed = max(timestamp - state.updated, 0.0)
+        state.rate = state.rate * math.exp(-elapsed / self.window) + 1 / self.window
+        state.updated = max(state.updated, timestamp)
+        return state.rate
+
+    def sample(self, url_id: int, at: datetime) -> float | None:
+        """Weight of the click's raw row, or None if only the counter is kept."""
+        rate = self.velocity(url_id, at)
+        if rate <= self.threshold:
+            return 1.0
+        probability = max(self.threshold / rate, self.min_rate)
+        if random.random() >= probability:
+            return None
+        return 1 / probability
+
+    def stats(self) -> dict:
+        sampled = sum(
+            1 for state in self._links.values() if state.rate > self.threshold
+        )
+        return {
+            "tracked_links": len(self._links),
+            "sampled_links": sampled,
+            "threshold_per_second": self.threshold,
+        }
+
+
+# Глобальный экземпляр (скорость ссылок считается в каждом воркере отдельно)
+click_sampler = ClickSampler(
+    threshold=settings.click_sampling_threshold,
+    min_rate=settings.click_sampling_min_rate,
+    window=settings.click_sampling_window,
+    max_links=settings.click_sampling_max_links,
+)
@@ -0,0 +1,400 @@
+import asyncio
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+
+from pydantic import ValidationError
+from sqlalchemy import text
+
+from src.click_stream import click_stream
+from src.config import settings
+from src.schemas import ClickDTO, SpooledClick
+from src.services import create_clicks_bulk
+from src.sharding import Shard, shard_router
+
+# Заголовок записи: длина payload и его crc32
+HEADER = struct.Struct("<II")
+
+
+class SpoolLog:
+    """Append-only log of memory-mapped, fixed-size segment files.
+
+    Records are written payload-first and header-last, so a record becomes
+    visible only when complete; the crc32 rejects records torn by an OS crash.
+    `append` never blocks on disk: segments written since the last `flush`
+    are collected by `unflushed` and msynced by the caller off the event loop.
+    The read offset (segment, position) is persisted atomically in `offset`
+    after each replayed batch. Replay is at-least-once: a crash between the
+    database commit and the offset commit replays that batch again.
+    """
+
+    def __init__(self, directory: Path, segment_size: int):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._maps: dict[int, mmap.mmap] = {}
+        # Сегменты с записями, еще не сброшенными на диск через msync
+        self._unflushed: set[int] = set()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.read_offset = self._load_offset()
+        self.write_segment, self.write_position = self._recover()
+
+    @property
+    def has_pending(self) -> bool:
+        return self.read_offset != (self.write_segment, self.write_position)
+
+    def append(self, payload: bytes) -> None:
+        size = HEADER.size + len(payload)
+        if size > self.segment_size:
+            raise ValueError(f"Запись {size} байт больше сегмента")
+        if self.write_position + size > self.segment_size:
+            self.write_segment += 1
+            self.write_position = 0
+
+        segment = self._map(self.write_segment)
+        self._unflushed.add(self.write_segment)
+        start = self.write_position + HEADER.size
+        segment[start : start + len(payload)] = payload
+        HEADER.pack_into(
+            segment, self.write_position, len(payload), zlib.crc32(payload)
+        )
+        self.write_position += size
+
+    def read(self, max_records: int) -> tuple[list[bytes], tuple[int, int]]:
+        """Read up to max_records from the read offset; returns the next offset."""
+        segment_number, position = self.read_offset
+        records: list[bytes] = []
+        while len(records) < max_records:
+            if (segment_number, position) == (self.write_segment, self.write_position):
+                break
+            record = self._read_at(self._map(segment_number), position)
+            if record is None:
+                if segment_number < self.write_segment:
+                    segment_number, position = segment_number + 1, 0
+                    continue
+                break
+            payload, position = record
+            records.append(payload)
+        return records, (segment_number, position)
+
+    def commit(self, offset: tuple[int, int]) -> None:
+        """Persist the read offset and delete fully replayed segments."""
+        tmp_path = self.directory / "offset.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{offset[0]} {offset[1]}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.directory / "offset")
+        self._fsync_directory()
+        self.read_offset = offset
+
+        for segment_number in self._segment_numbers():
+            if segment_number < offset[0]:
+                segment = self._maps.pop(segment_number, None)
+                if segment is not None:
+                    segment.close()
+                self._path(segment_number).unlink(missing_ok=True)
+
+    def unflushed(self) -> list[mmap.mmap]:
+        """Segments written since the previous call, to be passed to `flush`."""
+        segments = [self._maps[n] for n in sorted(self._unflushed) if n in self._maps]
+        self._unflushed.clear()
+        return segments
+
+    def dead_letter(self, payloads: list[bytes]) -> None:
+        """Append records that can never be stored to `dead-letter.jsonl`."""
+        with open(self.directory / "dead-letter.jsonl", "ab") as f:
+            for payload in payloads:
+                f.write(payload + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def flush(segments: list[mmap.mmap]) -> None:
+        """msync segments; blocks on disk, so run it in a thread."""
+        for segment in segments:
+            segment.flush()
+
+    def close(self) -> None:
+        for segment in self._maps.values():
+            segment.flush()
+            segment.close()
+        self._maps.clear()
+
+    def _path(self, segment_number: int) -> Path:
+        return self.directory / f"{segment_number:010d}.seg"
+
+    def _segment_numbers(self) -> list[int]:
+        return sorted(int(path.stem) for path in self.directory.glob("*.seg"))
+
+    def _map(self, segment_number: int) -> mmap.mmap:
+        segment = self._maps.get(segment_number)
+        if segment is None:
+            fd = os.open(self._path(segment_number), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < self.segment_size:
+                    os.ftruncate(fd, self.segment_size)
+                segment = mmap.mmap(fd, self.segment_size)
+            finally:
+                os.close(fd)
+            self._maps[segment_number] = segment
+        return segment
+
+    def _read_at(self, segment: mmap.mmap, position: int) -> tuple[bytes, int] | None:
+        if position + HEADER.size > self.segment_size:
+            return None
+        length, crc = HEADER.unpack_from(segment, position)
+        end = position + HEADER.size + length
+        if length == 0 or end > self.segment_size:
+            return None
+        payload = segment[position + HEADER.size : end]
+        if zlib.crc32(payload) != crc:
+            return None
+        return payload, end
+
+    def _load_offset(self) -> tuple[int, int]:
+        try:
+            segment_number, position = (self.directory / "offset").read_text().split()
+            return int(segment_number), int(position)
+        except (FileNotFoundError, ValueError):
+            numbers = self._segment_numbers()
+            return (numbers[0] if numbers else 0), 0
+
+    def _recover(self) -> tuple[int, int]:
+        """Find the end of valid data in the last segment after a restart."""
+        numbers = self._segment_numbers()
+        last = max(numbers[-1] if numbers else 0, self.read_offset[0])
+        position = self.read_offset[1] if last == self.read_offset[0] else 0
+        segment = self._map(last)
+        while (record := self._read_at(segment, position)) is not None:
+            position = record[1]
+        # Затираем хвост оборванной записи, чтобы его не приняли за данные
+        segment[position:] = bytes(self.segment_size - position)
+        return last, position
+
+    def _fsync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class ClickSpool:
+    """Durable local buffer between redirects and the clicks table.
+
+    Redirects append clicks to this worker's spool log without waiting for
+    the database; a background replayer drains it in large batches and backs
+    off while the database is unavailable. A batch that fails `max_attempts`
+    times while every shard answers is stored click by click, and clicks that
+    still fail go to the slot's dead-letter file instead of blocking the log.
+    Each worker locks its own slot directory; slots left by stopped workers
+    are drained by whoever can lock them.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int,
+        batch_size: int,
+        replay_interval: float,
+        max_attempts: int = 5,
+        max_slots: int = 256,
+    ):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.batch_size = batch_size
+        self.replay_interval = replay_interval
+        self.max_attempts = max_attempts
+        self.max_slots = max_slots
+        # Неудачные попытки выгрузить пачку с текущей позиции лога (по слотам)
+        self._failures: dict[Path, tuple[tuple[int, int], int]] = {}
+        self._log: SpoolLog | None = None
+        self._lock_fd: int | None = None
+        self._task: asyncio.Task | None = None
+
+    def append(self, click: SpooledClick) -> None:
+        if self._log is None:
+            raise RuntimeError("Спул переходов не открыт")
+        self._log.append(click.model_dump_json().encode())
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._open()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._log is not None:
+            # Последняя попытка выгрузить хвост; не получилось - доедет после рестарта
+            try:
+                await asyncio.wait_for(self._drain(self._log), timeout=5)
+            except Exception as e:
+                print(f"❌ Спул не выгружен при остановке: {e}")
+            # Новые переходы уже не попадут в лог: append увидит закрытый спул
+            log, self._log = self._log, None
+            await asyncio.to_thread(log.close)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _open(self) -> None:
+        for slot in range(self.max_slots):
+            slot_directory = self.directory / f"slot-{slot}"
+            lock_fd = self._try_lock(slot_directory)
+            if lock_fd is not None:
+                self._lock_fd = lock_fd
+                self._log = SpoolLog(slot_directory, self.segment_size)
+                print(f"💾 Спул переходов: {slot_directory}")
+                return
+        raise RuntimeError("Нет свободного слота для спула переходов")
+
+    @staticmethod
+    def _try_lock(slot_directory: Path) -> int | None:
+        slot_directory.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(slot_directory / "lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(lock_fd)
+            return None
+        return lock_fd
+
+    async def _run(self) -> None:
+        delay = self.replay_interval
+        cycles = 0
+        while True:
+            try:
+                replayed = await self._replay(self._log)
+                if cycles % 120 == 0:
+                    await self._drain_orphans()
+                cycles += 1
+                delay = self.replay_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # БД недоступна - переходы копятся в спуле, пробуем реже
+                print(f"❌ Ошибка выгрузки спула: {e}")
+                replayed = 0
+                delay = min(delay * 2, 30.0)
+            if replayed < self.batch_size:
+                # msync в потоке: сброс страниц на диск не держит цикл событий
+                await asyncio.to_thread(SpoolLog.flush, self._log.unflushed())
+                await asyncio.sleep(delay)
+
+    async def _replay(self, log: SpoolLog) -> int:
+        """Move one batch from the log into the database."""
+        records, offset = log.read(self.batch_size)
+        if not records:
+            return 0
+
+        batch = f"{log.directory} {log.read_offset}..{offset}"
+        clicks: list[tuple[bytes, SpooledClick]] = []
+        rejected: list[bytes] = []
+        for record in records:
+            try:
+                clicks.append((record, SpooledClick.model_validate_json(record)))
+            except ValidationError as e:
+                print(f"❌ Поврежденная запись спула ({batch}) в dead-letter: {e}")
+                rejected.append(record)
+
+        if clicks:
+            try:
+                click_dtos = await create_clicks_bulk([click for _, click in clicks])
+            except Exception:
+                if not await self._is_poison(log):
+                    raise
+                print(f"☠️ Пачка спула {batch} не записывается, пишем по одному")
+                click_dtos = await self._store_one_by_one(clicks, rejected, batch)
+            short_codes = {click.url_id: click.short_code for _, click in clicks}
+            for click_dto in click_dtos:
+                click_stream.record(short_codes[click_dto.url_id], click_dto)
+
+        if rejected:
+            await asyncio.to_thread(log.dead_letter, rejected)
+        await asyncio.to_thread(log.commit, offset)
+        self._failures.pop(log.directory, None)
+        return len(records)
+
+    async def _is_poison(self, log: SpoolLog) -> bool:
+        """Count a failure at the read offset; True once the batch, not the DB, fails."""
+        offset, failures = self._failures.get(log.directory, (log.read_offset, 0))
+        if offset != log.read_offset:
+            failures = 0
+        failures += 1
+        self._failures[log.directory] = (log.read_offset, failures)
+        # Пока БД недоступна, пачку не трогаем, сколько бы попыток ни было
+        return failures >= self.max_attempts and await _databases_available()
+
+    async def _store_one_by_one(
+        self,
+        clicks: list[tuple[bytes, SpooledClick]],
+        rejected: list[bytes],
+        batch: str,
+    ) -> list[ClickDTO]:
+        click_dtos: list[ClickDTO] = []
+        for index, (record, click) in enumerate(clicks):
+            try:
+                click_dtos.extend(await create_clicks_bulk([click]))
+            except Exception as e:
+                if not await _databases_available():
+                    raise
+                print(f"❌ Запись {index} пачки спула {batch} в dead-letter: {e}")
+                rejected.append(record)
+        return click_dtos
+
+    async def _drain(self, log: SpoolLog) -> None:
+        while log.has_pending and await self._replay(log):
+            pass
+
+    async def _drain_orphans(self) -> None:
+        """Replay spools of workers that are no longer running."""
+        own = self._log.directory if self._log else None
+        for slot_directory in sorted(self.directory.glob("slot-*")):
+            if slot_directory == own:
+                continue
+            lock_fd = self._try_lock(slot_directory)
+            if lock_fd is None:
+                continue
+            try:
+                log = SpoolLog(slot_directory, self.segment_size)
+                try:
+                    if log.has_pending:
+                        print(f"💾 Выгружаем спул остановленного воркера: {slot_directory}")
+                        await self._drain(log)
+                finally:
+                    await asyncio.to_thread(log.close)
+            finally:
+                os.close(lock_fd)
+
+
+async def _databases_available() -> bool:
+    """Whether every shard answers a trivial query right now."""
+
+    async def ping(shard: Shard) -> None:
+        async with shard.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    try:
+        await shard_router.gather(ping)
+    except Exception:
+        return False
+    return True
+
+
+# Глобальный экземпляр спула
+click_spool = ClickSpool(
+    directory=settings.click_spool_dir,
+    segment_size=settings.click_spool_segment_size,
+    batch_size=settings.click_spool_batch_size,
+    replay_interval=settings.click_spool_replay_interval,
+    max_attempts=settings.click_spool_max_attempts,
+)
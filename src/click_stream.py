@@ -0,0 +1,294 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from itertools import batched
+
+from src.database import AsyncSessionLocal
+from src.notifications import MAX_PAYLOAD_BYTES, NotificationBus, notification_bus
+from src.schemas import ClickDTO
+from src.user_agents import BROWSER_LABELS, DEVICE_LABELS, BrowserFamily, DeviceType
+
+CLICKS_CHANNEL = "vibe_clicks"
+# Объявления воркеров: по каким ссылкам у них есть SSE-подписчики
+WATCH_CHANNEL = "vibe_click_watch"
+# id ссылок в одном объявлении (до ~11 байт на id в JSON)
+WATCH_CHUNK_SIZE = 500
+
+
+@dataclass
+class PendingClicks:
+    """Clicks for one link recorded locally since the last publish."""
+
+    short_code: str
+    count: int = 0
+    bots: int = 0
+    events: list[dict] = field(default_factory=list)
+
+
+class ClickStream:
+    """Live click feed for links, shared across workers via LISTEN/NOTIFY.
+
+    Every worker batches its own clicks. Links watched by an SSE subscriber
+    on any worker are published with their events every `publish_interval`.
+    All other links are published only as counts every `count_interval`,
+    for watermarks and trending. Workers announce the links they watch on
+    WATCH_CHANNEL and renew them every `watch_interval`. A lease not renewed
+    within three intervals expires. A worker with a new LISTEN connection
+    has missed announcements, so it asks everyone to announce again.
+
+    Every worker receives all batches and, for links that have local
+    subscribers, serializes the message once and fans it out to all
+    subscriber queues of that link.
+    """
+
+    def __init__(
+        self,
+        bus: NotificationBus,
+        publish_interval: float = 1.0,
+        count_interval: float = 5.0,
+        watch_interval: float = 10.0,
+        max_events: int = 20,
+        queue_size: int = 100,
+        max_watermarks: int = 100_000,
+    ):
+        self.bus = bus
+        self.publish_interval = publish_interval
+        self.count_interval = count_interval
+        self.watch_interval = watch_interval
+        self.max_events = max_events
+        self.queue_size = queue_size
+        self.max_watermarks = max_watermarks
+        self._watermarks: dict[str, int] = {}
+        self._generation = 0
+        self._pending: dict[int, PendingClicks] = {}
+        self._topics: dict[int, set[asyncio.Queue[str]]] = {}
+        # url_id -> срок аренды (monotonic): ссылку смотрят на каком-то воркере
+        self._watched: dict[int, float] = {}
+        self._listening_since: float | None = None
+        self._announced_at = 0.0
+        self._counted_at = 0.0
+        self._listeners: list[Callable[[int, str, int, int], None]] = []
+        self._task: asyncio.Task | None = None
+
+        bus.subscribe(CLICKS_CHANNEL, self._on_notify)
+        bus.subscribe(WATCH_CHANNEL, self._on_watch)
+        bus.on_reconnect(self.reset_watermarks)
+
+    def watermark(self, short_code: str) -> tuple[int, int]:
+        """Version of a link's click data as seen by this worker.
+
+        Changes whenever new clicks for the link arrive from any worker, and
+        for all links at once when watermarks had to be dropped.
+        """
+        return self._generation, self._watermarks.get(short_code, 0)
+
+    def reset_watermarks(self) -> None:
+        self._watermarks.clear()
+        self._generation += 1
+
+    def on_clicks(self, listener: Callable[[int, str, int, int], None]) -> None:
+        """Call listener(url_id, short_code, count, bots) for batches of all workers.
+
+        `bots` is how many of the `count` clicks came from bots and link previews.
+        """
+        self._listeners.append(listener)
+
+    def record(self, short_code: str, click: ClickDTO) -> None:
+        """Register a click ingested by this worker."""
+        pending = self._pending.get(click.url_id)
+        if pending is None:
+            pending = self._pending[click.url_id] = PendingClicks(short_code)
+        pending.count += 1
+        pending.bots += click.is_bot
+        if len(pending.events) < self.max_events:
+            pending.events.append(
+                {
+                    "at": click.created_at.isoformat(),
+                    "browser": BROWSER_LABELS[BrowserFamily(click.ua_family)],
+                    "device": DEVICE_LABELS[DeviceType(click.ua_device)],
+                    "bot": click.is_bot,
+                }
+            )
+
+    @asynccontextmanager
+    async def subscribe(self, url_id: int) -> AsyncIterator[asyncio.Queue[str]]:
+        """Subscribe to a link; the queue receives ready-to-send SSE messages.
+
+        The first subscriber of a link on this worker announces it, so other
+        workers start sending its events. Until they do, the queue still
+        gets the link's click counts.
+        """
+        queue: asyncio.Queue[str] = asyncio.Queue(self.queue_size)
+        first = url_id not in self._topics
+        self._topics.setdefault(url_id, set()).add(queue)
+        if first:
+            self._watch([url_id])
+            try:
+                await self._announce([url_id])
+            except Exception as e:
+                print(f"❌ Ошибка объявления подписки на переходы: {e}")
+        try:
+            yield queue
+        finally:
+            subscribers = self._topics.get(url_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._topics[url_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._topics.values())
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"❌ Ошибка публикации переходов: {e}")
+
+    async def _tick(self) -> None:
+        now = time.monotonic()
+        listening_since = self.bus.listening_since
+        if listening_since != self._listening_since:
+            self._listening_since = listening_since
+            if listening_since is not None:
+                # Новое соединение LISTEN: объявления других воркеров пропущены
+                self._announced_at = now
+                await self._announce(list(self._topics), hello=True)
+        elif self._topics and now - self._announced_at >= self.watch_interval:
+            self._announced_at = now
+            await self._announce(list(self._topics))
+
+        counts = now - self._counted_at >= self.count_interval
+        if counts:
+            self._counted_at = now
+            self._watched = {
+                url_id: expires
+                for url_id, expires in self._watched.items()
+                if expires > now
+            }
+        await self.publish(counts=counts)
+
+    async def _announce(self, url_ids: list[int], hello: bool = False) -> None:
+        """Tell all workers which links have subscribers here."""
+        messages = [
+            {"watch": list(chunk)} for chunk in batched(url_ids, WATCH_CHUNK_SIZE)
+        ]
+        if hello:
+            if not messages:
+                messages.append({"watch": []})
+            messages[0]["hello"] = True
+        if not messages:
+            return
+        async with AsyncSessionLocal() as db:
+            for message in messages:
+                await self.bus.publish(
+                    db, WATCH_CHANNEL, json.dumps(message, separators=(",", ":"))
+                )
+            await db.commit()
+
+    def _watch(self, url_ids: list[int]) -> None:
+        expires = time.monotonic() + 3 * self.watch_interval
+        for url_id in url_ids:
+            self._watched[url_id] = expires
+
+    def _on_watch(self, payload: str) -> None:
+        message = json.loads(payload)
+        self._watch(message["watch"])
+        if message.get("hello") and self._topics:
+            asyncio.get_running_loop().create_task(self._reannounce())
+
+    async def _reannounce(self) -> None:
+        self._announced_at = time.monotonic()
+        try:
+            await self._announce(list(self._topics))
+        except Exception as e:
+            print(f"❌ Ошибка объявления подписок на переходы: {e}")
+
+    def is_watched(self, url_id: int) -> bool:
+        return url_id in self._topics or self._watched.get(url_id, 0) > time.monotonic()
+
+    async def publish(self, counts: bool = True) -> None:
+        """Publish locally recorded clicks in as few notifications as possible.
+
+        Watched links go out with their events. The rest wait for a publish
+        with `counts` and go out as bare counts.
+        """
+        if counts:
+            pending, self._pending = self._pending, {}
+        else:
+            pending = {
+                url_id: self._pending.pop(url_id)
+                for url_id in list(self._pending)
+                if self.is_watched(url_id)
+            }
+        if not pending:
+            return
+
+        payloads: list[str] = []
+        chunk: dict[str, dict] = {}
+        size = 0
+        for url_id, clicks in pending.items():
+            item = {"code": clicks.short_code, "count": clicks.count}
+            if clicks.bots:
+                item["bots"] = clicks.bots
+            if self.is_watched(url_id):
+                item["events"] = clicks.events
+            item_size = len(json.dumps(item, ensure_ascii=False).encode()) + 16
+            if chunk and size + item_size > MAX_PAYLOAD_BYTES:
+                payloads.append(json.dumps(chunk, ensure_ascii=False))
+                chunk, size = {}, 0
+            chunk[str(url_id)] = item
+            size += item_size
+        payloads.append(json.dumps(chunk, ensure_ascii=False))
+
+        async with AsyncSessionLocal() as db:
+            for payload in payloads:
+                await self.bus.publish(db, CLICKS_CHANNEL, payload)
+            await db.commit()
+
+    def _on_notify(self, payload: str) -> None:
+        batch = json.loads(payload)
+        if len(self._watermarks) + len(batch) > self.max_watermarks:
+            self.reset_watermarks()
+        for url_id, item in batch.items():
+            short_code = item["code"]
+            self._watermarks[short_code] = self._watermarks.get(short_code, 0) + 1
+            for listener in self._listeners:
+                listener(int(url_id), short_code, item["count"], item.get("bots", 0))
+
+            subscribers = self._topics.get(int(url_id))
+            if not subscribers:
+                continue
+            # Одно сообщение на ссылку, независимо от числа подписчиков
+            data = json.dumps(
+                {"new_clicks": item["count"], "events": item.get("events", [])},
+                ensure_ascii=False,
+            )
+            message = f"event: clicks\ndata: {data}\n\n"
+            for queue in subscribers:
+                if queue.full():
+                    # Медленный клиент: пропускаем самое старое сообщение
+                    queue.get_nowait()
+                queue.put_nowait(message)
+
+
+# Глобальный экземпляр потока переходов
+click_stream = ClickStream(notification_bus)
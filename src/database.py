@@ -1,17 +1,48 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
 
 from src.config import settings
 
-# Create async database engine
-engine = create_async_engine(
-    settings.database_url.replace("postgresql://", "postgresql+asyncpg://"),
-    pool_pre_ping=True,
-    pool_recycle=300,
-    pool_size=10,
-    max_overflow=20,
-    echo=True,  # Set to True for debugging
-)
+
+def get_pool_limits() -> tuple[int, int]:
+    """
+    Split the global connection budget between worker processes.
+
+    Returns (pool_size, max_overflow) so that
+    workers * (pool_size + max_overflow + 1) <= db_max_connections,
+    where the extra connection is the worker's LISTEN connection.
+    """
+    per_worker = max(1, settings.db_max_connections // settings.workers - 1)
+    pool_size = max(1, per_worker // 2)
+    max_overflow = per_worker - pool_size
+    return pool_size, max_overflow
+
+
+pool_size, max_overflow = get_pool_limits()
+
+
+def create_engine_for(database_url: str) -> AsyncEngine:
+    """Async engine with this worker's share of a server's connection budget."""
+    return create_async_engine(
+        database_url.replace("postgresql://", "postgresql+asyncpg://"),
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        echo=settings.debug,
+    )
+
+
+# Create async database engine (основная БД: общие таблицы, LISTEN/NOTIFY, шард 0)
+engine = create_engine_for(settings.database_url)
 
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -24,3 +55,13 @@ async def get_db() -> AsyncSession:
     """Get async database session."""
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def warm_up_pool(db_engine: AsyncEngine = engine) -> None:
+    """Eagerly open pool_size connections so first requests don't pay for connect."""
+
+    async def _ping() -> None:
+        async with db_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(_ping() for _ in range(pool_size)))
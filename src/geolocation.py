@@ -1,144 +1,353 @@
 import asyncio
+import ipaddress
+import time
+from abc import ABC, abstractmethod
+from typing import Any
+
 import httpx
-from typing import Optional, Dict, Any
+
 from src.config import settings
 
+Location = dict[str, Any]
+
+UNKNOWN_LOCATION: Location = {
+    "country": "Неизвестно",
+    "region": "Неизвестно",
+    "city": "Неизвестно",
+    "latitude": None,
+    "longitude": None,
+}
+
+LOCAL_LOCATION: Location = {
+    "country": "Россия",
+    "region": "Локальная сеть",
+    "city": "Локальная сеть",
+    "latitude": None,
+    "longitude": None,
+}
+
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated failures, retries after a pause.
+
+    After `reset_timeout` the breaker is half-open: `acquire` lets exactly one
+    probe through, and everyone else keeps skipping the provider until the
+    probe reports. Success closes the breaker, failure opens it for another
+    pause.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def available(self) -> bool:
+        if self.opened_at is None:
+            return True
+        # Half-open: после паузы пропускаем один пробный запрос
+        return (
+            not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout
+        )
+
+    def acquire(self) -> bool:
+        """Reserve a call; while half-open only the single probe gets True."""
+        if self.opened_at is None:
+            return True
+        if not self.available:
+            return False
+        self.probing = True
+        return True
+
+    def release(self) -> None:
+        """The call ended without a verdict (cancelled): free the probe slot."""
+        self.probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class GeolocationProvider(ABC):
+    """Base HTTP geolocation provider with latency tracking and a breaker."""
+
+    name = "provider"
+    batch_size = 1
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker()
+        self.latency = 0.0  # EWMA, секунды
+
+    def record_latency(self, elapsed: float) -> None:
+        if self.latency == 0:
+            self.latency = elapsed
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * elapsed
+
+    @abstractmethod
+    async def lookup(self, client: httpx.AsyncClient, ip: str) -> Location | None:
+        """Location of one IP, None if the provider doesn't know it."""
+
+    async def lookup_batch(
+        self, client: httpx.AsyncClient, ips: list[str]
+    ) -> dict[str, Location]:
+        """Locations of many IPs; providers with batch_size > 1 override this."""
+        locations = await asyncio.gather(*(self.lookup(client, ip) for ip in ips))
+        return {ip: location for ip, location in zip(ips, locations) if location}
+
+
+class IpApiComProvider(GeolocationProvider):
+    """ip-api.com: supports batch lookups of up to 100 IPs per request."""
+
+    name = "ip-api.com"
+    batch_size = 100
+
+    @staticmethod
+    def _parse(data: dict) -> Location | None:
+        if data.get("status") != "success":
+            return None
+        return {
+            "country": data.get("country", "Неизвестно"),
+            "region": data.get("regionName", "Неизвестно"),
+            "city": data.get("city", "Неизвестно"),
+            "latitude": data.get("lat"),
+            "longitude": data.get("lon"),
+        }
+
+    async def lookup(self, client: httpx.AsyncClient, ip: str) -> Location | None:
+        response = await client.get(f"{self.base_url}/json/{ip}")
+        response.raise_for_status()
+        return self._parse(response.json())
+
+    async def lookup_batch(
+        self, client: httpx.AsyncClient, ips: list[str]
+    ) -> dict[str, Location]:
+        response = await client.post(
+            f"{self.base_url}/batch", json=[{"query": ip} for ip in ips]
+        )
+        response.raise_for_status()
+        results = {}
+        for data in response.json():
+            location = self._parse(data)
+            if location:
+                results[data["query"]] = location
+        return results
+
+
+class IpapiCoProvider(GeolocationProvider):
+    """ipapi.co."""
+
+    name = "ipapi.co"
+
+    async def lookup(self, client: httpx.AsyncClient, ip: str) -> Location | None:
+        response = await client.get(f"{self.base_url}/{ip}/json/")
+        response.raise_for_status()
+        data = response.json()
+        if data.get("error"):
+            return None
+        return {
+            "country": data.get("country_name", "Неизвестно"),
+            "region": data.get("region", "Неизвестно"),
+            "city": data.get("city", "Неизвестно"),
+            "latitude": data.get("latitude"),
+            "longitude": data.get("longitude"),
+        }
+
+
+class IpinfoIoProvider(GeolocationProvider):
+    """ipinfo.io."""
+
+    name = "ipinfo.io"
+
+    async def lookup(self, client: httpx.AsyncClient, ip: str) -> Location | None:
+        response = await client.get(f"{self.base_url}/{ip}/json")
+        response.raise_for_status()
+        data = response.json()
+        if data.get("bogon"):
+            return None
+        latitude, longitude = None, None
+        if data.get("loc"):
+            latitude, longitude = (float(part) for part in data["loc"].split(","))
+        return {
+            "country": data.get("country", "Неизвестно"),
+            "region": data.get("region", "Неизвестно"),
+            "city": data.get("city", "Неизвестно"),
+            "latitude": latitude,
+            "longitude": longitude,
+        }
+
 
 class GeolocationService:
-    """Service for IP geolocation using multiple APIs."""
+    """Service for IP geolocation using multiple APIs.
 
-    def __init__(self):
-        self.client = httpx.AsyncClient(timeout=10.0)
-        self.cache: Dict[str, Dict[str, Any]] = {}
+    Providers are tried fastest-first (by observed latency), skipping those
+    with an open circuit breaker. If the current provider hasn't answered
+    within `hedge_delay`, the next one is started in parallel and the first
+    successful answer wins.
+    """
 
-    async def get_location(self, ip_address: str) -> Optional[Dict[str, Any]]:
+    def __init__(
+        self,
+        providers: list[GeolocationProvider],
+        timeout: float = 3.0,
+        hedge_delay: float = 0.5,
+        max_connections: int = 20,
+        max_concurrency: int = 10,
+    ):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.max_concurrency = max_concurrency
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self.cache: dict[str, Location] = {}
+
+    async def get_location(self, ip_address: str) -> Location:
         """Get location information for an IP address."""
-        print(f"🔍 Получаем геолокацию для IP: {ip_address}")
-        
         # Пропускаем локальные IP
         if self._is_local_ip(ip_address):
-            print(f"📍 IP {ip_address} - локальная сеть")
-            return {
-                "country": "Россия",
-                "region": "Локальная сеть",
-                "city": "Локальная сеть",
-                "latitude": None,
-                "longitude": None,
-            }
+            return LOCAL_LOCATION
 
         # Проверяем кэш
         if ip_address in self.cache:
             return self.cache[ip_address]
 
-        # Пробуем разные API в порядке приоритета
-        apis = [self._try_ipapi_co, self._try_ipinfo_io, self._try_ip_api_com]
-
-        for api_func in apis:
-            try:
-                result = await api_func(ip_address)
-                if result:
-                    print(f"✅ Успешно получена геолокация через {api_func.__name__}: {result}")
-                    self.cache[ip_address] = result
-                    return result
-            except Exception as e:
-                print(f"❌ Ошибка API {api_func.__name__}: {e}")
-                continue
-
-        # Если все API не сработали, возвращаем дефолтные данные
-        default_result = {
-            "country": "Неизвестно",
-            "region": "Неизвестно",
-            "city": "Неизвестно",
-            "latitude": None,
-            "longitude": None,
-        }
-        self.cache[ip_address] = default_result
-        return default_result
+        result = await self._hedged_lookup(ip_address)
+        if result is None:
+            # Не кэшируем: провайдеры могли быть временно недоступны
+            return UNKNOWN_LOCATION
 
-    def _is_local_ip(self, ip: str) -> bool:
-        """Check if IP is local."""
-        local_prefixes = [
-            "127.",
-            "192.168.",
-            "10.",
-            "172.16.",
-            "172.17.",
-            "172.18.",
-            "172.19.",
-            "172.20.",
-            "172.21.",
-            "172.22.",
-            "172.23.",
-            "172.24.",
-            "172.25.",
-            "172.26.",
-            "172.27.",
-            "172.28.",
-            "172.29.",
-            "172.30.",
-            "172.31.",
-        ]
-        return any(ip.startswith(prefix) for prefix in local_prefixes)
-
-    async def _try_ipapi_co(self, ip: str) -> Optional[Dict[str, Any]]:
-        """Try ipapi.co API."""
+        self.cache[ip_address] = result
+        return result
+
+    async def get_locations(self, ip_addresses: list[str]) -> dict[str, Location]:
+        """Resolve many IPs: batch provider first, then bounded parallel lookups."""
+        results: dict[str, Location] = {}
+        missing: list[str] = []
+        for ip in dict.fromkeys(ip_addresses):
+            if self._is_local_ip(ip):
+                results[ip] = LOCAL_LOCATION
+            elif ip in self.cache:
+                results[ip] = self.cache[ip]
+            else:
+                missing.append(ip)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        batch_provider = next(
+            (
+                provider
+                for provider in self._ordered_providers()
+                if provider.batch_size > 1
+            ),
+            None,
+        )
+        if batch_provider and missing:
+            chunks = [
+                missing[i : i + batch_provider.batch_size]
+                for i in range(0, len(missing), batch_provider.batch_size)
+            ]
+
+            async def _batch(chunk: list[str]) -> dict[str, Location]:
+                async with semaphore:
+                    resolved = await self._call(
+                        batch_provider.lookup_batch, batch_provider, chunk
+                    )
+                    return resolved or {}
+
+            batches = await asyncio.gather(*(_batch(chunk) for chunk in chunks))
+            for resolved in batches:
+                self.cache.update(resolved)
+                results.update(resolved)
+            missing = [ip for ip in missing if ip not in results]
+
+        async def _single(ip: str) -> None:
+            async with semaphore:
+                results[ip] = await self.get_location(ip)
+
+        await asyncio.gather(*(_single(ip) for ip in missing))
+        return results
+
+    def _ordered_providers(self) -> list[GeolocationProvider]:
+        available = [p for p in self.providers if p.breaker.available]
+        return sorted(available, key=lambda provider: provider.latency)
+
+    async def _call(self, method, provider: GeolocationProvider, argument):
+        """Call a provider method, feeding its breaker and latency stats."""
+        if not provider.breaker.acquire():
+            return None  # пробный запрос уже идет
+        started = time.monotonic()
         try:
-            url = f"http://ip-api.com/json/{ip}"
-            response = await self.client.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "success":
-                    return {
-                        "country": data.get("country", "Неизвестно"),
-                        "region": data.get("regionName", "Неизвестно"),
-                        "city": data.get("city", "Неизвестно"),
-                        "latitude": data.get("lat"),
-                        "longitude": data.get("lon"),
-                    }
+            result = await method(self.client, argument)
+        except asyncio.CancelledError:
+            # Хеджирование отменило вызов: ответа нет ни в какую сторону
+            provider.breaker.release()
+            raise
         except Exception as e:
-            print(f"Ошибка ipapi.co: {e}")
-        return None
+            print(f"❌ Ошибка API {provider.name}: {e}")
+            provider.breaker.record_failure()
+            if not provider.breaker.available:
+                pause = provider.breaker.reset_timeout
+                print(f"⛔ {provider.name} отключен на {pause:.0f}с")
+            return None
+        provider.breaker.record_success()
+        provider.record_latency(time.monotonic() - started)
+        return result
+
+    async def _hedged_lookup(self, ip: str) -> Location | None:
+        remaining = iter(self._ordered_providers())
+        pending: set[asyncio.Task] = set()
 
-    async def _try_ipinfo_io(self, ip: str) -> Optional[Dict[str, Any]]:
-        """Try ipinfo.io API."""
+        def launch_next() -> None:
+            provider = next(remaining, None)
+            if provider is not None:
+                pending.add(
+                    asyncio.create_task(self._call(provider.lookup, provider, ip))
+                )
+
+        launch_next()
         try:
-            url = f"https://ipinfo.io/{ip}/json"
-            response = await self.client.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "country": data.get("country", "Неизвестно"),
-                    "region": data.get("region", "Неизвестно"),
-                    "city": data.get("city", "Неизвестно"),
-                    "latitude": data.get("loc", "").split(",")[0]
-                    if data.get("loc")
-                    else None,
-                    "longitude": data.get("loc", "").split(",")[1]
-                    if data.get("loc")
-                    else None,
-                }
-        except Exception as e:
-            print(f"Ошибка ipinfo.io: {e}")
-        return None
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # Хеджирование: провайдер медлит - параллельно пробуем следующий
+                    launch_next()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    if task.result():
+                        return task.result()
+                    launch_next()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
 
-    async def _try_ip_api_com(self, ip: str) -> Optional[Dict[str, Any]]:
-        """Try ip-api.com API."""
+    def _is_local_ip(self, ip: str) -> bool:
+        """Check if IP is local."""
         try:
-            url = f"http://ip-api.com/json/{ip}"
-            response = await self.client.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "success":
-                    return {
-                        "country": data.get("country", "Неизвестно"),
-                        "region": data.get("regionName", "Неизвестно"),
-                        "city": data.get("city", "Неизвестно"),
-                        "latitude": data.get("lat"),
-                        "longitude": data.get("lon"),
-                    }
-        except Exception as e:
-            print(f"Ошибка ip-api.com: {e}")
-        return None
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return address.is_private or address.is_loopback or address.is_link_local
 
     async def close(self):
         """Close the HTTP client."""
@@ -146,4 +355,14 @@ class GeolocationService:
 
 
 # Глобальный экземпляр сервиса
-geolocation_service = GeolocationService()
+geolocation_service = GeolocationService(
+    providers=[
+        IpApiComProvider(settings.geo_ip_api_com_url),
+        IpapiCoProvider(settings.geo_ipapi_co_url),
+        IpinfoIoProvider(settings.geo_ipinfo_io_url),
+    ],
+    timeout=settings.geo_timeout,
+    hedge_delay=settings.geo_hedge_delay,
+    max_connections=settings.geo_max_connections,
+    max_concurrency=settings.geo_max_concurrency,
+)
@@ -0,0 +1,101 @@
+import hashlib
+import uuid
+from collections.abc import Iterable
+from itertools import batched
+
+from sqlalchemy import any_, bindparam, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from src.cache import LRUCache
+from src.models import Referer, UserAgent
+from src.sharding import Shard
+
+# Значений в одном INSERT: 2 параметра на значение, asyncpg допускает до 32767
+MAX_BATCH = 10_000
+MAX_RETRIES = 3
+
+
+def value_hash(value: str) -> uuid.UUID:
+    """Same as md5(value)::uuid in Postgres."""
+    return uuid.UUID(hashlib.md5(value.encode()).hexdigest())
+
+
+class Interner:
+    """Maps repeated strings to dictionary-table IDs.
+
+    Hot values are served from an in-process LRU, so the common ingest path
+    adds no round trips. All misses of a batch are resolved together by a
+    single INSERT ... ON CONFLICT ... RETURNING statement. Misses are
+    committed in their own session, so a cached ID always exists even if the
+    caller's transaction is rolled back. Dictionaries are per shard (IDs
+    differ between shards), so is the cache key.
+    """
+
+    def __init__(self, model: type[UserAgent] | type[Referer], maxsize: int):
+        self.model = model
+        self.cache: LRUCache[tuple[int, str], int] = LRUCache(maxsize)
+
+    async def get_ids(
+        self, shard: Shard, values: Iterable[str | None]
+    ) -> dict[str, int]:
+        """IDs of the non-empty values; values that failed to resolve are absent."""
+        ids: dict[str, int] = {}
+        misses: dict[uuid.UUID, str] = {}
+        for value in values:
+            if not value or value in ids:
+                continue
+            cached = self.cache.get((shard.index, value))
+            if cached is not None:
+                ids[value] = cached
+            else:
+                misses[value_hash(value)] = value
+        if not misses:
+            return ids
+
+        # Параллельная вставка того же значения может быть не видна снимку
+        # запроса - недостающие повторяем с ограничением попыток
+        async with shard.session() as db:
+            for _ in range(MAX_RETRIES):
+                for chunk in batched(sorted(misses.items()), MAX_BATCH):
+                    result = await db.execute(self._resolve(dict(chunk)))
+                    for digest, value_id in result.all():
+                        value = misses.pop(digest)
+                        ids[value] = value_id
+                        self.cache.set((shard.index, value), value_id)
+                await db.commit()
+                if not misses:
+                    break
+        return ids
+
+    def _resolve(self, misses: dict[uuid.UUID, str]):
+        """Insert missing values and return (value_hash, id) of every one of them.
+
+        Rows are inserted in value_hash order, so concurrent batches take
+        the unique index locks in the same order.
+        """
+        inserted = (
+            insert(self.model)
+            .values(
+                [
+                    {"value": value, "value_hash": digest}
+                    for digest, value in misses.items()
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=[self.model.value_hash])
+            .returning(self.model.value_hash, self.model.id)
+            .cte("inserted")
+        )
+        # Строки, вставленные в CTE, не видны второму SELECT того же запроса
+        existing = select(self.model.value_hash, self.model.id).where(
+            self.model.value_hash
+            == any_(
+                bindparam(
+                    "hashes", list(misses), type_=ARRAY(self.model.value_hash.type)
+                )
+            )
+        )
+        return union_all(select(inserted.c.value_hash, inserted.c.id), existing)
+
+
+user_agent_interner = Interner(UserAgent, maxsize=10_000)
+referer_interner = Interner(Referer, maxsize=50_000)
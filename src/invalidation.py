@@ -0,0 +1,102 @@
+import asyncio
+import json
+from collections.abc import Callable, Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import AsyncSessionLocal
+from src.notifications import MAX_PAYLOAD_BYTES, NotificationBus, notification_bus
+
+INVALIDATION_CHANNEL = "vibe_cache_invalidation"
+
+
+class CacheInvalidator:
+    """Cross-worker cache invalidation on top of LISTEN/NOTIFY.
+
+    Writers publish (kind, keys) events inside their transaction. Every worker
+    collects incoming keys for `flush_interval` seconds and evicts them in one
+    pass, so bursts of writes cost one eviction per distinct key.
+    """
+
+    def __init__(self, bus: NotificationBus, flush_interval: float = 0.05):
+        self.bus = bus
+        self.flush_interval = flush_interval
+        self._evictors: dict[str, list[Callable[[set[str]], None]]] = {}
+        self._clearers: list[Callable[[], None]] = []
+        self._pending: dict[str, set[str]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+        bus.subscribe(INVALIDATION_CHANNEL, self._on_notify)
+        bus.on_reconnect(self.clear_all)
+
+    def register(
+        self,
+        kind: str,
+        evict: Callable[[set[str]], None],
+        clear: Callable[[], None],
+    ) -> None:
+        """Register a cache for events of the given kind."""
+        self._evictors.setdefault(kind, []).append(evict)
+        self._clearers.append(clear)
+
+    async def publish(self, db: AsyncSession, kind: str, keys: Iterable[str]) -> None:
+        """Publish invalidation of keys; delivered to all workers on commit."""
+        chunk: list[str] = []
+        size = 0
+        for key in dict.fromkeys(keys):
+            key_size = len(key.encode()) + 4
+            if chunk and size + key_size > MAX_PAYLOAD_BYTES:
+                await self._publish_chunk(db, kind, chunk)
+                chunk, size = [], 0
+            chunk.append(key)
+            size += key_size
+        if chunk:
+            await self._publish_chunk(db, kind, chunk)
+
+    async def publish_after_commit(self, kind: str, keys: Iterable[str]) -> None:
+        """Publish invalidation of keys changed on another database (a shard).
+
+        NOTIFY only reaches listeners of the main database, so the event goes
+        out in its own short transaction there.
+        """
+        async with AsyncSessionLocal() as db:
+            await self.publish(db, kind, keys)
+            await db.commit()
+
+    async def _publish_chunk(self, db: AsyncSession, kind: str, keys: list[str]) -> None:
+        payload = json.dumps({"kind": kind, "keys": keys}, separators=(",", ":"))
+        await self.bus.publish(db, INVALIDATION_CHANNEL, payload)
+
+    async def sync(self) -> bool:
+        """Apply every event committed before the call; False if not listening."""
+        if not await self.bus.sync():
+            return False
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush()
+        return True
+
+    def clear_all(self) -> None:
+        """Drop every registered cache (used when events may have been lost)."""
+        self._pending.clear()
+        for clear in self._clearers:
+            clear()
+        print("🧹 Все кэши сброшены")
+
+    def _on_notify(self, payload: str) -> None:
+        event = json.loads(payload)
+        self._pending.setdefault(event["kind"], set()).update(event["keys"])
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        for kind, keys in pending.items():
+            for evict in self._evictors.get(kind, []):
+                evict(keys)
+
+
+# Глобальный экземпляр инвалидатора
+cache_invalidator = CacheInvalidator(notification_bus)
@@ -1,20 +1,61 @@
 from contextlib import asynccontextmanager
 from fastapi import APIRouter, FastAPI, Request
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 
+from src.assets import STATIC_PREFIX, assets
 from src.config import settings
+from src.database import warm_up_pool
 from src.routes import shortener, stats, health, redirect
 from src.geolocation import geolocation_service
+from src.notifications import notification_bus
+from src.cleanup import expired_links_cleaner
+from src.click_counters import click_counter_catch_up
+from src.click_spool import click_spool
+from src.click_stream import click_stream
+from src.rate_limit import rate_limiter
+from src.responses import FastJSONResponse
+from src.services import warm_up_url_cache
+from src.sharding import shard_router
+from src.short_code_filter import short_code_filter
+from src.trending import trending_tracker
+
+
+async def warm_up() -> None:
+    """Open the DB pool and preload hot short codes before taking traffic."""
+    try:
+        await shard_router.gather(lambda shard: warm_up_pool(shard.engine))
+        loaded = await warm_up_url_cache(settings.warmup_hot_links)
+        print(f"🔥 Прогрев завершен: {loaded} горячих ссылок в кэше")
+    except Exception as e:
+        print(f"❌ Ошибка прогрева: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for FastAPI app."""
     # Startup
+    assets.build()
+    await shard_router.start()
+    await notification_bus.start()
+    await warm_up()
+    await short_code_filter.start()
+    await rate_limiter.start()
+    await click_stream.start()
+    await trending_tracker.start()
+    await click_spool.start()
+    await expired_links_cleaner.start()
+    await click_counter_catch_up.start()
     yield
     # Shutdown
+    await click_counter_catch_up.close()
+    await expired_links_cleaner.close()
+    await click_spool.close()
+    await trending_tracker.close()
+    await click_stream.close()
+    await rate_limiter.close()
+    await short_code_filter.close()
+    await notification_bus.close()
+    await shard_router.close()
     await geolocation_service.close()
 
 
@@ -24,30 +65,32 @@ app = FastAPI(
     version="0.0.1",
     debug=settings.debug,
     redirect_slashes=True,
+    default_response_class=FastJSONResponse,
     lifespan=lifespan,
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="src/web/static"), name="static")
-
-# Templates
-templates = Jinja2Templates(directory="src/web/templates")
+# Static files (fingerprinted and precompressed in memory)
+@app.api_route(
+    f"{STATIC_PREFIX}/{{name:path}}", methods=["GET", "HEAD"], include_in_schema=False
+)
+async def static_files(name: str, request: Request):
+    return assets.static_response(request, name)
 
 
-# Web page routes (must be defined before API routes)
+# Web page routes (must be defined before API routes), prerendered at startup
 @app.get("/", response_class=HTMLResponse)
 async def web_interface(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return assets.page_response(request, "/")
 
 
 @app.get("/stats", response_class=HTMLResponse)
 async def stats_interface(request: Request):
-    return templates.TemplateResponse("stats.html", {"request": request})
+    return assets.page_response(request, "/stats")
 
 
 @app.get("/links", response_class=HTMLResponse)
 async def links_interface(request: Request):
-    return templates.TemplateResponse("links.html", {"request": request})
+    return assets.page_response(request, "/links")
 
 
 # API routes
@@ -1,6 +1,22 @@
 from datetime import datetime, timezone
 from enum import Enum
-from sqlalchemy import DateTime, Integer, String, Text, ForeignKey, func
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    Float,
+    Integer,
+    LargeBinary,
+    SmallInteger,
+    String,
+    Text,
+    ForeignKey,
+    Index,
+    false,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import INET, JSONB, UUID
 from sqlalchemy.orm import mapped_column, relationship
 
 from src.database import Base
@@ -26,9 +42,24 @@ class URL(Base):
         server_default=ServerDefaults.UTC_NOW.value,
         nullable=False,
     )
+    expires_at = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # Relationship: клики удаляет FK ON DELETE CASCADE, ORM их не загружает
+    clicks = relationship(
+        "Click",
+        back_populates="url",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
-    # Relationship
-    clicks = relationship("Click", back_populates="url", cascade="all, delete-orphan")
+    __table_args__ = (
+        # Частичный индекс: бессрочных ссылок большинство, в индекс они не попадают
+        Index(
+            "ix_urls_expires_at",
+            "expires_at",
+            postgresql_where=text("expires_at IS NOT NULL"),
+        ),
+    )
 
     def __repr__(self):
         return f"<URL(id={self.id}, short_code='{self.short_code}')>"
@@ -40,10 +71,31 @@ class Click(Base):
     __tablename__ = "clicks"
 
     id = mapped_column(Integer, primary_key=True, index=True)
-    url_id = mapped_column(Integer, ForeignKey("urls.id"), nullable=False, index=True)
-    ip_address = mapped_column(String(45), nullable=True)  # IPv6 compatible
-    user_agent = mapped_column(Text, nullable=True)
-    referer = mapped_column(Text, nullable=True)
+    url_id = mapped_column(
+        Integer,
+        ForeignKey("urls.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    ip_address = mapped_column(INET, nullable=True)
+    # User-Agent и Referer хранятся в словарных таблицах
+    user_agent_id = mapped_column(Integer, ForeignKey("user_agents.id"), nullable=True)
+    referer_id = mapped_column(Integer, ForeignKey("referers.id"), nullable=True)
+    # Классификация User-Agent при записи (src.user_agents)
+    ua_family = mapped_column(
+        SmallInteger, nullable=False, default=0, server_default="0"
+    )
+    ua_os = mapped_column(SmallInteger, nullable=False, default=0, server_default="0")
+    ua_device = mapped_column(
+        SmallInteger, nullable=False, default=0, server_default="0"
+    )
+    is_bot = mapped_column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )
+    # Сколько переходов представляет строка (1 / вероятность попасть в выборку).
+    # NULL - строку записал код до счетчиков, и в них она еще не учтена
+    # (см. src.click_counters); такая строка весит 1.
+    sample_weight = mapped_column(Float, nullable=True, default=1.0)
     created_at = mapped_column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
@@ -55,5 +107,100 @@ class Click(Base):
     # Relationship
     url = relationship("URL", back_populates="clicks")
 
+    __table_args__ = (
+        # Частичный индекс: по нему досчет находит строки, не учтенные в счетчиках
+        Index(
+            "ix_clicks_uncounted",
+            "id",
+            postgresql_where=text("sample_weight IS NULL"),
+        ),
+    )
+
     def __repr__(self):
         return f"<Click(id={self.id}, url_id={self.url_id})>"
+
+
+class ClickCounter(Base):
+    """Exact click totals per link (clicks may hold only a sample of rows)."""
+
+    __tablename__ = "url_click_counters"
+
+    url_id = mapped_column(
+        Integer, ForeignKey("urls.id", ondelete="CASCADE"), primary_key=True
+    )
+    total = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+    bot_total = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    last_click = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<ClickCounter(url_id={self.url_id}, total={self.total})>"
+
+
+class UserAgent(Base):
+    """Dictionary of distinct User-Agent strings referenced by clicks."""
+
+    __tablename__ = "user_agents"
+
+    id = mapped_column(Integer, primary_key=True)
+    value = mapped_column(Text, nullable=False)
+    # md5(value)::uuid - уникальный индекс без ограничения на длину строки
+    value_hash = mapped_column(UUID(as_uuid=True), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"<UserAgent(id={self.id})>"
+
+
+class Referer(Base):
+    """Dictionary of distinct Referer values referenced by clicks."""
+
+    __tablename__ = "referers"
+
+    id = mapped_column(Integer, primary_key=True)
+    value = mapped_column(Text, nullable=False)
+    value_hash = mapped_column(UUID(as_uuid=True), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"<Referer(id={self.id})>"
+
+
+class RateLimitHit(Base):
+    """Per-window hit counters for the shared rate limit tier."""
+
+    __tablename__ = "rate_limit_hits"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key = mapped_column(String(100), primary_key=True)
+    window_start = mapped_column(DateTime(timezone=True), primary_key=True)
+    hits = mapped_column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<RateLimitHit(key='{self.key}', hits={self.hits})>"
+
+
+class WarmupSnapshot(Base):
+    """Result of an expensive startup query, computed by one worker for all."""
+
+    __tablename__ = "warmup_snapshots"
+
+    key = mapped_column(String(50), primary_key=True)
+    computed_at = mapped_column(DateTime(timezone=True), nullable=False)
+    payload = mapped_column(JSONB, nullable=False)
+    # Двоичные данные снимка (биты Bloom-фильтра), читаются отдельным запросом
+    data = mapped_column(LargeBinary, nullable=True)
+
+    def __repr__(self):
+        return f"<WarmupSnapshot(key='{self.key}', computed_at={self.computed_at})>"
+
+
+class ShardMapEntry(Base):
+    """Owner shard of one bucket of short codes (read from shard 0)."""
+
+    __tablename__ = "shard_map"
+
+    bucket = mapped_column(SmallInteger, primary_key=True, autoincrement=False)
+    shard = mapped_column(SmallInteger, nullable=False)
+
+    def __repr__(self):
+        return f"<ShardMapEntry(bucket={self.bucket}, shard={self.shard})>"
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from collections.abc import Callable
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+
+# Postgres ограничивает payload NOTIFY 8000 байтами
+MAX_PAYLOAD_BYTES = 7900
+
+
+class NotificationBus:
+    """Postgres LISTEN/NOTIFY bus shared by all in-process subscribers.
+
+    Each worker keeps one dedicated connection (outside the SQLAlchemy pool)
+    and dispatches notifications to handlers registered per channel.
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self._handlers: dict[str, list[Callable[[str], None]]] = {}
+        self._reconnect_handlers: list[Callable[[], None]] = []
+        self._disconnect_handlers: list[Callable[[], None]] = []
+        self._connection: asyncpg.Connection | None = None
+        self._task: asyncio.Task | None = None
+        # Unix time, с которого LISTEN активен без разрывов (None - не слушаем)
+        self.listening_since: float | None = None
+        self._running_sync: asyncio.Task[bool] | None = None
+        self._queued_sync: asyncio.Task[bool] | None = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None and not self._connection.is_closed()
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]) -> None:
+        """Register a handler called with the payload of every notification."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_reconnect(self, handler: Callable[[], None]) -> None:
+        """Register a handler called after notifications may have been missed."""
+        self._reconnect_handlers.append(handler)
+
+    def on_disconnect(self, handler: Callable[[], None]) -> None:
+        """Register a handler called as soon as notifications stop arriving."""
+        self._disconnect_handlers.append(handler)
+
+    async def sync(self) -> bool:
+        """Wait until notifications committed before the call are dispatched.
+
+        Makes a round trip on the LISTEN connection. Postgres sends pending
+        notifications ahead of the query result, and asyncpg dispatches them
+        in order. Concurrent callers share the next round trip. Returns False
+        if not listening.
+        """
+        if not self.connected:
+            return False
+        if self._queued_sync is None:
+            self._queued_sync = asyncio.create_task(
+                self._sync_after(self._running_sync)
+            )
+        return await asyncio.shield(self._queued_sync)
+
+    async def _sync_after(self, previous: asyncio.Task[bool] | None) -> bool:
+        # Идущий запрос мог начаться раньше вызова: ждем его и делаем свой
+        if previous is not None:
+            await asyncio.wait([previous])
+        self._running_sync, self._queued_sync = self._queued_sync, None
+        try:
+            connection = self._connection
+            if connection is None or connection.is_closed():
+                return False
+            await connection.fetchval("SELECT 1")
+            return True
+        except Exception:
+            return False
+        finally:
+            self._running_sync = None
+
+    async def publish(self, db: AsyncSession, channel: str, payload: str) -> None:
+        """Queue a notification; Postgres delivers it when the transaction commits."""
+        await db.execute(select(func.pg_notify(channel, payload)))
+
+    async def start(self) -> None:
+        """Start the listener task (reconnects automatically)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._connection and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+    async def _run(self) -> None:
+        first_connect = True
+        while True:
+            try:
+                lost = asyncio.Event()
+                self._connection = await asyncpg.connect(self.dsn)
+                self._connection.add_termination_listener(
+                    lambda _: self._on_lost(lost)
+                )
+                for channel in self._handlers:
+                    await self._connection.add_listener(channel, self._dispatch)
+                self.listening_since = time.time()
+                print(f"📡 LISTEN: {', '.join(self._handlers)}")
+
+                # Пока соединения не было, уведомления могли потеряться
+                if not first_connect:
+                    for handler in self._reconnect_handlers:
+                        handler()
+                first_connect = False
+
+                await lost.wait()
+                print("❌ Соединение LISTEN потеряно, переподключаемся")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ошибка LISTEN: {e}")
+                first_connect = False
+                self._on_lost(lost)
+            self._connection = None
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _on_lost(self, lost: asyncio.Event) -> None:
+        """Connection closed: notifications are being missed from now on."""
+        if lost.is_set():
+            return
+        lost.set()
+        self.listening_since = None
+        for handler in self._disconnect_handlers:
+            handler()
+
+    def _dispatch(self, connection, pid: int, channel: str, payload: str) -> None:
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"❌ Ошибка обработчика {channel}: {e}")
+
+
+# Глобальный экземпляр шины
+notification_bus = NotificationBus(settings.database_url)
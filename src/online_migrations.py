@@ -0,0 +1,496 @@
+"""Helpers for zero-downtime Alembic migrations on large tables.
+
+`op.alter_column(type_=...)` and volatile column defaults rewrite the whole
+table under ACCESS EXCLUSIVE lock. These helpers split such
+changes into short steps that never block reads and writes for long:
+
+    from src.online_migrations import (
+        add_column_with_backfill,
+        change_column_type,
+        create_index_concurrently,
+    )
+
+    def upgrade() -> None:
+        create_index_concurrently("ix_clicks_url_id", "clicks", ["url_id"])
+        # Индексы по created_at строятся заново на новой колонке до подмены
+        change_column_type(
+            "clicks", "created_at", "timestamptz", using="{column} AT TIME ZONE 'UTC'"
+        )
+
+Backfills commit after every batch and record their progress in the
+`online_migration_progress` table, so an interrupted `alembic upgrade` continues
+from the last processed key instead of starting over.
+"""
+
+import re
+import time
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.exc import DBAPIError
+
+from src.cleanup import REPLICATION_LAG_SQL
+
+PROGRESS_TABLE = "online_migration_progress"
+LOCK_NOT_AVAILABLE = "55P03"
+
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_PAUSE = 0.05  # секунды между пачками
+DEFAULT_MAX_REPLICATION_LAG = 10.0  # секунды
+DEFAULT_LOCK_TIMEOUT_MS = 2000
+MAX_LOCK_ATTEMPTS = 100
+
+
+def _autocommit_block():
+    """Leave the migration transaction: every statement commits on its own."""
+    return op.get_context().autocommit_block()
+
+
+def _quote(name: str) -> str:
+    return op.get_bind().dialect.identifier_preparer.quote(name)
+
+
+# Предупреждение о невидимом лаге печатается один раз на процесс
+_lag_hidden_reported = False
+
+
+def _replication_lag(conn: sa.Connection) -> float:
+    """Replicas' replay lag in seconds, as the cleanup job reads it."""
+    global _lag_hidden_reported
+    visible, lag = conn.execute(REPLICATION_LAG_SQL).one()
+    if not visible and not _lag_hidden_reported:
+        _lag_hidden_reported = True
+        print(
+            "⚠️ Лаг реплик не виден (нужна роль pg_read_all_stats): "
+            "пачки идут без ожидания реплик"
+        )
+    return float(lag)
+
+
+def _throttle(conn: sa.Connection, pause: float, max_replication_lag: float) -> None:
+    """Sleep between batches and wait while replicas are behind."""
+    time.sleep(pause)
+    while (lag := _replication_lag(conn)) > max_replication_lag:
+        print(f"⏳ Лаг реплик {lag:.1f} с, ждем")
+        time.sleep(min(lag, 5.0))
+
+
+def _with_lock_retries(
+    conn: sa.Connection, statements: list[str], lock_timeout_ms: int
+) -> None:
+    """Run statements in one short transaction, retrying on lock timeout.
+
+    A DDL statement waiting for its lock blocks every query queued behind it,
+    so instead of waiting we give up after lock_timeout and try again.
+    """
+    for attempt in range(1, MAX_LOCK_ATTEMPTS + 1):
+        try:
+            conn.exec_driver_sql("BEGIN")
+            conn.exec_driver_sql(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}")
+            for statement in statements:
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql("COMMIT")
+            return
+        except DBAPIError as e:
+            conn.exec_driver_sql("ROLLBACK")
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                raise
+            print(f"🔒 Не дождались блокировки (попытка {attempt}), повторяем")
+            time.sleep(min(0.1 * attempt, 5.0))
+    raise RuntimeError(f"Could not acquire lock after {MAX_LOCK_ATTEMPTS} attempts")
+
+
+# --- Индексы ---
+
+
+def _drop_invalid_index(conn: sa.Connection, name: str, table: str) -> None:
+    """Drop an index left INVALID by an interrupted CONCURRENTLY build."""
+    invalid = conn.execute(
+        sa.text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).scalar()
+    if invalid:
+        op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: list[str],
+    unique: bool = False,
+    where: str | None = None,
+) -> None:
+    """CREATE INDEX CONCURRENTLY, replacing an invalid leftover of a failed build."""
+    conn = op.get_bind()
+    with _autocommit_block():
+        _drop_invalid_index(conn, name, table)
+        op.create_index(
+            name,
+            table,
+            columns,
+            unique=unique,
+            postgresql_where=sa.text(where) if where else None,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def drop_index_concurrently(name: str, table: str) -> None:
+    with _autocommit_block():
+        op.drop_index(
+            name, table_name=table, postgresql_concurrently=True, if_exists=True
+        )
+
+
+# --- Пакетное заполнение ---
+
+
+def _ensure_progress_table(conn: sa.Connection) -> None:
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} ("
+        "job text PRIMARY KEY, "
+        "last_key bigint NOT NULL, "
+        "rows_done bigint NOT NULL DEFAULT 0, "
+        "updated_at timestamptz NOT NULL DEFAULT now())"
+    )
+
+
+def _load_progress(conn: sa.Connection, job: str) -> tuple[int, int]:
+    row = conn.execute(
+        sa.text(f"SELECT last_key, rows_done FROM {PROGRESS_TABLE} WHERE job = :job"),
+        {"job": job},
+    ).first()
+    return (row.last_key, row.rows_done) if row else (0, 0)
+
+
+def _save_progress(
+    conn: sa.Connection, job: str, last_key: int, rows_done: int
+) -> None:
+    conn.execute(
+        sa.text(
+            f"INSERT INTO {PROGRESS_TABLE} (job, last_key, rows_done) "
+            "VALUES (:job, :last_key, :rows_done) "
+            "ON CONFLICT (job) DO UPDATE SET last_key = excluded.last_key, "
+            "rows_done = excluded.rows_done, updated_at = now()"
+        ),
+        {"job": job, "last_key": last_key, "rows_done": rows_done},
+    )
+
+
+def backfill(
+    table: str,
+    set_sql: str,
+    where: str | None = None,
+    job: str | None = None,
+    key: str = "id",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = DEFAULT_PAUSE,
+    max_replication_lag: float = DEFAULT_MAX_REPLICATION_LAG,
+) -> int:
+    """UPDATE table SET <set_sql> in keyset-paginated batches of batch_size rows.
+
+    Batches walk the integer primary key, so each UPDATE touches an index
+    range, not a scan from the beginning. Each batch commits on its own and
+    its upper key is saved under `job` (default "<table>:<set_sql>"), so a
+    rerun after an interruption resumes where the previous one stopped. The
+    progress row is removed once the backfill completes. Returns the number
+    of updated rows.
+    """
+    conn = op.get_bind()
+    job = job or f"{table}:{set_sql}"
+    table_sql, key_sql = _quote(table), _quote(key)
+    extra = f" AND ({where})" if where else ""
+    next_key = sa.text(
+        f"SELECT max({key_sql}) FROM (SELECT {key_sql} FROM {table_sql} "
+        f"WHERE {key_sql} > :last ORDER BY {key_sql} LIMIT :limit) batch"
+    )
+    update = sa.text(
+        f"UPDATE {table_sql} SET {set_sql} "
+        f"WHERE {key_sql} > :last AND {key_sql} <= :upper{extra}"
+    )
+
+    with _autocommit_block():
+        _ensure_progress_table(conn)
+        last_key, rows_done = _load_progress(conn, job)
+        if last_key:
+            print(f"↪️ {job}: продолжаем с {key} > {last_key}")
+
+        while True:
+            upper = conn.execute(
+                next_key, {"last": last_key, "limit": batch_size}
+            ).scalar()
+            if upper is None:
+                break
+            result = conn.execute(update, {"last": last_key, "upper": upper})
+            rows_done += result.rowcount
+            last_key = upper
+            _save_progress(conn, job, last_key, rows_done)
+            print(f"📦 {job}: {key} <= {last_key}, обновлено {rows_done}")
+            _throttle(conn, pause, max_replication_lag)
+
+        conn.execute(
+            sa.text(f"DELETE FROM {PROGRESS_TABLE} WHERE job = :job"), {"job": job}
+        )
+    return rows_done
+
+
+def add_column_with_backfill(
+    table: str,
+    column: sa.Column,
+    value_sql: str,
+    where: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = DEFAULT_PAUSE,
+) -> int:
+    """Add a nullable column, then fill it with value_sql in batches.
+
+    Adding a nullable column (or one with a constant default) only touches
+    the catalog. Make it NOT NULL afterwards with `set_not_null`.
+    """
+    conn = op.get_bind()
+    with _autocommit_block():
+        column_ddl = sa.schema.CreateColumn(column).compile(dialect=conn.dialect)
+        _with_lock_retries(
+            conn,
+            [f"ALTER TABLE {_quote(table)} ADD COLUMN IF NOT EXISTS {column_ddl}"],
+            DEFAULT_LOCK_TIMEOUT_MS,
+        )
+    condition = f"{_quote(column.name)} IS NULL"
+    return backfill(
+        table,
+        f"{_quote(column.name)} = {value_sql}",
+        where=f"{condition} AND ({where})" if where else condition,
+        job=f"{table}.{column.name}",
+        batch_size=batch_size,
+        pause=pause,
+    )
+
+
+def set_not_null(table: str, column: str) -> None:
+    """SET NOT NULL without a long lock: validate a CHECK first, then reuse it.
+
+    The NOT VALID constraint is added instantly and VALIDATE only takes a
+    SHARE UPDATE EXCLUSIVE lock. SET NOT NULL then sees the validated check
+    and skips the full scan.
+    """
+    conn = op.get_bind()
+    table_sql, column_sql = _quote(table), _quote(column)
+    check = _quote(f"{table}_{column}_not_null")
+    with _autocommit_block():
+        _with_lock_retries(
+            conn,
+            [
+                f"ALTER TABLE {table_sql} DROP CONSTRAINT IF EXISTS {check}",
+                f"ALTER TABLE {table_sql} ADD CONSTRAINT {check} "
+                f"CHECK ({column_sql} IS NOT NULL) NOT VALID",
+            ],
+            DEFAULT_LOCK_TIMEOUT_MS,
+        )
+        conn.exec_driver_sql(f"ALTER TABLE {table_sql} VALIDATE CONSTRAINT {check}")
+        _with_lock_retries(
+            conn,
+            [
+                f"ALTER TABLE {table_sql} ALTER COLUMN {column_sql} SET NOT NULL",
+                f"ALTER TABLE {table_sql} DROP CONSTRAINT {check}",
+            ],
+            DEFAULT_LOCK_TIMEOUT_MS,
+        )
+
+
+# --- Теневые колонки ---
+
+
+def _shadow_names(table: str, column: str) -> tuple[str, str, str]:
+    return f"{column}_shadow", f"{table}_{column}_shadow_sync", f"{column}_old"
+
+
+def _column_indexes(conn: sa.Connection, table: str, column: str) -> list[sa.Row]:
+    """Indexes of table using column (in keys, expressions or predicate).
+
+    Indexes backing constraints are left out: `_column_constraints` reports
+    those.
+    """
+    return conn.execute(
+        sa.text(
+            "SELECT DISTINCT c.relname AS name, quote_ident(c.relname) AS quoted, "
+            "i.indisunique AS is_unique, pg_get_indexdef(c.oid) AS definition "
+            "FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_depend d ON d.classid = 'pg_class'::regclass "
+            "AND d.objid = c.oid AND d.refobjid = i.indrelid "
+            "JOIN pg_attribute a ON a.attrelid = i.indrelid "
+            "AND a.attnum = d.refobjsubid "
+            "WHERE i.indrelid = to_regclass(:table) AND a.attname = :column "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = c.oid) "
+            "ORDER BY c.relname"
+        ),
+        {"table": _quote(table), "column": column},
+    ).all()
+
+
+def _column_constraints(conn: sa.Connection, table: str, column: str) -> list[str]:
+    """Constraints on column, including foreign keys of other tables to it."""
+    return list(
+        conn.execute(
+            sa.text(
+                "SELECT k.conname FROM pg_constraint k "
+                "JOIN pg_attribute a ON a.attrelid = to_regclass(:table) "
+                "AND a.attname = :column "
+                "WHERE (k.conrelid = a.attrelid AND a.attnum = ANY (k.conkey)) "
+                "OR (k.confrelid = a.attrelid AND a.attnum = ANY (k.confkey)) "
+                "ORDER BY k.conname"
+            ),
+            {"table": _quote(table), "column": column},
+        ).scalars()
+    )
+
+
+def add_shadow_column(
+    table: str,
+    column: str,
+    type_sql: str,
+    using: str = "{column}",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = DEFAULT_PAUSE,
+) -> int:
+    """Create <column>_shadow of the new type and keep it in sync with column.
+
+    `using` is an SQL expression over "{column}" converting the old value,
+    e.g. "{column} AT TIME ZONE 'UTC'". A trigger converts new writes, the
+    backfill converts existing rows. Rebuild the column's indexes on the
+    shadow column with `copy_indexes_to_shadow` before `swap_shadow_column`.
+    """
+    conn = op.get_bind()
+    shadow, trigger, _ = _shadow_names(table, column)
+    table_sql, shadow_sql = _quote(table), _quote(shadow)
+    trigger_sql = _quote(trigger)
+    with _autocommit_block():
+        _with_lock_retries(
+            conn,
+            [
+                f"ALTER TABLE {table_sql} ADD COLUMN IF NOT EXISTS "
+                f"{shadow_sql} {type_sql}",
+                f"CREATE OR REPLACE FUNCTION {trigger_sql}() RETURNS trigger AS $$ "
+                f"BEGIN NEW.{shadow_sql} := "
+                f"{using.format(column='NEW.' + _quote(column))}; RETURN NEW; END; "
+                "$$ LANGUAGE plpgsql",
+                f"DROP TRIGGER IF EXISTS {trigger_sql} ON {table_sql}",
+                f"CREATE TRIGGER {trigger_sql} BEFORE INSERT OR UPDATE ON {table_sql} "
+                f"FOR EACH ROW EXECUTE FUNCTION {trigger_sql}()",
+            ],
+            DEFAULT_LOCK_TIMEOUT_MS,
+        )
+    return backfill(
+        table,
+        f"{shadow_sql} = {using.format(column=_quote(column))}",
+        job=f"{table}.{shadow}",
+        batch_size=batch_size,
+        pause=pause,
+    )
+
+
+def copy_indexes_to_shadow(table: str, column: str) -> list[str]:
+    """Build a copy of every index on column over <column>_shadow, concurrently.
+
+    The copy of index `ix` is `ix_shadow`; `swap_shadow_column` gives it the
+    original name. An expression or predicate that is not valid for the new
+    type fails here, before anything is swapped. Returns the names of the
+    copies.
+    """
+    conn = op.get_bind()
+    shadow, _, _ = _shadow_names(table, column)
+    # Имя колонки в кавычках или без, но не часть другого идентификатора
+    quoted = '"' + column.replace('"', '""') + '"'
+    column_pattern = re.compile(
+        rf'{re.escape(quoted)}|(?<![\w."]){re.escape(column)}(?![\w"])'
+    )
+    copies = []
+    with _autocommit_block():
+        for index in _column_indexes(conn, table, column):
+            copy = f"{index.name}_shadow"
+            header = (
+                f"CREATE {'UNIQUE ' if index.is_unique else ''}INDEX {index.quoted} ON "
+            )
+            if not index.definition.startswith(header):
+                raise RuntimeError(f"Unexpected definition of {index.name}")
+            # "public.clicks USING btree (created_at) WHERE ..." - колонки после USING
+            target, _, method = index.definition[len(header) :].partition(" USING ")
+            method = column_pattern.sub(_quote(shadow), method)
+            _drop_invalid_index(conn, copy, table)
+            conn.exec_driver_sql(
+                f"CREATE {'UNIQUE ' if index.is_unique else ''}INDEX CONCURRENTLY "
+                f"IF NOT EXISTS {_quote(copy)} ON {target} USING {method}"
+            )
+            print(f"🗂️ {index.name}: копия {copy} по {shadow}")
+            copies.append(copy)
+    return copies
+
+
+def swap_shadow_column(table: str, column: str, drop_old: bool = True) -> None:
+    """Atomically put <column>_shadow in place of column.
+
+    Renames are catalog-only, so the swap holds its lock for milliseconds.
+    Defaults and NOT NULL of the old column are not carried over. Every
+    index on the column must have its `copy_indexes_to_shadow` copy, which
+    takes over the index's name; constraints on the column (keys, checks,
+    foreign keys) must be dropped first and recreated after the swap.
+    Otherwise the swap refuses instead of silently losing them.
+    """
+    conn = op.get_bind()
+    shadow, trigger, old = _shadow_names(table, column)
+    table_sql, column_sql = _quote(table), _quote(column)
+    old_sql, trigger_sql = _quote(old), _quote(trigger)
+    statements = [f"DROP TRIGGER IF EXISTS {trigger_sql} ON {table_sql}"]
+    with _autocommit_block():
+        constraints = _column_constraints(conn, table, column)
+        if constraints:
+            raise RuntimeError(
+                f"{table}.{column} has constraints {constraints}: "
+                "drop them before the swap and recreate them afterwards"
+            )
+        copies = {index.name for index in _column_indexes(conn, table, shadow)}
+        for index in _column_indexes(conn, table, column):
+            copy = f"{index.name}_shadow"
+            if copy not in copies:
+                raise RuntimeError(
+                    f"Index {index.name} on {table}.{column} has no copy on "
+                    f"{shadow}: run copy_indexes_to_shadow first"
+                )
+            statements += [
+                f"ALTER INDEX {_quote(index.name)} "
+                f"RENAME TO {_quote(f'{index.name}_old')}",
+                f"ALTER INDEX {_quote(copy)} RENAME TO {_quote(index.name)}",
+            ]
+        statements += [
+            f"ALTER TABLE {table_sql} RENAME COLUMN {column_sql} TO {old_sql}",
+            f"ALTER TABLE {table_sql} RENAME COLUMN {_quote(shadow)} TO {column_sql}",
+        ]
+        if drop_old:
+            statements.append(f"ALTER TABLE {table_sql} DROP COLUMN {old_sql}")
+        _with_lock_retries(conn, statements, DEFAULT_LOCK_TIMEOUT_MS)
+        conn.exec_driver_sql(f"DROP FUNCTION IF EXISTS {trigger_sql}()")
+
+
+def change_column_type(
+    table: str,
+    column: str,
+    type_sql: str,
+    using: str = "{column}",
+    not_null: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = DEFAULT_PAUSE,
+) -> None:
+    """Online replacement for `op.alter_column(type_=...)` on a large table.
+
+    Shadow column + trigger + batched backfill + concurrent copies of the
+    column's indexes + swap. The server default must be recreated by the
+    caller, and constraints on the column dropped and recreated around it.
+    """
+    add_shadow_column(table, column, type_sql, using, batch_size, pause)
+    copy_indexes_to_shadow(table, column)
+    swap_shadow_column(table, column)
+    if not_null:
+        set_not_null(table, column)
@@ -0,0 +1,237 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import batched
+
+from sqlalchemy import String, any_, bindparam, delete, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.models import RateLimitHit
+
+WINDOW_SECONDS = 60
+# Ключей в одном INSERT: 3 параметра на ключ, asyncpg допускает до 32767
+SYNC_CHUNK_SIZE = 5000
+
+
+@dataclass(slots=True)
+class TokenBucket:
+    tokens: float
+    updated: float = field(default_factory=time.monotonic)
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimitRule:
+    per_minute: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / WINDOW_SECONDS
+
+
+class RateLimiter:
+    """Per-IP, per-route rate limiter.
+
+    The fast tier is an in-process token bucket per (route, ip) and is the only
+    thing consulted on the request path. The optional shared tier periodically
+    flushes local hit counts to an UNLOGGED Postgres table and blocks keys whose
+    sliding-window total across all workers exceeds the limit, so allowed
+    requests never wait for the database.
+
+    At most `max_keys` buckets are kept. When the table is full, the least
+    recently used bucket is evicted, so a client spraying new IPs only pushes
+    out keys that have been idle the longest.
+    """
+
+    def __init__(
+        self,
+        rules: dict[str, RateLimitRule],
+        shared: bool = False,
+        sync_interval: float = 2.0,
+        max_keys: int = 100_000,
+    ):
+        self.rules = rules
+        self.shared = shared
+        self.sync_interval = sync_interval
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        # (route, ip, начало минутного окна в момент запроса) -> число запросов
+        self._unsynced: dict[tuple[str, str, int], int] = {}
+        self._blocked: dict[tuple[str, str], float] = {}
+        self._task: asyncio.Task | None = None
+        self.allowed_total = 0
+        self.limited_total = 0
+
+    def hit(self, route: str, ip: str | None) -> bool:
+        """Register a request and return whether it is within limits."""
+        rule = self.rules[route]
+        key = (route, ip or "unknown")
+        now = time.monotonic()
+
+        blocked_until = self._blocked.get(key)
+        if blocked_until is not None:
+            if blocked_until > now:
+                self.limited_total += 1
+                return False
+            del self._blocked[key]
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = TokenBucket(tokens=rule.per_minute, updated=now)
+        else:
+            bucket.tokens = min(
+                rule.per_minute, bucket.tokens + (now - bucket.updated) * rule.rate
+            )
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+
+        if bucket.tokens < 1:
+            self.limited_total += 1
+            return False
+
+        bucket.tokens -= 1
+        self.allowed_total += 1
+        if self.shared:
+            window = int(time.time() // WINDOW_SECONDS) * WINDOW_SECONDS
+            unsynced_key = (*key, window)
+            self._unsynced[unsynced_key] = self._unsynced.get(unsynced_key, 0) + 1
+        return True
+
+    async def start(self) -> None:
+        if self.shared and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"❌ Ошибка синхронизации rate limit: {e}")
+
+    async def sync(self) -> None:
+        """Flush local hits to Postgres and block keys over the global limit."""
+        now = time.monotonic()
+        self._blocked = {
+            key: until for key, until in self._blocked.items() if until > now
+        }
+        if not self._unsynced:
+            return
+        unsynced, self._unsynced = self._unsynced, {}
+        try:
+            hits = await self._flush(unsynced)
+        except BaseException:
+            self._restore(unsynced)
+            raise
+        self._block_over_limit({(route, ip) for route, ip, _ in unsynced}, hits)
+
+    def _restore(self, unsynced: dict[tuple[str, str, int], int]) -> None:
+        """Put hits of a failed flush back, so the next sync sends them."""
+        oldest = (int(time.time() // WINDOW_SECONDS) - 1) * WINDOW_SECONDS
+        for key, count in unsynced.items():
+            if key[2] >= oldest:
+                self._unsynced[key] = self._unsynced.get(key, 0) + count
+
+    async def _flush(
+        self, unsynced: dict[tuple[str, str, int], int]
+    ) -> dict[tuple[str, datetime], int]:
+        """Add hits to their windows and read back both windows of every key.
+
+        All chunks go in one transaction: a failed sync leaves nothing
+        half-counted, and the caller can simply retry it.
+        """
+        window = int(time.time() // WINDOW_SECONDS) * WINDOW_SECONDS
+        previous_window = datetime.fromtimestamp(window - WINDOW_SECONDS, timezone.utc)
+        # По возрастанию ключа: воркеры берут блокировки строк в одном порядке
+        rows = sorted(
+            (f"{route}:{ip}", datetime.fromtimestamp(start, timezone.utc), count)
+            for (route, ip, start), count in unsynced.items()
+        )
+        keys = sorted({key for key, _, _ in rows})
+        hits: dict[tuple[str, datetime], int] = {}
+
+        async with AsyncSessionLocal() as db:
+            for chunk in batched(rows, SYNC_CHUNK_SIZE):
+                upsert = insert(RateLimitHit).values(
+                    [
+                        {"key": key, "window_start": start, "hits": count}
+                        for key, start, count in chunk
+                    ]
+                )
+                await db.execute(
+                    upsert.on_conflict_do_update(
+                        index_elements=[RateLimitHit.key, RateLimitHit.window_start],
+                        set_={"hits": RateLimitHit.hits + upsert.excluded.hits},
+                    )
+                )
+
+            for chunk in batched(keys, SYNC_CHUNK_SIZE):
+                result = await db.execute(
+                    select(RateLimitHit).where(
+                        RateLimitHit.key
+                        == any_(bindparam("keys", list(chunk), type_=ARRAY(String))),
+                        RateLimitHit.window_start >= previous_window,
+                    )
+                )
+                hits.update(
+                    ((row.key, row.window_start), row.hits)
+                    for row in result.scalars()
+                )
+
+            await db.execute(
+                delete(RateLimitHit).where(RateLimitHit.window_start < previous_window)
+            )
+            await db.commit()
+        return hits
+
+    def _block_over_limit(
+        self, keys: set[tuple[str, str]], hits: dict[tuple[str, datetime], int]
+    ) -> None:
+        now = time.time()
+        window = int(now // WINDOW_SECONDS) * WINDOW_SECONDS
+        current_window = datetime.fromtimestamp(window, timezone.utc)
+        previous_window = datetime.fromtimestamp(window - WINDOW_SECONDS, timezone.utc)
+
+        # Скользящее окно: текущее окно + пропорциональная доля предыдущего
+        elapsed = (now - window) / WINDOW_SECONDS
+        blocked_until = time.monotonic() + (WINDOW_SECONDS - (now - window))
+        for route, ip in keys:
+            key = f"{route}:{ip}"
+            estimate = hits.get((key, current_window), 0) + hits.get(
+                (key, previous_window), 0
+            ) * (1 - elapsed)
+            if estimate > self.rules[route].per_minute:
+                self._blocked[(route, ip)] = blocked_until
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed_total,
+            "limited": self.limited_total,
+            "tracked_keys": len(self._buckets),
+            "blocked_keys": len(self._blocked),
+        }
+
+
+# Глобальный экземпляр лимитера
+rate_limiter = RateLimiter(
+    rules={
+        "shorten": RateLimitRule(settings.rate_limit_shorten_per_minute),
+        "redirect": RateLimitRule(settings.rate_limit_redirect_per_minute),
+    },
+    shared=settings.rate_limit_shared,
+    sync_interval=settings.rate_limit_sync_interval,
+)
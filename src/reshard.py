@@ -0,0 +1,492 @@
+"""Shard maintenance CLI.
+
+    python -m src.reshard status     # ссылки и бакеты по шардам
+    python -m src.reshard init       # чередующиеся urls.id и карта шардов
+    python -m src.reshard rebalance  # равномерно разложить бакеты по SHARD_URLS
+
+Adding a shard: create the database, add it to SHARD_URLS, run
+`alembic upgrade head`, `init`, restart the app (the new shard owns no
+buckets yet), then `rebalance`. The first `init` maps every bucket to
+shard 0, where the existing links are. Rows are deleted from a shard only
+after the shard owning their bucket is verified to hold the link with at
+least as many clicks and as large a counter.
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict
+from itertools import batched
+
+from sqlalchemy import (
+    Integer,
+    any_,
+    bindparam,
+    delete,
+    func,
+    literal_column,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.interning import value_hash
+from src.models import URL, Click, ClickCounter, Referer, ShardMapEntry, UserAgent
+from src.sharding import (
+    SHARD_BUCKETS,
+    SHARD_ID_STRIDE,
+    Shard,
+    bucket_sql,
+    even_bucket_map,
+    initial_bucket_map,
+    load_bucket_map,
+    save_bucket_map,
+    shard_router,
+)
+
+URL_BUCKET = literal_column(bucket_sql("urls.short_code"), Integer)
+
+# Сколько раз догонять переходы, пока копии перенесенных ссылок не сойдутся
+CATCH_UP_ROUNDS = 5
+
+
+def _ids_param(ids: list[int]):
+    return any_(bindparam("ids", ids, type_=ARRAY(Integer)))
+
+
+def _buckets_param(buckets: list[int]):
+    return any_(bindparam("buckets", buckets, type_=ARRAY(Integer)))
+
+
+async def _bucket_url_ids(db: AsyncSession, buckets: list[int]) -> list[int]:
+    result = await db.execute(
+        select(URL.id).where(URL_BUCKET == _buckets_param(buckets))
+    )
+    return list(result.scalars())
+
+
+async def status() -> None:
+    buckets = await load_bucket_map(len(shard_router.shards))
+    for shard in shard_router.shards:
+        async with shard.session() as db:
+            links = await db.scalar(select(func.count(URL.id)))
+            clicks = await db.scalar(select(func.count(Click.id)))
+        owned = buckets.count(shard.index)
+        print(
+            f"🗄️ Шард {shard.index}: {owned} бакетов, {links} ссылок, "
+            f"{clicks} строк clicks"
+        )
+
+
+async def init() -> None:
+    """Interleave urls.id sequences across shards and write the initial map."""
+    max_ids = await shard_router.gather(_max_url_id)
+    start = max(max_ids) // SHARD_ID_STRIDE * SHARD_ID_STRIDE + SHARD_ID_STRIDE
+    for shard in shard_router.shards:
+        async with shard.session() as db:
+            increment = await db.scalar(
+                text(
+                    "SELECT increment_by FROM pg_sequences "
+                    "WHERE sequencename = 'urls_id_seq'"
+                )
+            )
+            if increment == SHARD_ID_STRIDE:
+                continue
+            await db.execute(
+                text(
+                    f"ALTER SEQUENCE urls_id_seq INCREMENT BY {SHARD_ID_STRIDE} "
+                    f"RESTART WITH {start + shard.index + 1}"
+                )
+            )
+            await db.commit()
+        print(
+            f"🔢 Шард {shard.index}: urls.id = {shard.index + 1} mod {SHARD_ID_STRIDE}"
+        )
+
+    async with shard_router.shards[0].session() as db:
+        has_map = await db.scalar(select(func.count(ShardMapEntry.bucket)))
+    if not has_map:
+        # Ссылки пока только в шарде 0; на другие шарды их переносит rebalance
+        await save_bucket_map(initial_bucket_map())
+        print("🗺️ Карта шардов записана в шард 0: все бакеты в шарде 0")
+
+
+async def _max_url_id(shard: Shard) -> int:
+    async with shard.session() as db:
+        return await db.scalar(select(func.coalesce(func.max(URL.id), 0)))
+
+
+async def _intern(
+    db: AsyncSession, model: type[UserAgent] | type[Referer], values: set[str]
+) -> dict[str, int]:
+    """Dictionary IDs of values on the target shard, inserting missing ones."""
+    if not values:
+        return {}
+    await db.execute(
+        insert(model)
+        .values([{"value": value, "value_hash": value_hash(value)} for value in values])
+        .on_conflict_do_nothing(index_elements=[model.value_hash])
+    )
+    result = await db.execute(
+        select(model.value, model.id).where(
+            model.value_hash
+            == any_(
+                bindparam(
+                    "hashes",
+                    [value_hash(value) for value in values],
+                    type_=ARRAY(model.value_hash.type),
+                )
+            )
+        )
+    )
+    return dict(result.all())
+
+
+async def _copy_clicks(
+    source: Shard, target: Shard, url_ids: list[int], after_id: int, batch_size: int
+) -> tuple[int, int]:
+    """Copy clicks with id > after_id; returns (last copied id, copied rows)."""
+    copied = 0
+    stmt = (
+        select(
+            Click.id,
+            Click.url_id,
+            Click.ip_address,
+            UserAgent.value.label("user_agent"),
+            Referer.value.label("referer"),
+            Click.ua_family,
+            Click.ua_os,
+            Click.ua_device,
+            Click.is_bot,
+            Click.sample_weight,
+            Click.created_at,
+        )
+        .outerjoin(UserAgent, UserAgent.id == Click.user_agent_id)
+        .outerjoin(Referer, Referer.id == Click.referer_id)
+        .where(Click.url_id == _ids_param(url_ids))
+        .order_by(Click.id)
+        .limit(batch_size)
+    )
+    while True:
+        async with source.session() as db:
+            rows = (await db.execute(stmt.where(Click.id > after_id))).all()
+        if not rows:
+            return after_id, copied
+
+        async with target.session() as db:
+            user_agents = await _intern(
+                db, UserAgent, {row.user_agent for row in rows if row.user_agent}
+            )
+            referers = await _intern(
+                db, Referer, {row.referer for row in rows if row.referer}
+            )
+            # id новые: последовательность clicks.id у каждого шарда своя
+            await db.execute(
+                insert(Click),
+                [
+                    {
+                        "url_id": row.url_id,
+                        "ip_address": row.ip_address,
+                        "user_agent_id": user_agents.get(row.user_agent),
+                        "referer_id": referers.get(row.referer),
+                        "ua_family": row.ua_family,
+                        "ua_os": row.ua_os,
+                        "ua_device": row.ua_device,
+                        "is_bot": row.is_bot,
+                        "sample_weight": row.sample_weight,
+                        "created_at": row.created_at,
+                    }
+                    for row in rows
+                ],
+            )
+            await db.commit()
+        after_id = rows[-1].id
+        copied += len(rows)
+
+
+async def _copy_links(
+    source: Shard, target: Shard, url_ids: list[int], batch_size: int
+) -> int:
+    """Copy link rows batch_size at a time; returns how many were read."""
+    copied = 0
+    for chunk in batched(url_ids, batch_size):
+        async with source.session() as db:
+            result = await db.execute(
+                select(
+                    URL.id,
+                    URL.original_url,
+                    URL.short_code,
+                    URL.created_at,
+                    URL.expires_at,
+                ).where(URL.id == _ids_param(list(chunk)))
+            )
+            link_rows = [row._asdict() for row in result]
+        if not link_rows:
+            continue
+        async with target.session() as db:
+            await db.execute(
+                insert(URL).on_conflict_do_nothing(index_elements=[URL.id]),
+                link_rows,
+            )
+            await db.commit()
+        copied += len(link_rows)
+    return copied
+
+
+async def _copy_counters(
+    source: Shard,
+    target: Shard,
+    url_ids: list[int],
+    copied: dict[int, tuple[int, int]],
+    batch_size: int,
+) -> None:
+    """Add source counters on the target, minus what was already copied.
+
+    `copied` maps url_id -> (total, bot_total) added by earlier calls and is
+    updated in place. Rows go as executemany, so no statement nears the
+    32767 bind parameter limit however many links move.
+    """
+    stmt = insert(ClickCounter)
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[ClickCounter.url_id],
+        set_={
+            "total": ClickCounter.total + stmt.excluded.total,
+            "bot_total": ClickCounter.bot_total + stmt.excluded.bot_total,
+            "last_click": func.greatest(
+                ClickCounter.last_click, stmt.excluded.last_click
+            ),
+        },
+    )
+    for chunk in batched(url_ids, batch_size):
+        async with source.session() as db:
+            result = await db.execute(
+                select(
+                    ClickCounter.url_id,
+                    ClickCounter.total,
+                    ClickCounter.bot_total,
+                    ClickCounter.last_click,
+                ).where(ClickCounter.url_id == _ids_param(list(chunk)))
+            )
+            counters = result.all()
+        rows = []
+        for url_id, total, bot_total, last_click in counters:
+            old_total, old_bot_total = copied.get(url_id, (0, 0))
+            if (total, bot_total) != (old_total, old_bot_total):
+                rows.append(
+                    {
+                        "url_id": url_id,
+                        "total": total - old_total,
+                        "bot_total": bot_total - old_bot_total,
+                        "last_click": last_click,
+                    }
+                )
+        if rows:
+            async with target.session() as db:
+                await db.execute(upsert, rows)
+                await db.commit()
+        for url_id, total, bot_total, _ in counters:
+            copied[url_id] = (total, bot_total)
+
+
+async def _link_totals(
+    shard: Shard, url_ids: list[int], batch_size: int
+) -> dict[int, tuple[int, int]]:
+    """url_id -> (click rows, counter total) of the links present on shard."""
+    click_rows = (
+        select(func.count(Click.id)).where(Click.url_id == URL.id).scalar_subquery()
+    )
+    totals: dict[int, tuple[int, int]] = {}
+    for chunk in batched(url_ids, batch_size):
+        async with shard.session() as db:
+            result = await db.execute(
+                select(URL.id, click_rows, func.coalesce(ClickCounter.total, 0))
+                .outerjoin(ClickCounter, ClickCounter.url_id == URL.id)
+                .where(URL.id == _ids_param(list(chunk)))
+            )
+            totals.update((url_id, (rows, total)) for url_id, rows, total in result)
+    return totals
+
+
+async def _verify_copies(
+    source: Shard, target: Shard, url_ids: list[int], batch_size: int
+) -> tuple[list[int], list[int]]:
+    """Split source links into (copied to target, not fully copied yet).
+
+    A copy is complete when the target has the link with at least as many
+    click rows and as large a counter; new clicks may only add to it. Links
+    already gone from the source are in neither list.
+    """
+    source_totals = await _link_totals(source, url_ids, batch_size)
+    target_totals = await _link_totals(target, list(source_totals), batch_size)
+    copied, pending = [], []
+    for url_id, (rows, total) in source_totals.items():
+        target_rows, target_total = target_totals.get(url_id, (-1, -1))
+        if target_rows >= rows and target_total >= total:
+            copied.append(url_id)
+        else:
+            pending.append(url_id)
+    return copied, pending
+
+
+async def _delete_links(shard: Shard, url_ids: list[int], batch_size: int) -> None:
+    """Delete links with their clicks and counters in bounded batches."""
+    batch = (
+        select(Click.id).where(Click.url_id == _ids_param(url_ids)).limit(batch_size)
+    )
+    while True:
+        async with shard.session() as db:
+            result = await db.execute(delete(Click).where(Click.id.in_(batch)))
+            await db.commit()
+        if result.rowcount < batch_size:
+            break
+    for chunk in batched(url_ids, batch_size):
+        async with shard.session() as db:
+            await db.execute(delete(URL).where(URL.id == _ids_param(list(chunk))))
+            await db.commit()
+
+
+async def purge_foreign(buckets: list[int], batch_size: int) -> None:
+    """Delete leftovers of an interrupted run: rows of buckets a shard doesn't own.
+
+    Only links whose owner holds a verified copy are deleted; the rest are
+    reported and kept, since they may be the only copy.
+    """
+    for shard in shard_router.shards:
+        foreign = [b for b in range(SHARD_BUCKETS) if buckets[b] != shard.index]
+        async with shard.session() as db:
+            result = await db.execute(
+                select(URL.id, URL_BUCKET).where(URL_BUCKET == _buckets_param(foreign))
+            )
+            by_owner: dict[int, list[int]] = defaultdict(list)
+            for url_id, bucket in result:
+                by_owner[buckets[bucket]].append(url_id)
+
+        for owner_index, url_ids in by_owner.items():
+            owner = shard_router.shards[owner_index]
+            copied, kept = await _verify_copies(shard, owner, url_ids, batch_size)
+            if copied:
+                print(
+                    f"🧹 Шард {shard.index}: удаляем {len(copied)} ссылок, "
+                    f"скопированных в шард {owner_index}"
+                )
+                await _delete_links(shard, copied, batch_size)
+            if kept:
+                print(
+                    f"⚠️ Шард {shard.index}: {len(kept)} ссылок из бакетов шарда "
+                    f"{owner_index} там нет или они скопированы не полностью - "
+                    f"не удалены (например, id {kept[:10]})"
+                )
+
+
+async def rebalance(batch_size: int, grace: float) -> None:
+    """Move buckets so every shard owns an equal contiguous range.
+
+    Per source -> target pair: copy links, counters and clicks, switch the map
+    (workers get it over NOTIFY), wait `grace` seconds for in-flight requests
+    and spooled clicks to land on the old shard, then copy what arrived
+    meanwhile - including links created there. Moved rows are deleted from
+    the source only once their copies verify; catching up is repeated for
+    the rest. Every step reads and writes batch_size rows at a time.
+    """
+    shard_count = len(shard_router.shards)
+    current = await load_bucket_map(shard_count)
+    target_map = even_bucket_map(shard_count)
+    await purge_foreign(current, batch_size)
+
+    moves: dict[tuple[int, int], list[int]] = defaultdict(list)
+    for bucket, (old, new) in enumerate(zip(current, target_map)):
+        if old != new:
+            moves[(old, new)].append(bucket)
+    if not moves:
+        print("✅ Бакеты уже распределены равномерно")
+        return
+
+    for (source_index, target_index), buckets in moves.items():
+        source = shard_router.shards[source_index]
+        target = shard_router.shards[target_index]
+        print(f"🚚 {len(buckets)} бакетов: шард {source_index} -> {target_index}")
+
+        async with source.session() as db:
+            url_ids = await _bucket_url_ids(db, buckets)
+        links = await _copy_links(source, target, url_ids, batch_size)
+        counters: dict[int, tuple[int, int]] = {}
+        await _copy_counters(source, target, url_ids, counters, batch_size)
+        last_id, copied = await _copy_clicks(source, target, url_ids, 0, batch_size)
+        print(f"  📦 {links} ссылок, {copied} строк clicks")
+
+        for bucket in buckets:
+            current[bucket] = target_index
+        await save_bucket_map(current)
+        print(f"  🗺️ Карта переключена, ждем {grace} с")
+        await asyncio.sleep(grace)
+
+        # Ссылки и позиция, до которой скопированы их переходы
+        groups: list[tuple[list[int], int]] = [(url_ids, last_id)]
+        moved = set(url_ids)
+        pending = url_ids
+        for _ in range(CATCH_UP_ROUNDS):
+            # Записанное в старый шард до переключения воркеров, в том числе
+            # ссылки, созданные после первого прохода: их переходы - с начала
+            async with source.session() as db:
+                new_ids = [
+                    i for i in await _bucket_url_ids(db, buckets) if i not in moved
+                ]
+            await _copy_links(source, target, new_ids, batch_size)
+            moved.update(new_ids)
+            if new_ids:
+                groups.append((new_ids, 0))
+            await _copy_counters(source, target, list(moved), counters, batch_size)
+            delta = 0
+            for index, (group_ids, after_id) in enumerate(groups):
+                after_id, rows = await _copy_clicks(
+                    source, target, group_ids, after_id, batch_size
+                )
+                groups[index] = (group_ids, after_id)
+                delta += rows
+
+            copied, pending = await _verify_copies(
+                source, target, [*pending, *new_ids], batch_size
+            )
+            await _delete_links(source, copied, batch_size)
+            print(
+                f"  ✅ Догнали {len(new_ids)} новых ссылок и {delta} строк clicks, "
+                f"из источника удалено {len(copied)} ссылок"
+            )
+            if not pending:
+                break
+            await asyncio.sleep(1.0)
+        else:
+            print(
+                f"  ⚠️ {len(pending)} ссылок не сошлись с копиями и оставлены в "
+                f"шарде {source_index}: повторите rebalance"
+            )
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Shard maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    commands.add_parser("init")
+    rebalance_parser = commands.add_parser("rebalance")
+    rebalance_parser.add_argument("--batch-size", type=int, default=5000)
+    # Карта доходит до воркеров сразу; ждем запросы в полете и пачки спула
+    rebalance_parser.add_argument(
+        "--grace", type=float, default=5.0 + settings.click_spool_replay_interval * 10
+    )
+    args = parser.parse_args()
+
+    try:
+        if args.command == "status":
+            await status()
+        elif args.command == "init":
+            await init()
+        else:
+            await rebalance(args.batch_size, args.grace)
+    finally:
+        await shard_router.close()
+        await shard_router.shards[0].engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,26 @@
+from typing import Any
+
+import pydantic_core
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by pydantic-core's Rust encoder.
+
+    Only the render step changes: FastAPI still validates the return value
+    against response_model and runs jsonable_encoder first. Hot routes skip
+    all of that by returning bytes from model_dump_json in a plain Response
+    (see benchmarks/json_responses.py).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
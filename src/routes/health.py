@@ -1,8 +1,23 @@
 from fastapi import APIRouter
 
+from src.click_sampling import click_sampler
+from src.cleanup import expired_links_cleaner
+from src.click_counters import click_counter_catch_up
+from src.rate_limit import rate_limiter
+from src.sharding import shard_router
+from src.short_code_filter import short_code_filter
+
 router = APIRouter()
 
 
 @router.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "short_code_filter": short_code_filter.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "cleanup": expired_links_cleaner.stats(),
+        "click_sampling": click_sampler.stats(),
+        "click_counters": click_counter_catch_up.stats(),
+        "sharding": shard_router.stats(),
+    }
@@ -1,30 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import RedirectResponse
-from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.schemas import ClickCreate
+from src.schemas import SpooledClick
 from src.services import get_url_by_short_code, create_click
-from src.database import get_db
-from src.utils import get_real_ip
+from src.utils import get_real_ip, is_prefetch
+from src.rate_limit import rate_limiter
+from src.click_spool import click_spool
+from src.click_stream import click_stream
 
 router = APIRouter()
 
 
 @router.get("/{short_code}")
-async def redirect_to_url(
-    short_code: str,
-    request: Request,
-    db: AsyncSession = Depends(get_db),
-):
-    url_dto = await get_url_by_short_code(db, short_code)
+async def redirect_to_url(short_code: str, request: Request):
+    url_dto = await get_url_by_short_code(short_code)
     if not url_dto:
         raise HTTPException(status_code=404, detail="URL not found")
+    if url_dto.expires_at and url_dto.expires_at <= datetime.now(timezone.utc):
+        raise HTTPException(status_code=410, detail="URL expired")
+
+    ip_address = get_real_ip(request)
+    # Сверх лимита редиректим, но переход не засчитываем
+    if not rate_limiter.hit("redirect", ip_address):
+        return RedirectResponse(url_dto.original_url)
 
-    click_data = ClickCreate(
+    click_data = SpooledClick(
         url_id=url_dto.id,
-        ip_address=get_real_ip(request),
+        short_code=url_dto.short_code,
+        ip_address=ip_address,
         user_agent=request.headers.get("user-agent"),
         referer=request.headers.get("referer"),
+        is_prefetch=is_prefetch(request),
+        created_at=datetime.now(timezone.utc),
     )
-    await create_click(db, click_data)
+    # Переход пишется в локальный спул, в БД его переносит фоновый реплеер
+    try:
+        click_spool.append(click_data)
+    except Exception as e:
+        print(f"❌ Ошибка записи в спул, пишем переход напрямую: {e}")
+        try:
+            click_dto = await create_click(click_data)
+            click_stream.record(url_dto.short_code, click_dto)
+        except Exception as e:
+            print(f"❌ Переход не сохранен: {e}")
     return RedirectResponse(url_dto.original_url)
@@ -1,21 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.schemas import URLCreate, URLResponse, ClickCreate
 from src.services import create_url, get_url_by_short_code, create_click
 from src.config import settings
-from src.database import get_db
+from src.rate_limit import rate_limiter
+from src.utils import get_real_ip
 
 router = APIRouter()
 
 
 @router.post("/shorten", response_model=URLResponse)
-async def shorten_url(
-    url_data: URLCreate,
-    db: AsyncSession = Depends(get_db),
-):
-    url_dto = await create_url(db, url_data)
+async def shorten_url(url_data: URLCreate, request: Request):
+    if not rate_limiter.hit("shorten", get_real_ip(request)):
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests. Please try again later.",
+            headers={"Retry-After": "60"},
+        )
+
+    url_dto = await create_url(url_data)
     if not url_dto:
         raise HTTPException(
             status_code=500,
@@ -26,10 +30,13 @@ async def shorten_url(
     protocol = "https" if settings.environment == "production" else "http"
     short_url = f"{protocol}://{settings.domain}/{url_dto.short_code}"
 
-    return URLResponse(
+    # Готовые байты: без повторной валидации response_model и jsonable_encoder
+    url_response = URLResponse(
         id=url_dto.id,
         original_url=url_dto.original_url,
         short_code=url_dto.short_code,
         created_at=url_dto.created_at,
+        expires_at=url_dto.expires_at,
         short_url=short_url,
     )
+    return Response(url_response.model_dump_json(), media_type="application/json")
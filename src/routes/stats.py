@@ -1,31 +1,136 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 
-from src.schemas import URLStats
-from src.services import get_url_stats, get_url_detailed_stats
-from src.database import get_db
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+
+from src.click_stream import click_stream
+from src.config import settings
+from src.invalidation import cache_invalidator
+from src.responses import etag_matches
+from src.schemas import (
+    BatchStatsRequest,
+    DetailedURLStats,
+    TrendingLinks,
+    URLStats,
+    URLStatsDTO,
+)
+from src.services import (
+    get_url_by_short_code,
+    get_url_detailed_stats,
+    get_url_stats,
+    get_urls_stats,
+)
+from src.stats_cache import CachedResponse, ResponseCache
+from src.trending import TrendingWindow, trending_tracker
 
 router = APIRouter()
 
+# Комментарий-пинг, чтобы прокси не закрывали простаивающее соединение
+SSE_KEEPALIVE_SECONDS = 15
 
-@router.get("/stats/{short_code}", response_model=URLStats)
-async def get_url_statistics(
-    short_code: str,
-    db: AsyncSession = Depends(get_db),
-):
-    stats_dto = await get_url_stats(db, short_code)
-    if not stats_dto:
+# Сериализатор списка статистики: один проход Rust-энкодера по всему ответу
+url_stats_list = TypeAdapter(list[URLStatsDTO])
+
+stats_cache = ResponseCache(
+    ttl=settings.stats_cache_ttl,
+    stale_ttl=settings.stats_cache_stale_ttl,
+    maxsize=settings.stats_cache_size,
+)
+
+
+def evict_stats(short_codes: set[str]) -> None:
+    """Drop cached stats of deleted links (their watermark never changes again)."""
+    for short_code in short_codes:
+        stats_cache.invalidate(f"stats:{short_code}")
+        stats_cache.invalidate(f"detailed:{short_code}")
+
+
+cache_invalidator.register("url", evict_stats, stats_cache.clear)
+
+
+def stats_version(short_code: str) -> str:
+    """Cache version of a link's stats, derived from its click watermark."""
+    generation, watermark = click_stream.watermark(short_code)
+    return f"{generation}:{watermark}"
+
+
+def cached_response(request: Request, entry: CachedResponse | None) -> Response:
+    if entry is None:
         raise HTTPException(status_code=404, detail="URL not found")
-    return stats_dto
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+@router.post("/stats/batch", response_model=list[URLStats])
+async def get_batch_statistics(batch: BatchStatsRequest):
+    """Get statistics for many short codes at once; unknown codes are skipped."""
+    stats = await get_urls_stats(batch.short_codes)
+    return Response(url_stats_list.dump_json(stats), media_type="application/json")
 
 
-@router.get("/stats/{short_code}/detailed")
-async def get_url_detailed_statistics(
-    short_code: str,
-    db: AsyncSession = Depends(get_db),
-):
+# Объявлен до /stats/{short_code}, иначе "trending" разберется как короткий код
+@router.get("/stats/trending", response_model=TrendingLinks)
+async def get_trending_links(window: TrendingWindow = "1h"):
+    """Most clicked links in a sliding window, precomputed every few seconds."""
+    return Response(
+        trending_tracker.get(window),
+        media_type="application/json",
+        headers={"Cache-Control": f"max-age={int(settings.trending_refresh_interval)}"},
+    )
+
+
+@router.get("/stats/{short_code}", response_model=URLStats)
+async def get_url_statistics(short_code: str, request: Request):
+    async def compute() -> bytes | None:
+        stats_dto = await get_url_stats(short_code)
+        return stats_dto.model_dump_json().encode() if stats_dto else None
+
+    entry = await stats_cache.get(
+        f"stats:{short_code}", stats_version(short_code), compute
+    )
+    return cached_response(request, entry)
+
+
+@router.get("/stats/{short_code}/detailed", response_model=DetailedURLStats)
+async def get_url_detailed_statistics(short_code: str, request: Request):
     """Get detailed statistics with chart data."""
-    detailed_stats = await get_url_detailed_stats(db, short_code)
-    if not detailed_stats:
+
+    async def compute() -> bytes | None:
+        detailed_stats = await get_url_detailed_stats(short_code)
+        return detailed_stats.model_dump_json().encode() if detailed_stats else None
+
+    entry = await stats_cache.get(
+        f"detailed:{short_code}", stats_version(short_code), compute
+    )
+    return cached_response(request, entry)
+
+
+@router.get("/stats/{short_code}/stream")
+async def stream_url_clicks(short_code: str):
+    """Stream new clicks for a link as Server-Sent Events."""
+    url_dto = await get_url_by_short_code(short_code)
+    if not url_dto:
         raise HTTPException(status_code=404, detail="URL not found")
-    return detailed_stats
+
+    async def events():
+        # Подписываемся до снимка: переходы после него уже попадут в очередь
+        async with click_stream.subscribe(url_dto.id) as queue:
+            # БД нужна только для начального снимка, соединение не держим весь стрим
+            stats_dto = await get_url_stats(short_code)
+            if not stats_dto:
+                return
+            yield f"event: stats\ndata: {stats_dto.model_dump_json()}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except TimeoutError:
+                    yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
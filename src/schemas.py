@@ -1,6 +1,8 @@
 from datetime import datetime
 
-from pydantic import BaseModel, ConfigDict, HttpUrl
+from pydantic import AwareDatetime, BaseModel, ConfigDict, Field, HttpUrl
+
+from src.config import settings
 
 
 class URLBase(BaseModel):
@@ -12,7 +14,7 @@ class URLBase(BaseModel):
 class URLCreate(URLBase):
     """Schema for creating a new URL."""
 
-    pass
+    expires_at: AwareDatetime | None = None
 
 
 class URLResponse(URLBase):
@@ -23,6 +25,7 @@ class URLResponse(URLBase):
     id: int
     short_code: str
     created_at: datetime
+    expires_at: datetime | None = None
     short_url: str
 
 
@@ -33,6 +36,7 @@ class URLDTO(BaseModel):
     original_url: str
     short_code: str
     created_at: datetime
+    expires_at: datetime | None = None
 
 
 class ClickBase(BaseModel):
@@ -48,16 +52,30 @@ class ClickCreate(ClickBase):
     ip_address: str | None = None
     user_agent: str | None = None
     referer: str | None = None
+    is_prefetch: bool = False
+
+
+class SpooledClick(ClickCreate):
+    """Click waiting in the local spool to be written to the database."""
+
+    short_code: str
+    created_at: datetime
 
 
 class ClickDTO(BaseModel):
     """DTO for Click objects returned from services."""
 
-    id: int
+    # None - переход учтен только в счетчиках и не попал в выборку строк
+    id: int | None
     url_id: int
     ip_address: str | None
     user_agent: str | None
     referer: str | None
+    ua_family: int
+    ua_os: int
+    ua_device: int
+    is_bot: bool
+    sample_weight: float | None = 1.0
     created_at: datetime
 
 
@@ -100,6 +118,76 @@ class URLStats(BaseModel):
     last_click: datetime | None = None
 
 
+class BatchStatsRequest(BaseModel):
+    """Schema for requesting statistics of many URLs at once."""
+
+    short_codes: list[str] = Field(
+        min_length=1, max_length=settings.batch_stats_max_codes
+    )
+
+
+class DailyClicks(BaseModel):
+    """Clicks per day."""
+
+    date: str
+    clicks: int
+
+
+class HourlyClicks(BaseModel):
+    """Clicks per hour of day."""
+
+    hour: int
+    clicks: int
+
+
+class UserAgentClicks(BaseModel):
+    """Clicks per browser family."""
+
+    user_agent: str
+    clicks: int
+
+
+class OSClicks(BaseModel):
+    """Clicks per operating system."""
+
+    os: str
+    clicks: int
+
+
+class DeviceClicks(BaseModel):
+    """Clicks per device type."""
+
+    device: str
+    clicks: int
+
+
+class RegionalClicks(BaseModel):
+    """Clicks per IP with its geolocation."""
+
+    country: str
+    region: str
+    city: str
+    latitude: float | None = None
+    longitude: float | None = None
+    clicks: int
+    ip: str
+
+
+class TrendingLink(BaseModel):
+    """Link with its click count in a trending window."""
+
+    short_code: str
+    clicks: int
+
+
+class TrendingLinks(BaseModel):
+    """Most clicked links in a sliding window."""
+
+    window: str
+    generated_at: datetime
+    links: list[TrendingLink]
+
+
 class DetailedURLStats(BaseModel):
     """Schema for detailed URL statistics with chart data."""
 
@@ -111,13 +199,14 @@ class DetailedURLStats(BaseModel):
     original_url: str
     short_url: str
     total_clicks: int
+    bot_clicks: int = 0
     created_at: datetime
     last_click: datetime | None = None
 
-    # Chart data
-    daily_clicks: list[dict]  # [{date: "2024-01-01", clicks: 5}, ...]
-    hourly_distribution: list[dict]  # [{hour: 14, clicks: 3}, ...]
-    top_user_agents: list[dict]  # [{user_agent: "Mozilla/5.0...", clicks: 5}, ...]
-    regional_clicks: list[
-        dict
-    ]  # [{country: "Russia", region: "Moscow", city: "Moscow", latitude: 55.7558, longitude: 37.6176, clicks: 10}, ...]
+    # Chart data (без ботов и превью)
+    daily_clicks: list[DailyClicks]
+    hourly_distribution: list[HourlyClicks]
+    top_user_agents: list[UserAgentClicks]
+    top_os: list[OSClicks]
+    devices: list[DeviceClicks]
+    regional_clicks: list[RegionalClicks]
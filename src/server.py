@@ -0,0 +1,25 @@
+import os
+
+import uvicorn
+
+from src.config import settings
+
+
+def main() -> None:
+    """Run the app in production mode with one worker per CPU core."""
+    workers = settings.workers
+    # Воркеры читают WEB_CONCURRENCY, чтобы поделить бюджет соединений с БД
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    print(f"🚀 Запуск {workers} воркеров на {settings.host}:{settings.port}")
+    uvicorn.run(
+        "src.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.forwarded_allow_ips,
+    )
+
+
+if __name__ == "__main__":
+    main()
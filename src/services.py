@@ -1,10 +1,26 @@
+import asyncio
+import heapq
 import secrets
 import string
-from datetime import datetime, timedelta
-from sqlalchemy import select, func, and_, extract
+from itertools import chain
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import (
+    Integer,
+    String,
+    any_,
+    bindparam,
+    select,
+    func,
+    and_,
+    or_,
+    cast,
+    extract,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.models import URL, Click
+from src.database import AsyncSessionLocal
+from src.models import URL, Click, ClickCounter, WarmupSnapshot
 from src.schemas import (
     URLCreate,
     ClickCreate,
@@ -12,9 +28,63 @@ from src.schemas import (
     ClickDTO,
     URLStatsDTO,
     DetailedURLStats,
+    SpooledClick,
+    DailyClicks,
+    HourlyClicks,
+    UserAgentClicks,
+    OSClicks,
+    DeviceClicks,
+    RegionalClicks,
 )
 from src.config import settings
+from src.cache import LRUCache
+from src.click_sampling import click_sampler
 from src.geolocation import geolocation_service
+from src.invalidation import cache_invalidator
+from src.interning import referer_interner, user_agent_interner
+from src.sharding import Shard, shard_router
+from src.short_code_filter import short_code_filter
+from src.user_agents import (
+    BROWSER_LABELS,
+    DEVICE_LABELS,
+    OS_LABELS,
+    BrowserFamily,
+    DeviceType,
+    OSFamily,
+    classify_user_agent,
+)
+from src.utils import normalize_ip
+
+# Ключ advisory-lock: горячие ссылки для прогрева считает один воркер
+WARMUP_LOCK_ID = 0x56494245_484F54  # "VIBE" "HOT"
+
+# Попытки отправить "url_created" и пауза перед повтором (растет с попыткой), с
+URL_CREATED_PUBLISH_ATTEMPTS = 3
+URL_CREATED_RETRY_DELAY = 0.2
+
+# Кэш short_code -> URLDTO (свой в каждом воркере)
+url_cache: LRUCache[str, URLDTO] = LRUCache(settings.url_cache_size)
+
+
+def evict_urls(short_codes: set[str]) -> None:
+    """Evict short codes from the URL cache."""
+    for short_code in short_codes:
+        url_cache.pop(short_code)
+
+
+# "url" - ссылка изменена или удалена: выбрасываем ее из кэшей воркеров.
+# "url_created" - новый код: кэшировать нечего, но его надо добавить в
+# Bloom-фильтры остальных воркеров, иначе они ответят на него 404.
+cache_invalidator.register("url", evict_urls, url_cache.clear)
+cache_invalidator.register(
+    "url_created", short_code_filter.add, short_code_filter.invalidate
+)
+
+
+def _weighted_count():
+    """Estimated number of clicks behind a group of (possibly sampled) rows."""
+    weight = func.coalesce(Click.sample_weight, 1)
+    return cast(func.round(func.sum(weight)), Integer)
 
 
 def generate_short_code(length: int = 8) -> str:
@@ -23,90 +93,390 @@ def generate_short_code(length: int = 8) -> str:
     return "".join(secrets.choice(alphabet) for _ in range(length))
 
 
-async def create_url(db: AsyncSession, url_data: URLCreate) -> URLDTO | None:
-    """Create a new shortened URL."""
+def _url_dto(url: URL) -> URLDTO:
+    return URLDTO(
+        id=url.id,
+        original_url=url.original_url,
+        short_code=url.short_code,
+        created_at=url.created_at,
+        expires_at=url.expires_at,
+    )
+
+
+async def create_url(url_data: URLCreate) -> URLDTO | None:
+    """Create a new shortened URL on the shard of its short code."""
     # Generate unique short code with retry limit
     max_retries = 100
     for attempt in range(max_retries):
         short_code = generate_short_code()
-        result = await db.execute(select(URL).where(URL.short_code == short_code))
-        existing_url = result.scalar_one_or_none()
+        shard = shard_router.for_short_code(short_code)
+        async with shard.session() as db:
+            result = await db.execute(select(URL).where(URL.short_code == short_code))
+            existing_url = result.scalar_one_or_none()
         if not existing_url:
             break
     else:
         # If we've exhausted all retries, return None
         return None
 
-    db_url = URL(
-        original_url=str(url_data.original_url),
-        short_code=short_code,
-    )
-    db.add(db_url)
-    await db.commit()
-    await db.refresh(db_url)
+    # Код объявляем до вставки: лишний код в Bloom-фильтрах безвреден (промах
+    # дойдет до БД), а необъявленный другие воркеры отвечали бы 404 до
+    # пересборки. Не ушло событие - ссылка не создается, клиент получает ошибку
+    await _announce_short_code(short_code)
 
-    return URLDTO(
-        id=db_url.id,
-        original_url=db_url.original_url,
-        short_code=db_url.short_code,
-        created_at=db_url.created_at,
-    )
+    async with shard.session() as db:
+        db_url = URL(
+            original_url=str(url_data.original_url),
+            short_code=short_code,
+            expires_at=url_data.expires_at,
+        )
+        db.add(db_url)
+        await db.commit()
+        await db.refresh(db_url)
+        url_dto = _url_dto(db_url)
+
+    url_cache.set(url_dto.short_code, url_dto)
+    short_code_filter.add({url_dto.short_code})
+    return url_dto
+
+
+async def _announce_short_code(short_code: str) -> None:
+    """Publish "url_created" for a code, retrying; raises if it never goes out."""
+    for attempt in range(1, URL_CREATED_PUBLISH_ATTEMPTS + 1):
+        try:
+            await cache_invalidator.publish_after_commit("url_created", [short_code])
+            return
+        except Exception as e:
+            if attempt == URL_CREATED_PUBLISH_ATTEMPTS:
+                raise
+            print(
+                f"⚠️ Не отправлено событие о новом коде {short_code} "
+                f"(попытка {attempt}): {e}"
+            )
+            await asyncio.sleep(URL_CREATED_RETRY_DELAY * attempt)
 
 
-async def get_url_by_short_code(db: AsyncSession, short_code: str) -> URLDTO | None:
+async def get_url_by_short_code(short_code: str) -> URLDTO | None:
     """Get URL by short code."""
+    cached = url_cache.get(short_code)
+    if cached:
+        return cached
+
+    # Код мог быть только что создан в другом воркере, а NOTIFY еще в пути:
+    # перед 404 дочитываем события (общий для всех промахов SELECT 1 на
+    # соединении LISTEN, без запроса к таблицам шарда)
+    if not short_code_filter.might_exist(short_code):
+        await cache_invalidator.sync()
+        if not short_code_filter.might_exist(short_code):
+            return None
+
     stmt = select(URL).where(URL.short_code == short_code)
-    result = await db.execute(stmt)
-    url = result.scalar_one_or_none()
+    async with shard_router.for_short_code(short_code).session() as db:
+        result = await db.execute(stmt)
+        url = result.scalar_one_or_none()
 
     if not url:
         return None
 
-    return URLDTO(
-        id=url.id,
-        original_url=url.original_url,
-        short_code=url.short_code,
-        created_at=url.created_at,
+    url_dto = _url_dto(url)
+    url_cache.set(short_code, url_dto)
+    return url_dto
+
+
+async def get_hot_urls(limit: int) -> list[URLDTO]:
+    """Get the most clicked URLs over the last day (for cache warmup).
+
+    Each shard returns its own top `limit`; the global top is merged from them.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=1)
+    hot_stmt = (
+        select(Click.url_id, _weighted_count().label("clicks"))
+        .where(Click.created_at >= since)
+        .group_by(Click.url_id)
+        .order_by(_weighted_count().desc())
+        .limit(limit)
+        .subquery()
+    )
+    stmt = select(URL, hot_stmt.c.clicks).join(hot_stmt, hot_stmt.c.url_id == URL.id)
+
+    async def hot_on_shard(shard: Shard) -> list[tuple[int, URLDTO]]:
+        async with shard.session() as db:
+            result = await db.execute(stmt)
+            return [(clicks, _url_dto(url)) for url, clicks in result]
+
+    hot = heapq.nlargest(
+        limit,
+        chain.from_iterable(await shard_router.gather(hot_on_shard)),
+        key=lambda item: item[0],
+    )
+    return [url_dto for _, url_dto in hot]
+
+
+async def get_shared_hot_urls(limit: int) -> list[URLDTO]:
+    """Hot URLs aggregated once per deploy and shared by all workers.
+
+    Workers serialize on an advisory lock on the main database. The first
+    one runs get_hot_urls() and stores the list in warmup_snapshots. The
+    others then find a fresh snapshot (younger than WARMUP_SNAPSHOT_TTL)
+    and read it, instead of scanning a day of clicks on every shard again.
+    Snapshot entries are re-read from urls, so links deleted or expired
+    since the snapshot was taken are not preloaded.
+    """
+    async with AsyncSessionLocal() as db:
+        # Транзакционная блокировка: снимается на commit/rollback
+        await db.execute(select(func.pg_advisory_xact_lock(WARMUP_LOCK_ID)))
+        snapshot = await db.get(WarmupSnapshot, "hot_links")
+        fresh_since = datetime.now(timezone.utc) - timedelta(
+            seconds=settings.warmup_snapshot_ttl
+        )
+        if snapshot is None or snapshot.computed_at < fresh_since:
+            hot_urls = await get_hot_urls(limit)
+            stmt = insert(WarmupSnapshot).values(
+                key="hot_links",
+                computed_at=datetime.now(timezone.utc),
+                payload=[url_dto.model_dump(mode="json") for url_dto in hot_urls],
+            )
+            await db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[WarmupSnapshot.key],
+                    set_={
+                        "computed_at": stmt.excluded.computed_at,
+                        "payload": stmt.excluded.payload,
+                    },
+                )
+            )
+            await db.commit()
+            return hot_urls
+        short_codes = [item["short_code"] for item in snapshot.payload][:limit]
+
+    # Ссылки из снимка могли удалить или истечь после его расчета:
+    # в кэш попадают только строки, которые сейчас есть в urls
+    return await _get_live_urls(short_codes)
+
+
+async def _get_live_urls(short_codes: list[str]) -> list[URLDTO]:
+    """Current, unexpired URLs for short codes, in the order of short_codes."""
+    now = datetime.now(timezone.utc)
+
+    async def live_on_shard(shard: Shard, shard_codes: list[str]) -> list[URLDTO]:
+        stmt = select(URL).where(
+            URL.short_code
+            == any_(bindparam("short_codes", shard_codes, type_=ARRAY(String))),
+            or_(URL.expires_at.is_(None), URL.expires_at > now),
+        )
+        async with shard.session() as db:
+            return [_url_dto(url) for url in (await db.scalars(stmt))]
+
+    groups = shard_router.group(short_codes, lambda short_code: short_code)
+    results = await asyncio.gather(
+        *(live_on_shard(shard, shard_codes) for shard, shard_codes in groups.items())
     )
+    live = {url_dto.short_code: url_dto for url_dto in chain.from_iterable(results)}
+    return [live[short_code] for short_code in short_codes if short_code in live]
 
 
-async def create_click(db: AsyncSession, click_data: ClickCreate) -> ClickDTO:
-    """Create a new click record."""
-    db_click = Click(**click_data.model_dump())
-    db.add(db_click)
-    await db.commit()
-    await db.refresh(db_click)
+async def warm_up_url_cache(limit: int) -> int:
+    """Preload the hottest short codes into the in-process cache."""
+    hot_urls = await get_shared_hot_urls(limit)
+    for url_dto in reversed(hot_urls):
+        url_cache.set(url_dto.short_code, url_dto)
+    return len(hot_urls)
 
+
+async def _intern_clicks(
+    shard: Shard, clicks: list[ClickCreate]
+) -> tuple[dict[str, int], dict[str, int]]:
+    """Dictionary IDs of the clicks' user agents and referers, one query each."""
+    user_agents = await user_agent_interner.get_ids(
+        shard, (click.user_agent for click in clicks)
+    )
+    referers = await referer_interner.get_ids(
+        shard, (click.referer for click in clicks)
+    )
+    return user_agents, referers
+
+
+def _click_values(
+    click_data: ClickCreate, user_agents: dict[str, int], referers: dict[str, int]
+) -> dict:
+    """Column values for a click row: classified UA, interned strings, inet IP."""
+    ua_info = classify_user_agent(click_data.user_agent)
+    return {
+        "url_id": click_data.url_id,
+        "ip_address": normalize_ip(click_data.ip_address),
+        "user_agent_id": user_agents.get(click_data.user_agent),
+        "referer_id": referers.get(click_data.referer),
+        "ua_family": ua_info.family,
+        "ua_os": ua_info.os,
+        "ua_device": ua_info.device,
+        "is_bot": ua_info.is_bot or click_data.is_prefetch,
+    }
+
+
+def _click_dto(db_click: Click, click_data: ClickCreate) -> ClickDTO:
     return ClickDTO(
         id=db_click.id,
         url_id=db_click.url_id,
-        ip_address=db_click.ip_address,
-        user_agent=db_click.user_agent,
-        referer=db_click.referer,
+        ip_address=normalize_ip(click_data.ip_address),
+        user_agent=click_data.user_agent,
+        referer=click_data.referer,
+        ua_family=db_click.ua_family,
+        ua_os=db_click.ua_os,
+        ua_device=db_click.ua_device,
+        is_bot=db_click.is_bot,
+        sample_weight=db_click.sample_weight,
         created_at=db_click.created_at,
     )
 
 
-async def get_url_stats(db: AsyncSession, short_code: str) -> URLStatsDTO | None:
-    """Get statistics for a URL."""
-    url = await get_url_by_short_code(db, short_code)
-    if not url:
-        return None
+def _counted_click_dto(click: SpooledClick) -> ClickDTO:
+    """DTO of a click that only goes to the counters, without a raw row."""
+    ua_info = classify_user_agent(click.user_agent)
+    return ClickDTO(
+        id=None,
+        url_id=click.url_id,
+        ip_address=normalize_ip(click.ip_address),
+        user_agent=click.user_agent,
+        referer=click.referer,
+        ua_family=ua_info.family,
+        ua_os=ua_info.os,
+        ua_device=ua_info.device,
+        is_bot=ua_info.is_bot or click.is_prefetch,
+        sample_weight=None,
+        created_at=click.created_at,
+    )
 
-    # Get total clicks
-    result = await db.execute(
-        select(func.count(Click.id)).where(Click.url_id == url.id)
+
+async def _add_to_counters(db: AsyncSession, clicks: list[ClickDTO]) -> None:
+    """Add clicks to the exact per-link counters, one upserted row per link."""
+    counters: dict[int, dict] = {}
+    for click in clicks:
+        counter = counters.setdefault(
+            click.url_id,
+            {
+                "url_id": click.url_id,
+                "total": 0,
+                "bot_total": 0,
+                "last_click": click.created_at,
+            },
+        )
+        counter["total"] += 1
+        counter["bot_total"] += click.is_bot
+        counter["last_click"] = max(counter["last_click"], click.created_at)
+
+    # По возрастанию url_id: воркеры берут блокировки строк в одном порядке
+    stmt = insert(ClickCounter).values([counters[key] for key in sorted(counters)])
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ClickCounter.url_id],
+            set_={
+                "total": ClickCounter.total + stmt.excluded.total,
+                "bot_total": ClickCounter.bot_total + stmt.excluded.bot_total,
+                "last_click": func.greatest(
+                    ClickCounter.last_click, stmt.excluded.last_click
+                ),
+            },
+        )
     )
-    total_clicks = result.scalar()
 
-    # Get last click
-    result = await db.execute(
-        select(Click)
-        .where(Click.url_id == url.id)
-        .order_by(Click.created_at.desc())
-        .limit(1)
+
+async def create_click(click_data: SpooledClick) -> ClickDTO:
+    """Create a new click record on the shard of its link."""
+    shard = shard_router.for_short_code(click_data.short_code)
+    user_agents, referers = await _intern_clicks(shard, [click_data])
+    db_click = Click(**_click_values(click_data, user_agents, referers))
+    async with shard.session() as db:
+        db.add(db_click)
+        await db.flush()
+
+        click_dto = _click_dto(db_click, click_data)
+        await _add_to_counters(db, [click_dto])
+        await db.commit()
+    return click_dto
+
+
+async def create_clicks_bulk(clicks: list[SpooledClick]) -> list[ClickDTO]:
+    """Insert spooled clicks with one multi-row INSERT per shard, keeping click time.
+
+    Every click is added to the exact counters, but hot links store a raw row
+    only for a weighted sample of clicks (see src.click_sampling). Clicks of
+    links deleted since they were spooled are dropped. Shards commit
+    independently: if one fails, a retry of the batch may repeat clicks
+    already committed on the others.
+    """
+    groups = shard_router.group(clicks, lambda click: click.short_code)
+    results = await asyncio.gather(
+        *(
+            _create_clicks_on_shard(shard, shard_clicks)
+            for shard, shard_clicks in groups.items()
+        )
     )
-    last_click = result.scalar_one_or_none()
+    click_dtos = list(chain.from_iterable(results))
+    click_dtos.sort(key=lambda click_dto: click_dto.created_at)
+    return click_dtos
+
+
+async def _create_clicks_on_shard(
+    shard: Shard, clicks: list[SpooledClick]
+) -> list[ClickDTO]:
+    async with shard.session() as db:
+        url_ids = {click.url_id for click in clicks}
+        result = await db.execute(
+            select(URL.id).where(
+                URL.id
+                == any_(bindparam("url_ids", list(url_ids), type_=ARRAY(Integer)))
+            )
+        )
+        existing_ids = set(result.scalars())
+        clicks = [click for click in clicks if click.url_id in existing_ids]
+        if not clicks:
+            return []
+
+        click_dtos: list[ClickDTO] = []
+        stored: list[tuple[SpooledClick, int]] = []
+        for click in clicks:
+            weight = click_sampler.sample(click.url_id, click.created_at)
+            if weight is None:
+                click_dtos.append(_counted_click_dto(click))
+            else:
+                stored.append((click, weight))
+
+        if stored:
+            user_agents, referers = await _intern_clicks(
+                shard, [click for click, _ in stored]
+            )
+            rows = [
+                {
+                    **_click_values(click, user_agents, referers),
+                    "created_at": click.created_at,
+                    "sample_weight": weight,
+                }
+                for click, weight in stored
+            ]
+            result = await db.scalars(
+                insert(Click).returning(Click, sort_by_parameter_order=True), rows
+            )
+            click_dtos.extend(
+                _click_dto(db_click, click)
+                for db_click, (click, _) in zip(result.all(), stored)
+            )
+        await _add_to_counters(db, click_dtos)
+        await db.commit()
+        return click_dtos
+
+
+async def get_url_stats(short_code: str) -> URLStatsDTO | None:
+    """Get statistics for a URL."""
+    url = await get_url_by_short_code(short_code)
+    if not url:
+        return None
+
+    # Точные счетчики (строки clicks у горячих ссылок - только выборка)
+    async with shard_router.for_short_code(short_code).session() as db:
+        result = await db.execute(
+            select(ClickCounter).where(ClickCounter.url_id == url.id)
+        )
+        counter = result.scalar_one_or_none()
 
     # Generate short URL using settings
     protocol = "https" if settings.environment == "production" else "http"
@@ -117,38 +487,93 @@ async def get_url_stats(db: AsyncSession, short_code: str) -> URLStatsDTO | None
         short_code=url.short_code,
         original_url=url.original_url,
         short_url=short_url,
-        total_clicks=total_clicks,
+        total_clicks=counter.total if counter else 0,
         created_at=url.created_at,
-        last_click=last_click.created_at if last_click else None,
+        last_click=counter.last_click if counter else None,
+    )
+
+
+async def get_urls_stats(short_codes: list[str]) -> list[URLStatsDTO]:
+    """Get statistics for many URLs with one set-based query per shard."""
+    groups = shard_router.group(set(short_codes), lambda short_code: short_code)
+    results = await asyncio.gather(
+        *(
+            _get_urls_stats_on_shard(shard, shard_codes)
+            for shard, shard_codes in groups.items()
+        )
+    )
+    return list(chain.from_iterable(results))
+
+
+async def _get_urls_stats_on_shard(
+    shard: Shard, short_codes: list[str]
+) -> list[URLStatsDTO]:
+    # short_code = ANY(:short_codes) - один план запроса для любого числа кодов
+    codes_match = URL.short_code == any_(
+        bindparam("short_codes", short_codes, type_=ARRAY(String))
+    )
+    stmt = (
+        select(URL, ClickCounter.total, ClickCounter.last_click)
+        .outerjoin(ClickCounter, ClickCounter.url_id == URL.id)
+        .where(codes_match)
+    )
+    async with shard.session() as db:
+        result = (await db.execute(stmt)).all()
+
+    protocol = "https" if settings.environment == "production" else "http"
+    return [
+        URLStatsDTO(
+            url_id=url.id,
+            short_code=url.short_code,
+            original_url=url.original_url,
+            short_url=f"{protocol}://{settings.domain}/{url.short_code}",
+            total_clicks=total_clicks or 0,
+            created_at=url.created_at,
+            last_click=last_click,
+        )
+        for url, total_clicks, last_click in result
+    ]
+
+
+async def _count_by(
+    db: AsyncSession, column, condition, limit: int = 10
+) -> list[tuple[int, int]]:
+    """Count clicks (weighted by sampling) grouped by a small-integer column."""
+    result = await db.execute(
+        select(column, _weighted_count().label("clicks"))
+        .where(condition)
+        .group_by(column)
+        .order_by(_weighted_count().desc())
+        .limit(limit)
     )
+    return [(row[0], row.clicks) for row in result]
 
 
-async def get_url_detailed_stats(
-    db: AsyncSession, short_code: str
-) -> DetailedURLStats | None:
+async def get_url_detailed_stats(short_code: str) -> DetailedURLStats | None:
     """Get detailed statistics with chart data for a URL."""
-    url = await get_url_by_short_code(db, short_code)
+    url = await get_url_by_short_code(short_code)
     if not url:
         return None
 
-    # Get basic stats
-    result = await db.execute(
-        select(func.count(Click.id)).where(Click.url_id == url.id)
-    )
-    total_clicks = result.scalar()
+    async with shard_router.for_short_code(short_code).session() as db:
+        return await _get_detailed_stats(db, url)
+
+
+async def _get_detailed_stats(db: AsyncSession, url: URLDTO) -> DetailedURLStats:
 
+    # Basic stats: точные счетчики, графики - по взвешенной выборке строк
     result = await db.execute(
-        select(Click)
-        .where(Click.url_id == url.id)
-        .order_by(Click.created_at.desc())
-        .limit(1)
+        select(ClickCounter).where(ClickCounter.url_id == url.id)
     )
-    last_click = result.scalar_one_or_none()
+    counter = result.scalar_one_or_none()
 
     # Generate short URL using settings
     protocol = "https" if settings.environment == "production" else "http"
     short_url = f"{protocol}://{settings.domain}/{url.short_code}"
 
+    # Графики строим только по живым переходам (без ботов и превью)
+    human_click = and_(Click.url_id == url.id, Click.is_bot.is_(False))
+
     # Get daily clicks for last 7 days
     seven_days_ago = datetime.now() - timedelta(days=7)
     
@@ -156,11 +581,11 @@ async def get_url_detailed_stats(
     daily_clicks_stmt = (
         select(
             func.date(Click.created_at).label("date"),
-            func.count().label("clicks")
+            _weighted_count().label("clicks")
         )
         .where(
             and_(
-                Click.url_id == url.id,
+                human_click,
                 Click.created_at >= seven_days_ago
             )
         )
@@ -169,98 +594,92 @@ async def get_url_detailed_stats(
     )
     
     result = await db.execute(daily_clicks_stmt)
-    daily_clicks = [{"date": str(row.date), "clicks": row.clicks} for row in result]
+    daily_clicks = [
+        DailyClicks(date=str(row.date), clicks=row.clicks) for row in result
+    ]
 
     # Get hourly distribution using SQLAlchemy 2.0
     hourly_stmt = (
         select(
             extract("hour", Click.created_at).label("hour"),
-            func.count().label("clicks")
+            _weighted_count().label("clicks")
         )
-        .where(Click.url_id == url.id)
+        .where(human_click)
         .group_by(extract("hour", Click.created_at))
         .order_by(extract("hour", Click.created_at))
     )
     
     result = await db.execute(hourly_stmt)
     hourly_distribution = [
-        {"hour": int(row.hour), "clicks": row.clicks} for row in result
+        HourlyClicks(hour=int(row.hour), clicks=row.clicks) for row in result
     ]
 
-    # Get top user agents using SQLAlchemy 2.0
-    user_agent_stmt = (
-        select(
-            Click.user_agent,
-            func.count().label("clicks")
-        )
-        .where(
-            and_(
-                Click.url_id == url.id,
-                Click.user_agent.is_not(None),
-                Click.user_agent != ""
-            )
-        )
-        .group_by(Click.user_agent)
-        .order_by(func.count().desc())
-        .limit(10)
-    )
-    
-    result = await db.execute(user_agent_stmt)
+    # Top browsers, OS and devices: cheap GROUP BY over enum-coded columns
     top_user_agents = [
-        {"user_agent": row.user_agent, "clicks": row.clicks} for row in result
+        UserAgentClicks(
+            user_agent=BROWSER_LABELS[BrowserFamily(code)], clicks=clicks
+        )
+        for code, clicks in await _count_by(db, Click.ua_family, human_click)
+    ]
+    top_os = [
+        OSClicks(os=OS_LABELS[OSFamily(code)], clicks=clicks)
+        for code, clicks in await _count_by(db, Click.ua_os, human_click)
+    ]
+    devices = [
+        DeviceClicks(device=DEVICE_LABELS[DeviceType(code)], clicks=clicks)
+        for code, clicks in await _count_by(db, Click.ua_device, human_click)
     ]
 
     # Get regional clicks with real geolocation using SQLAlchemy 2.0
     regional_stmt = (
         select(
-            Click.ip_address,
-            func.count().label("clicks")
+            func.host(Click.ip_address).label("ip_address"),
+            _weighted_count().label("clicks")
         )
         .where(
             and_(
-                Click.url_id == url.id,
-                Click.ip_address.is_not(None),
-                Click.ip_address != ""
+                human_click,
+                Click.ip_address.is_not(None)
             )
         )
         .group_by(Click.ip_address)
-        .order_by(func.count().desc())
+        .order_by(_weighted_count().desc())
         .limit(20)
     )
     
     result = await db.execute(regional_stmt)
+    ip_clicks = [(row.ip_address, row.clicks) for row in result if row.ip_address]
     regional_clicks = []
 
-    # Используем реальную геолокацию для каждого IP
-    for row in result:
-        ip = row.ip_address
-        if ip:
-            print(f"🌍 Обрабатываем IP для статистики: {ip} ({row.clicks} переходов)")
-            # Получаем реальную геолокацию
-            location = await geolocation_service.get_location(ip)
-
-            regional_clicks.append(
-                {
-                    "country": location.get("country", "Неизвестно"),
-                    "region": location.get("region", "Неизвестно"),
-                    "city": location.get("city", "Неизвестно"),
-                    "latitude": location.get("latitude"),
-                    "longitude": location.get("longitude"),
-                    "clicks": row.clicks,
-                    "ip": ip,
-                }
+    # Геолокация всех IP разом: пакетный запрос + ограниченный параллелизм
+    locations = await geolocation_service.get_locations([ip for ip, _ in ip_clicks])
+    for ip, clicks in ip_clicks:
+        location = locations[ip]
+        regional_clicks.append(
+            RegionalClicks(
+                country=location.get("country") or "Неизвестно",
+                region=location.get("region") or "Неизвестно",
+                city=location.get("city") or "Неизвестно",
+                latitude=location.get("latitude"),
+                longitude=location.get("longitude"),
+                clicks=clicks,
+                ip=ip,
             )
+        )
 
     return DetailedURLStats(
         url_id=url.id,
         short_code=url.short_code,
         original_url=url.original_url,
         short_url=short_url,
-        total_clicks=total_clicks,
+        total_clicks=counter.total if counter else 0,
+        bot_clicks=counter.bot_total if counter else 0,
         created_at=url.created_at,
-        last_click=last_click.created_at if last_click else None,
+        last_click=counter.last_click if counter else None,
         daily_clicks=daily_clicks,
         hourly_distribution=hourly_distribution,
         top_user_agents=top_user_agents,
+        top_os=top_os,
+        devices=devices,
         regional_clicks=regional_clicks,
     )
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from src.config import settings
+from src.database import AsyncSessionLocal, create_engine_for, engine
+from src.models import ShardMapEntry
+from src.notifications import NotificationBus, notification_bus
+
+# Короткие коды раскладываются по бакетам, бакеты - по шардам (карта в шарде 0)
+SHARD_BUCKETS = 1024
+# urls.id на шарде i выдается последовательностью i + 1, i + 1 + STRIDE, ...,
+# поэтому id уникальны во всем кластере и не меняются при переносе ссылки
+SHARD_ID_STRIDE = 64
+
+SHARD_MAP_CHANNEL = "vibe_shard_map"
+# Как часто проверять, не переподключилось ли соединение LISTEN, с
+LISTEN_CHECK_INTERVAL = 0.5
+
+
+def shard_bucket(short_code: str) -> int:
+    """Bucket of a short code: low 12 bits of md5, modulo SHARD_BUCKETS."""
+    return int(hashlib.md5(short_code.encode()).hexdigest()[-3:], 16) % SHARD_BUCKETS
+
+
+def bucket_sql(column: str) -> str:
+    """SQL expression computing shard_bucket() of a text column in Postgres."""
+    return f"(('x' || right(md5({column}), 3))::bit(12)::int % {SHARD_BUCKETS})"
+
+
+def even_bucket_map(shard_count: int) -> list[int]:
+    """Contiguous, equally sized bucket ranges per shard."""
+    return [bucket * shard_count // SHARD_BUCKETS for bucket in range(SHARD_BUCKETS)]
+
+
+def initial_bucket_map() -> list[int]:
+    """Every bucket on shard 0, where an unsharded deployment keeps its links."""
+    return [0] * SHARD_BUCKETS
+
+
+async def load_bucket_map(shard_count: int) -> list[int]:
+    """Read the bucket -> shard map from shard 0; no rows - all on shard 0."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ShardMapEntry.shard).order_by(ShardMapEntry.bucket)
+        )
+        buckets = list(result.scalars())
+    if not buckets:
+        return initial_bucket_map()
+    _check_bucket_map(buckets, shard_count)
+    return buckets
+
+
+def _check_bucket_map(buckets: list[int], shard_count: int) -> None:
+    if len(buckets) != SHARD_BUCKETS or not all(
+        0 <= shard < shard_count for shard in buckets
+    ):
+        raise ValueError(f"Shard map does not match {shard_count} shards")
+
+
+async def save_bucket_map(buckets: list[int]) -> None:
+    """Store the map in shard 0 and broadcast it to workers on commit."""
+    # 1024 номера шардов меньше SHARD_ID_STRIDE - около 3 КБ, в NOTIFY помещается
+    payload = json.dumps(buckets, separators=(",", ":"))
+    stmt = insert(ShardMapEntry)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ShardMapEntry.bucket],
+                set_={"shard": stmt.excluded.shard},
+                where=ShardMapEntry.shard != stmt.excluded.shard,
+            ),
+            [
+                {"bucket": bucket, "shard": shard}
+                for bucket, shard in enumerate(buckets)
+            ],
+        )
+        await notification_bus.publish(db, SHARD_MAP_CHANNEL, payload)
+        await db.commit()
+
+
+@dataclass(eq=False)
+class Shard:
+    """One Postgres instance holding a subset of buckets (urls and their clicks)."""
+
+    index: int
+    engine: AsyncEngine
+    session: async_sessionmaker
+
+    def __repr__(self):
+        return f"<Shard({self.index})>"
+
+
+class ShardRouter:
+    """Routes links to shards by hash of their short code.
+
+    No directory lookup: short_code -> bucket is a hash, bucket -> shard is a
+    1024-entry map stored in shard 0 (`shard_map`). Resharding saves the map
+    and broadcasts it over LISTEN/NOTIFY, so workers switch as soon as the
+    transaction commits; after every (re)connect of the LISTEN connection the
+    map is re-read, since a change may have been missed. A link's clicks,
+    counters and dictionary rows live on the link's shard, so every per-link
+    query stays on one instance. Shard 0 is the main database, which also
+    holds shared tables and LISTEN/NOTIFY. Until a map is saved every bucket
+    is on shard 0; buckets move to other shards only through
+    `python -m src.reshard rebalance`, which copies them first.
+    """
+
+    def __init__(self, database_urls: list[str], bus: NotificationBus):
+        self.bus = bus
+        self.shards = [Shard(0, engine, AsyncSessionLocal)]
+        for index, database_url in enumerate(database_urls[1:], start=1):
+            shard_engine = create_engine_for(database_url)
+            self.shards.append(
+                Shard(
+                    index,
+                    shard_engine,
+                    async_sessionmaker(
+                        autocommit=False, autoflush=False, bind=shard_engine
+                    ),
+                )
+            )
+        # До start() (и с одним шардом) все бакеты в шарде 0
+        self._buckets = initial_bucket_map()
+        # Растет с каждым уведомлением: перечитывание не затирает более новую карту
+        self._map_version = 0
+        self._task: asyncio.Task | None = None
+        if len(self.shards) > 1:
+            bus.subscribe(SHARD_MAP_CHANNEL, self._on_map_changed)
+
+    def for_short_code(self, short_code: str) -> Shard:
+        return self.shards[self._buckets[shard_bucket(short_code)]]
+
+    def group[T](
+        self, items: Iterable[T], key: Callable[[T], str]
+    ) -> dict[Shard, list[T]]:
+        """Split items by the shard of their short code (key)."""
+        groups: dict[Shard, list[T]] = {}
+        for item in items:
+            groups.setdefault(self.for_short_code(key(item)), []).append(item)
+        return groups
+
+    async def gather[T](self, query: Callable[[Shard], Awaitable[T]]) -> list[T]:
+        """Scatter a query to every shard concurrently and gather the results."""
+        return list(await asyncio.gather(*(query(shard) for shard in self.shards)))
+
+    def _set_map(self, buckets: list[int]) -> None:
+        self._buckets = buckets
+        print(f"🗺️ Карта шардов обновлена: {self.stats()['buckets']}")
+
+    def _on_map_changed(self, payload: str) -> None:
+        buckets = json.loads(payload)
+        _check_bucket_map(buckets, len(self.shards))
+        self._map_version += 1
+        self._set_map(buckets)
+
+    async def reload_map(self) -> None:
+        """Re-read the map from shard 0 unless a newer one arrived meanwhile."""
+        version = self._map_version
+        buckets = await load_bucket_map(len(self.shards))
+        if version == self._map_version and buckets != self._buckets:
+            self._set_map(buckets)
+
+    async def start(self) -> None:
+        """Load the map (before taking traffic) and follow the LISTEN connection."""
+        if self._task is None and len(self.shards) > 1:
+            await self.reload_map()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for shard in self.shards[1:]:
+            await shard.engine.dispose()
+
+    async def _run(self) -> None:
+        listening_since = None
+        while True:
+            await asyncio.sleep(LISTEN_CHECK_INTERVAL)
+            # Новое соединение LISTEN: пока его не было, смену карты могли пропустить
+            if self.bus.listening_since in (None, listening_since):
+                continue
+            try:
+                await self.reload_map()
+                listening_since = self.bus.listening_since
+            except Exception as e:
+                print(f"❌ Ошибка чтения карты шардов: {e}")
+
+    def stats(self) -> dict:
+        buckets = [0] * len(self.shards)
+        for shard in self._buckets:
+            buckets[shard] += 1
+        return {"shards": len(self.shards), "buckets": buckets}
+
+
+# Глобальный роутер шардов
+shard_router = ShardRouter(
+    [settings.database_url, *settings.shard_urls], bus=notification_bus
+)
@@ -0,0 +1,237 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from src.bloom import BloomFilter
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.models import URL, WarmupSnapshot
+from src.notifications import NotificationBus, notification_bus
+from src.sharding import Shard, shard_router
+
+# Ключ advisory-lock: фильтр строит один воркер, остальные берут снимок
+FILTER_LOCK_ID = 0x56494245_424C4D  # "VIBE" "BLM"
+SNAPSHOT_KEY = "short_code_filter"
+# Запас на доставку NOTIFY и расхождение часов хостов
+EVENT_MARGIN_SECONDS = 5.0
+
+
+class ShortCodeFilter:
+    """Bloom filter of existing short codes.
+
+    A miss means the code does not exist, so the redirect can return 404
+    without touching the shard. The filter is correct only while it hears
+    every "url_created" event. It is dropped as soon as LISTEN disconnects,
+    and until it is rebuilt every code is treated as present.
+
+    One worker in the cluster scans urls. It hashes in a thread, off the
+    event loop, and stores the bits in warmup_snapshots. Other workers load
+    that snapshot if it was scanned after they started listening. They then
+    add the codes they heard of since the scan, kept in a short log of
+    recent events.
+    """
+
+    def __init__(
+        self,
+        bus: NotificationBus,
+        capacity: int,
+        error_rate: float,
+        rebuild_interval: float,
+    ):
+        self.bus = bus
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self._filter: BloomFilter | None = None
+        # Время скана, из которого собран текущий фильтр
+        self._scanned_at: float | None = None
+        # (unix time, code) созданных кодов - догоняем ими снимок другого воркера
+        self._recent: deque[tuple[float, str]] = deque()
+        self._task: asyncio.Task | None = None
+        self._rebuild_lock = asyncio.Lock()
+
+        bus.on_disconnect(self.disable)
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def might_exist(self, short_code: str) -> bool:
+        return self._filter is None or short_code in self._filter
+
+    def add(self, short_codes: set[str]) -> None:
+        """Add newly created codes (locally or from other workers)."""
+        now = time.time()
+        self._recent.extend((now, short_code) for short_code in short_codes)
+        if self._filter is not None:
+            for short_code in short_codes:
+                self._filter.add(short_code)
+
+    def disable(self) -> None:
+        """Stop answering misses: events are no longer being received."""
+        if self._filter is not None:
+            print("🌸 Bloom-фильтр отключен до переподключения LISTEN")
+        self._filter = None
+
+    def invalidate(self) -> None:
+        """Disable the filter and rebuild it from scratch."""
+        self._filter = None
+        asyncio.get_running_loop().create_task(self.rebuild())
+
+    def _prune_recent(self) -> None:
+        oldest = time.time() - self.rebuild_interval - 2 * EVENT_MARGIN_SECONDS
+        while self._recent and self._recent[0][0] < oldest:
+            self._recent.popleft()
+
+    async def rebuild(self) -> None:
+        """Load a fresh cluster-wide snapshot, or build one if there is none."""
+        async with self._rebuild_lock:
+            listening_since = self.bus.listening_since
+            if listening_since is None:
+                # Без LISTEN фильтр сразу устарел бы: ждем подключения
+                return
+            try:
+                bloom, scanned_at = await self._shared_filter(
+                    listening_since + EVENT_MARGIN_SECONDS
+                )
+            except Exception as e:
+                print(f"❌ Ошибка построения Bloom-фильтра: {e}")
+                return
+
+            if self.bus.listening_since != listening_since:
+                return  # LISTEN переподключался во время сборки
+            self._prune_recent()
+            caught_up = [
+                short_code
+                for received, short_code in self._recent
+                if received >= scanned_at - EVENT_MARGIN_SECONDS
+            ]
+            bloom.update(caught_up)
+            self._filter = bloom
+            self._scanned_at = scanned_at
+            print(
+                f"🌸 Bloom-фильтр short_code: {bloom.count} кодов, "
+                f"{bloom.memory_bytes / 1024 / 1024:.1f} МБ, "
+                f"FPR {bloom.false_positive_rate:.4%}"
+            )
+
+    async def _shared_filter(self, min_scanned_at: float) -> tuple[BloomFilter, float]:
+        """Snapshot scanned after `min_scanned_at` and within the rebuild interval.
+
+        Workers serialize on an advisory lock, so while one of them scans the
+        others wait for its snapshot instead of scanning too.
+        """
+        async with AsyncSessionLocal() as db:
+            await db.execute(select(func.pg_advisory_xact_lock(FILTER_LOCK_ID)))
+            now = (await db.scalar(select(func.now()))).timestamp()
+            result = await db.execute(
+                select(WarmupSnapshot.computed_at, WarmupSnapshot.payload).where(
+                    WarmupSnapshot.key == SNAPSHOT_KEY
+                )
+            )
+            snapshot = result.one_or_none()
+            if snapshot is not None:
+                scanned_at = snapshot.computed_at.timestamp()
+                params = snapshot.payload
+                if (
+                    scanned_at >= min_scanned_at
+                    and now - scanned_at < self.rebuild_interval
+                    and params["error_rate"] == self.error_rate
+                ):
+                    bits = await db.scalar(
+                        select(WarmupSnapshot.data).where(
+                            WarmupSnapshot.key == SNAPSHOT_KEY
+                        )
+                    )
+                    bloom = BloomFilter(params["capacity"], self.error_rate, bits)
+                    bloom.count = params["count"]
+                    return bloom, scanned_at
+
+            scan_started = await db.scalar(select(func.clock_timestamp()))
+            bloom = await self._scan()
+            stmt = insert(WarmupSnapshot).values(
+                key=SNAPSHOT_KEY,
+                computed_at=scan_started,
+                payload={
+                    "capacity": bloom.capacity,
+                    "error_rate": bloom.error_rate,
+                    "count": bloom.count,
+                },
+                data=bytes(bloom.bits),
+            )
+            await db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[WarmupSnapshot.key],
+                    set_={
+                        "computed_at": stmt.excluded.computed_at,
+                        "payload": stmt.excluded.payload,
+                        "data": stmt.excluded.data,
+                    },
+                )
+            )
+            await db.commit()
+            return bloom, scan_started.timestamp()
+
+    async def _scan(self) -> BloomFilter:
+        """Stream urls.short_code from every shard, hashing batches in a thread."""
+        totals = await shard_router.gather(self._count)
+        bloom = BloomFilter(max(self.capacity, int(sum(totals) * 1.5)), self.error_rate)
+        for shard in shard_router.shards:
+            async with shard.session() as db:
+                stream = await db.stream_scalars(
+                    select(URL.short_code).execution_options(yield_per=10_000)
+                )
+                async for batch in stream.partitions():
+                    await asyncio.to_thread(bloom.update, batch)
+        return bloom
+
+    @staticmethod
+    async def _count(shard: Shard) -> int:
+        async with shard.session() as db:
+            return await db.scalar(select(func.count(URL.id)))
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.rebuild()
+            # Пока фильтра нет (LISTEN не подключен, ошибка) - повторяем чаще
+            await asyncio.sleep(self.rebuild_interval if self.ready else 5.0)
+
+    def stats(self) -> dict:
+        if self._filter is None:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "items": self._filter.count,
+            "capacity": self._filter.capacity,
+            "memory_bytes": self._filter.memory_bytes,
+            "false_positive_rate": round(self._filter.false_positive_rate, 6),
+            "scanned_at": datetime.fromtimestamp(
+                self._scanned_at, timezone.utc
+            ).isoformat(),
+        }
+
+
+# Глобальный экземпляр фильтра
+short_code_filter = ShortCodeFilter(
+    notification_bus,
+    capacity=settings.short_code_filter_capacity,
+    error_rate=settings.short_code_filter_error_rate,
+    rebuild_interval=settings.short_code_filter_rebuild_interval,
+)
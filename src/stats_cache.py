@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from src.cache import LRUCache
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    """Serialized response body with its version and validator."""
+
+    version: str
+    body: bytes
+    etag: str
+    created: float = field(default_factory=time.monotonic)
+
+
+class ResponseCache:
+    """In-process memoization of serialized responses with stale-while-revalidate.
+
+    An entry is fresh while its version matches and it is younger than `ttl`.
+    A stale entry younger than `stale_ttl` is still served while a single
+    background task recomputes it; older or missing entries are computed
+    inline, with concurrent callers sharing one computation.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: LRUCache[str, CachedResponse] = LRUCache(maxsize)
+        self._in_flight: dict[str, asyncio.Task[CachedResponse | None]] = {}
+
+    async def get(
+        self,
+        key: str,
+        version: str,
+        compute: Callable[[], Awaitable[bytes | None]],
+    ) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.created
+            if entry.version == version and age < self.ttl:
+                return entry
+            if age < self.stale_ttl:
+                self._refresh(key, version, compute)
+                return entry
+
+        # shield: отключение клиента не должно отменять общий пересчет
+        return await asyncio.shield(self._refresh(key, version, compute))
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _refresh(
+        self,
+        key: str,
+        version: str,
+        compute: Callable[[], Awaitable[bytes | None]],
+    ) -> asyncio.Task[CachedResponse | None]:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._compute(key, version, compute))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._on_done(key, done))
+        return task
+
+    def _on_done(self, key: str, task: asyncio.Task[CachedResponse | None]) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ Ошибка пересчета {key}: {task.exception()}")
+
+    async def _compute(
+        self,
+        key: str,
+        version: str,
+        compute: Callable[[], Awaitable[bytes | None]],
+    ) -> CachedResponse | None:
+        body = await compute()
+        if body is None:
+            self._entries.pop(key)
+            return None
+        entry = CachedResponse(
+            version=version,
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+        )
+        self._entries.set(key, entry)
+        return entry
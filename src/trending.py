@@ -0,0 +1,260 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import Literal
+
+from src.click_stream import ClickStream, click_stream
+from src.config import settings
+from src.invalidation import CacheInvalidator, cache_invalidator
+from src.schemas import TrendingLink, TrendingLinks
+
+BUCKET_SECONDS = 60
+# Окно -> число минутных бакетов
+TRENDING_WINDOWS = {"5m": 5, "1h": 60, "24h": 1440}
+TrendingWindow = Literal["5m", "1h", "24h"]
+
+
+class TrendingTracker:
+    """Sliding-window click counts of all links with a periodic top-K.
+
+    Clicks come from the click stream, which delivers every worker's batches
+    to every worker, so each worker holds the same global view. Only human
+    clicks count: bots and link previews are left out. Deleted links are
+    dropped on their "url" invalidation events. Counts are
+    kept in a ring of per-minute buckets ({url_id: clicks}) plus a running
+    sum per window: a click adds to every window sum, and a bucket leaving a
+    window is subtracted from that window's sum. Every `refresh_interval`
+    the top-K of each window is taken with a heap and serialized once, so a
+    request only returns ready bytes.
+    """
+
+    def __init__(
+        self,
+        stream: ClickStream,
+        invalidator: CacheInvalidator,
+        top_k: int,
+        refresh_interval: float,
+        checkpoint_path: str,
+        checkpoint_interval: float,
+    ):
+        self.top_k = top_k
+        self.refresh_interval = refresh_interval
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.horizon = max(TRENDING_WINDOWS.values())
+        self._buckets: deque[tuple[int, dict[int, int]]] = deque()
+        self._sums: dict[str, dict[int, int]] = {w: {} for w in TRENDING_WINDOWS}
+        # Первая минута, еще входящая в окно (все более старые уже вычтены)
+        self._starts: dict[str, int] = {w: 0 for w in TRENDING_WINDOWS}
+        self._codes: dict[int, str] = {}
+        self._url_ids: dict[str, int] = {}
+        self._responses: dict[str, bytes] = {}
+        self._tasks: list[asyncio.Task] = []
+
+        stream.on_clicks(self.record)
+        # Пропущенные за разрыв LISTEN удаления уходят из окон сами; стирать
+        # из-за них сутки счетчиков дороже, поэтому clear только перерисовывает
+        invalidator.register("url", self.forget, self.refresh)
+
+    @staticmethod
+    def _minute(now: float | None = None) -> int:
+        return int((now or time.time()) // BUCKET_SECONDS)
+
+    def record(self, url_id: int, short_code: str, count: int, bots: int) -> None:
+        count -= bots
+        if count <= 0:
+            return
+        self._advance(self._minute())
+        counts = self._buckets[-1][1]
+        counts[url_id] = counts.get(url_id, 0) + count
+        for sums in self._sums.values():
+            sums[url_id] = sums.get(url_id, 0) + count
+        self._codes[url_id] = short_code
+        self._url_ids[short_code] = url_id
+
+    def forget(self, short_codes: set[str]) -> None:
+        """Drop deleted links from every bucket and window."""
+        url_ids = [
+            self._url_ids.pop(code) for code in short_codes if code in self._url_ids
+        ]
+        if not url_ids:
+            return
+        for url_id in url_ids:
+            self._codes.pop(url_id, None)
+            for _, counts in self._buckets:
+                counts.pop(url_id, None)
+            for sums in self._sums.values():
+                sums.pop(url_id, None)
+        self.refresh()
+
+    def _advance(self, minute: int) -> None:
+        """Open the bucket of `minute` and slide every window up to it."""
+        if self._buckets and self._buckets[-1][0] >= minute:
+            return
+        self._buckets.append((minute, {}))
+
+        for window, length in TRENDING_WINDOWS.items():
+            start = minute - length + 1
+            old_start = self._starts[window]
+            if start <= old_start:
+                continue
+            sums = self._sums[window]
+            for bucket_minute, counts in reversed(self._buckets):
+                if bucket_minute < old_start:
+                    break
+                if bucket_minute >= start:
+                    continue
+                for url_id, count in counts.items():
+                    left = sums.get(url_id, 0) - count
+                    if left > 0:
+                        sums[url_id] = left
+                    else:
+                        sums.pop(url_id, None)
+            self._starts[window] = start
+
+        oldest = minute - self.horizon + 1
+        while self._buckets[0][0] < oldest:
+            self._buckets.popleft()
+        longest = self._sums[max(TRENDING_WINDOWS, key=TRENDING_WINDOWS.get)]
+        if len(self._codes) > 2 * len(longest):
+            self._codes = {
+                url_id: code
+                for url_id, code in self._codes.items()
+                if url_id in longest
+            }
+            self._url_ids = {code: url_id for url_id, code in self._codes.items()}
+
+    def refresh(self) -> None:
+        """Recompute top-K of every window and serialize the responses."""
+        self._advance(self._minute())
+        generated_at = datetime.now(timezone.utc)
+        for window, sums in self._sums.items():
+            top = heapq.nlargest(self.top_k, sums.items(), key=itemgetter(1))
+            response = TrendingLinks(
+                window=window,
+                generated_at=generated_at,
+                links=[
+                    TrendingLink(short_code=self._codes[url_id], clicks=clicks)
+                    for url_id, clicks in top
+                ],
+            )
+            self._responses[window] = response.model_dump_json().encode()
+
+    def get(self, window: str) -> bytes:
+        if window not in self._responses:
+            self.refresh()
+        return self._responses[window]
+
+    def checkpoint(self) -> None:
+        """Write the buckets to disk, so a restarted worker keeps its windows."""
+        self._write_checkpoint(self._snapshot())
+
+    def _snapshot(self) -> dict:
+        return {
+            "buckets": [
+                [minute, {str(url_id): count for url_id, count in counts.items()}]
+                for minute, counts in self._buckets
+                if counts
+            ],
+            "codes": {str(url_id): code for url_id, code in self._codes.items()},
+        }
+
+    def _write_checkpoint(self, data: dict) -> None:
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        # Файл общий для воркеров: у каждого свой временный файл и атомарная замена
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _read_checkpoint(self) -> dict | None:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"❌ Не удалось прочитать чекпоинт трендов: {e}")
+            return None
+
+    def restore(self, data: dict) -> None:
+        """Merge a checkpoint in, dropping buckets that left all windows."""
+        minute = self._minute()
+        self._codes.update(
+            (int(url_id), code) for url_id, code in data["codes"].items()
+        )
+        self._url_ids = {code: url_id for url_id, code in self._codes.items()}
+        buckets = {bucket_minute: counts for bucket_minute, counts in self._buckets}
+        for bucket_minute, counts in data["buckets"]:
+            if bucket_minute <= minute - self.horizon or bucket_minute > minute:
+                continue
+            bucket = buckets.setdefault(bucket_minute, {})
+            for url_id, count in counts.items():
+                url_id = int(url_id)
+                bucket[url_id] = bucket.get(url_id, 0) + count
+                for window, length in TRENDING_WINDOWS.items():
+                    if bucket_minute > minute - length:
+                        sums = self._sums[window]
+                        sums[url_id] = sums.get(url_id, 0) + count
+        self._buckets = deque(sorted(buckets.items()))
+        for window, length in TRENDING_WINDOWS.items():
+            self._starts[window] = minute - length + 1
+        print(f"📈 Тренды восстановлены: {len(self._sums['24h'])} ссылок за сутки")
+
+    async def start(self) -> None:
+        if not self._tasks:
+            data = await asyncio.to_thread(self._read_checkpoint)
+            if data:
+                self.restore(data)
+            self.refresh()
+            self._tasks = [
+                asyncio.create_task(self._refresh_loop()),
+                asyncio.create_task(self._checkpoint_loop()),
+            ]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._tasks:
+            self._tasks = []
+            try:
+                self.checkpoint()
+            except OSError as e:
+                print(f"❌ Ошибка сохранения трендов: {e}")
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Ошибка пересчета трендов: {e}")
+
+    async def _checkpoint_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                # Снимок берем в цикле событий, на диск пишем в потоке
+                await asyncio.to_thread(self._write_checkpoint, self._snapshot())
+            except Exception as e:
+                print(f"❌ Ошибка сохранения трендов: {e}")
+
+
+# Глобальный экземпляр трендов
+trending_tracker = TrendingTracker(
+    click_stream,
+    cache_invalidator,
+    top_k=settings.trending_top_k,
+    refresh_interval=settings.trending_refresh_interval,
+    checkpoint_path=settings.trending_checkpoint_path,
+    checkpoint_interval=settings.trending_checkpoint_interval,
+)
@@ -0,0 +1,211 @@
+import re
+from dataclasses import dataclass
+from enum import IntEnum
+from functools import lru_cache
+
+
+class BrowserFamily(IntEnum):
+    """Client family stored in clicks.ua_family."""
+
+    OTHER = 0
+    CHROME = 1
+    FIREFOX = 2
+    SAFARI = 3
+    EDGE = 4
+    OPERA = 5
+    YANDEX = 6
+    SAMSUNG = 7
+    IE = 8
+    TELEGRAM = 20
+    SLACK = 21
+    WHATSAPP = 22
+    DISCORD = 23
+    FACEBOOK = 24
+    TWITTER = 25
+    VK = 26
+    GOOGLEBOT = 40
+    BINGBOT = 41
+    YANDEXBOT = 42
+    HTTP_CLIENT = 60
+    OTHER_BOT = 99
+
+
+class OSFamily(IntEnum):
+    """Operating system stored in clicks.ua_os."""
+
+    OTHER = 0
+    WINDOWS = 1
+    MACOS = 2
+    IOS = 3
+    ANDROID = 4
+    LINUX = 5
+    CHROME_OS = 6
+
+
+class DeviceType(IntEnum):
+    """Device type stored in clicks.ua_device."""
+
+    OTHER = 0
+    DESKTOP = 1
+    MOBILE = 2
+    TABLET = 3
+    BOT = 4
+
+
+BROWSER_LABELS = {
+    BrowserFamily.OTHER: "Другое",
+    BrowserFamily.CHROME: "Chrome",
+    BrowserFamily.FIREFOX: "Firefox",
+    BrowserFamily.SAFARI: "Safari",
+    BrowserFamily.EDGE: "Edge",
+    BrowserFamily.OPERA: "Opera",
+    BrowserFamily.YANDEX: "Яндекс Браузер",
+    BrowserFamily.SAMSUNG: "Samsung Internet",
+    BrowserFamily.IE: "Internet Explorer",
+    BrowserFamily.TELEGRAM: "Telegram",
+    BrowserFamily.SLACK: "Slack",
+    BrowserFamily.WHATSAPP: "WhatsApp",
+    BrowserFamily.DISCORD: "Discord",
+    BrowserFamily.FACEBOOK: "Facebook",
+    BrowserFamily.TWITTER: "Twitter",
+    BrowserFamily.VK: "VK",
+    BrowserFamily.GOOGLEBOT: "Googlebot",
+    BrowserFamily.BINGBOT: "Bingbot",
+    BrowserFamily.YANDEXBOT: "YandexBot",
+    BrowserFamily.HTTP_CLIENT: "HTTP-клиент",
+    BrowserFamily.OTHER_BOT: "Бот",
+}
+
+OS_LABELS = {
+    OSFamily.OTHER: "Другое",
+    OSFamily.WINDOWS: "Windows",
+    OSFamily.MACOS: "macOS",
+    OSFamily.IOS: "iOS",
+    OSFamily.ANDROID: "Android",
+    OSFamily.LINUX: "Linux",
+    OSFamily.CHROME_OS: "ChromeOS",
+}
+
+DEVICE_LABELS = {
+    DeviceType.OTHER: "Другое",
+    DeviceType.DESKTOP: "Компьютер",
+    DeviceType.MOBILE: "Телефон",
+    DeviceType.TABLET: "Планшет",
+    DeviceType.BOT: "Бот",
+}
+
+# Порядок важен: превью мессенджеров и краулеры проверяются раньше браузеров,
+# Edge/Opera/Яндекс - раньше Chrome, Chrome - раньше Safari
+_BOT_PATTERNS: list[tuple[re.Pattern, BrowserFamily]] = [
+    (re.compile(r"TelegramBot", re.I), BrowserFamily.TELEGRAM),
+    (re.compile(r"Slack(bot|-ImgProxy)", re.I), BrowserFamily.SLACK),
+    (re.compile(r"WhatsApp", re.I), BrowserFamily.WHATSAPP),
+    (re.compile(r"Discordbot", re.I), BrowserFamily.DISCORD),
+    (
+        re.compile(r"facebookexternalhit|Facebot|meta-externalagent", re.I),
+        BrowserFamily.FACEBOOK,
+    ),
+    (re.compile(r"Twitterbot", re.I), BrowserFamily.TWITTER),
+    (re.compile(r"vkShare", re.I), BrowserFamily.VK),
+    (
+        re.compile(r"Googlebot|Google-InspectionTool|APIs-Google", re.I),
+        BrowserFamily.GOOGLEBOT,
+    ),
+    (re.compile(r"bingbot|BingPreview", re.I), BrowserFamily.BINGBOT),
+    (
+        re.compile(r"YandexBot|YandexMobileBot|YandexImages", re.I),
+        BrowserFamily.YANDEXBOT,
+    ),
+    (
+        re.compile(
+            r"^(curl|Wget|python-requests|python-httpx|aiohttp|Go-http-client"
+            r"|okhttp|Java|axios|node-fetch|libwww-perl)",
+            re.I,
+        ),
+        BrowserFamily.HTTP_CLIENT,
+    ),
+    (
+        re.compile(
+            r"bot\b|crawl|spider|slurp|preview|HeadlessChrome|Lighthouse|monitor",
+            re.I,
+        ),
+        BrowserFamily.OTHER_BOT,
+    ),
+]
+
+_BROWSER_PATTERNS: list[tuple[re.Pattern, BrowserFamily]] = [
+    (re.compile(r"Edg(e|A|iOS)?/"), BrowserFamily.EDGE),
+    (re.compile(r"OPR/|Opera"), BrowserFamily.OPERA),
+    (re.compile(r"YaBrowser/"), BrowserFamily.YANDEX),
+    (re.compile(r"SamsungBrowser/"), BrowserFamily.SAMSUNG),
+    (re.compile(r"Firefox/|FxiOS/"), BrowserFamily.FIREFOX),
+    (re.compile(r"Chrome/|CriOS/|Chromium/"), BrowserFamily.CHROME),
+    (re.compile(r"MSIE |Trident/"), BrowserFamily.IE),
+    (re.compile(r"Version/[\d.]+.*Safari/"), BrowserFamily.SAFARI),
+]
+
+_OS_PATTERNS: list[tuple[re.Pattern, OSFamily]] = [
+    (re.compile(r"iPhone|iPad|iPod"), OSFamily.IOS),
+    (re.compile(r"Android"), OSFamily.ANDROID),
+    (re.compile(r"Windows"), OSFamily.WINDOWS),
+    (re.compile(r"CrOS"), OSFamily.CHROME_OS),
+    (re.compile(r"Mac OS X|Macintosh"), OSFamily.MACOS),
+    (re.compile(r"Linux|X11"), OSFamily.LINUX),
+]
+
+DESKTOP_OS = {OSFamily.WINDOWS, OSFamily.MACOS, OSFamily.LINUX, OSFamily.CHROME_OS}
+
+_TABLET_PATTERN = re.compile(r"iPad|Tablet|Android(?!.*Mobile)")
+_MOBILE_PATTERN = re.compile(r"Mobile|iPhone|iPod|Android")
+
+
+@dataclass(frozen=True, slots=True)
+class UserAgentInfo:
+    """Compact classification of a User-Agent string."""
+
+    family: BrowserFamily
+    os: OSFamily
+    device: DeviceType
+    is_bot: bool
+
+
+UNKNOWN_USER_AGENT = UserAgentInfo(
+    family=BrowserFamily.OTHER,
+    os=OSFamily.OTHER,
+    device=DeviceType.OTHER,
+    is_bot=False,
+)
+
+
+def _first_match[T](patterns: list[tuple[re.Pattern, T]], value: str) -> T | None:
+    for pattern, result in patterns:
+        if pattern.search(value):
+            return result
+    return None
+
+
+@lru_cache(maxsize=8192)
+def classify_user_agent(user_agent: str | None) -> UserAgentInfo:
+    """Classify a User-Agent; cached because a few hundred strings dominate traffic."""
+    if not user_agent:
+        return UNKNOWN_USER_AGENT
+
+    os_family = _first_match(_OS_PATTERNS, user_agent) or OSFamily.OTHER
+
+    bot_family = _first_match(_BOT_PATTERNS, user_agent)
+    if bot_family is not None:
+        return UserAgentInfo(
+            family=bot_family, os=os_family, device=DeviceType.BOT, is_bot=True
+        )
+
+    family = _first_match(_BROWSER_PATTERNS, user_agent) or BrowserFamily.OTHER
+    if _TABLET_PATTERN.search(user_agent):
+        device = DeviceType.TABLET
+    elif _MOBILE_PATTERN.search(user_agent):
+        device = DeviceType.MOBILE
+    elif os_family in DESKTOP_OS:
+        device = DeviceType.DESKTOP
+    else:
+        device = DeviceType.OTHER
+
+    return UserAgentInfo(family=family, os=os_family, device=device, is_bot=False)
@@ -1,44 +1,36 @@
+import ipaddress
+
 from fastapi import Request
 from typing import Optional
 
 
 def get_real_ip(request: Request) -> Optional[str]:
     """
-    Get real IP address from request, handling proxy headers.
-    
-    Priority order:
-    1. X-Forwarded-For (first IP in chain)
-    2. X-Real-IP
-    3. X-Client-IP
-    4. CF-Connecting-IP (Cloudflare)
-    5. request.client.host (fallback)
+    Get the client IP address resolved by uvicorn.
+
+    Proxy headers (X-Forwarded-For, X-Real-IP, ...) are set by the client
+    unless a proxy overwrites them, so they are never read here. uvicorn
+    takes the right-most untrusted X-Forwarded-For hop, and only from peers
+    listed in FORWARDED_ALLOW_IPS; otherwise this is the peer address.
     """
-    # Check X-Forwarded-For header
-    forwarded_for = request.headers.get("x-forwarded-for")
-    if forwarded_for:
-        # X-Forwarded-For can contain multiple IPs: "client, proxy1, proxy2"
-        # We want the first one (original client IP)
-        real_ip = forwarded_for.split(",")[0].strip()
-        if real_ip and real_ip != "unknown":
-            return real_ip
-    
-    # Check X-Real-IP header
-    real_ip = request.headers.get("x-real-ip")
-    if real_ip and real_ip != "unknown":
-        return real_ip
-    
-    # Check X-Client-IP header
-    client_ip = request.headers.get("x-client-ip")
-    if client_ip and client_ip != "unknown":
-        return client_ip
-    
-    # Check Cloudflare header
-    cf_ip = request.headers.get("cf-connecting-ip")
-    if cf_ip and cf_ip != "unknown":
-        return cf_ip
-    
-    # Fallback to request.client.host
     if request.client:
         return request.client.host
-    
-    return None 
\ No newline at end of file
+    return None
+
+
+def is_prefetch(request: Request) -> bool:
+    """Check if the request is a browser prefetch/prerender, not a real visit."""
+    purpose = request.headers.get("sec-purpose") or request.headers.get("purpose")
+    if purpose and ("prefetch" in purpose or "prerender" in purpose):
+        return True
+    return request.headers.get("x-moz") == "prefetch"
+
+
+def normalize_ip(ip: str | None) -> str | None:
+    """Return a canonical IP address string, or None if it is not a valid IP."""
+    if not ip:
+        return None
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
@@ -0,0 +1,15 @@
+import asyncpg
+import pytest
+
+from src.config import settings
+
+
+@pytest.fixture(scope="session")
+async def database_url() -> str:
+    """URL of a migrated test database; tests needing Postgres skip without it."""
+    try:
+        connection = await asyncpg.connect(settings.database_url, timeout=2)
+    except (OSError, asyncpg.PostgresError) as e:
+        pytest.skip(f"Postgres недоступен ({settings.database_url}): {e}")
+    await connection.close()
+    return settings.database_url
@@ -0,0 +1,77 @@
+import gzip
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from src.assets import AssetPipeline
+
+BODY = b"console.log('vibe');\n" * 50
+
+
+@pytest.fixture
+async def client(tmp_path):
+    static_dir, templates_dir = tmp_path / "static", tmp_path / "templates"
+    static_dir.mkdir()
+    templates_dir.mkdir()
+    (static_dir / "app.js").write_bytes(BODY)
+    for template in ("index.html", "links.html", "stats.html"):
+        (templates_dir / template).write_text(
+            "<script src=\"{{ static_url('app.js') }}\">"
+        )
+    pipeline = AssetPipeline(str(static_dir), str(templates_dir), "/static")
+    pipeline.build()
+
+    app = FastAPI()
+
+    @app.api_route("/static/{name:path}", methods=["GET", "HEAD"])
+    async def static_files(name: str, request: Request):
+        return pipeline.static_response(request, name)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        client.url = pipeline.static_url("app.js")
+        client.etag = pipeline._files["app.js"].etag
+        yield client
+
+
+async def test_head_has_headers_without_body(client):
+    response = await client.head(client.url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-length"] == str(
+        len(gzip.compress(BODY, 9, mtime=0))
+    )
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+async def test_range_is_served_from_the_identity_body(client):
+    response = await client.get(
+        client.url, headers={"Range": "bytes=10-19", "Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 206
+    assert response.content == BODY[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(BODY)}"
+    assert "content-encoding" not in response.headers
+
+    response = await client.get(client.url, headers={"Range": "bytes=-5"})
+    assert response.content == BODY[-5:]
+
+
+async def test_unsatisfiable_and_stale_ranges(client):
+    response = await client.get(client.url, headers={"Range": f"bytes={len(BODY)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(BODY)}"
+
+    # If-Range с другой версией: отдаем файл целиком
+    response = await client.get(
+        client.url, headers={"Range": "bytes=0-9", "If-Range": '"old"'}
+    )
+    assert response.status_code == 200
+    assert response.content == BODY
+
+    response = await client.get(
+        client.url, headers={"Range": "bytes=0-9", "If-Range": client.etag}
+    )
+    assert response.status_code == 206
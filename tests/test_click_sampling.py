@@ -0,0 +1,64 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from src.click_sampling import ClickSampler, click_sampler
+from src.config import settings
+
+START = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+
+
+def sampler(**overrides) -> ClickSampler:
+    options = {"threshold": 5.0, "min_rate": 0.01, "window": 10.0, "max_links": 100}
+    return ClickSampler(**(options | overrides))
+
+
+def clicks(per_second: float, seconds: float):
+    step = timedelta(seconds=1 / per_second)
+    return [START + step * i for i in range(int(per_second * seconds))]
+
+
+def test_slow_link_stores_every_click_with_weight_one():
+    slow = sampler()
+    weights = [slow.sample(1, at) for at in clicks(per_second=2, seconds=60)]
+    assert set(weights) == {1.0}
+
+
+def test_hot_link_keeps_about_threshold_rows_per_second_unbiased():
+    random.seed(42)
+    hot = sampler(threshold=20.0)
+    timestamps = clicks(per_second=200, seconds=60)
+    weights = [hot.sample(1, at) for at in timestamps]
+    kept = [weight for weight in weights if weight is not None]
+
+    # После разгона окна строк около порога в секунду, а не 200
+    assert len(kept) < len(timestamps) / 5
+    # Сумма весов выборки оценивает все переходы (стандартное отклонение ~3%)
+    assert abs(sum(kept) - len(timestamps)) / len(timestamps) < 0.1
+    assert hot.stats()["sampled_links"] == 1
+
+
+def test_probability_does_not_fall_below_min_rate():
+    hot = sampler(min_rate=0.5)
+    weights = [hot.sample(1, at) for at in clicks(per_second=1000, seconds=30)]
+    assert max(weight for weight in weights if weight is not None) <= 2.0
+
+
+def test_out_of_order_clicks_do_not_lower_the_rate():
+    link = sampler()
+    link.velocity(1, START + timedelta(seconds=10))
+    rate = link.velocity(1, START)
+    assert rate > link.velocity(2, START)
+    assert link.velocity(1, START + timedelta(seconds=10)) > rate
+
+
+def test_tracked_links_are_bounded():
+    bounded = sampler(max_links=3)
+    for url_id in range(10):
+        bounded.sample(url_id, START)
+    assert bounded.stats()["tracked_links"] == 3
+
+
+def test_global_sampler_uses_settings():
+    assert click_sampler.threshold == settings.click_sampling_threshold
+    assert click_sampler.min_rate == settings.click_sampling_min_rate
+    assert click_sampler.window == settings.click_sampling_window
@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src import click_spool
+from src.click_spool import ClickSpool, SpoolLog
+from src.schemas import SpooledClick
+
+
+def test_append_leaves_msync_to_the_caller(tmp_path):
+    log = SpoolLog(tmp_path, segment_size=64)
+    for i in range(5):
+        log.append(b"x" * 20 + bytes([i]))
+    assert log.write_segment == 2
+
+    # Все сегменты с записями, включая заполненные, ждут сброса
+    segments = log.unflushed()
+    assert len(segments) == 3
+    SpoolLog.flush(segments)
+    assert log.unflushed() == []
+
+    log.close()
+    reopened = SpoolLog(tmp_path, segment_size=64)
+    records, _ = reopened.read(10)
+    assert records == [b"x" * 20 + bytes([i]) for i in range(5)]
+    reopened.close()
+
+
+POISON_URL_ID = 13
+
+
+def spooled(url_id: int) -> SpooledClick:
+    return SpooledClick(
+        url_id=url_id,
+        short_code=f"code{url_id}",
+        ip_address="203.0.113.7",
+        created_at=datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc),
+    )
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Stands in for create_clicks_bulk: rejects the poison click or everything."""
+    state = SimpleNamespace(available=True, stored=[])
+
+    async def create_clicks_bulk(clicks):
+        if not state.available:
+            raise ConnectionRefusedError("database is down")
+        if any(click.url_id == POISON_URL_ID for click in clicks):
+            raise ValueError("value out of range")
+        state.stored.extend(click.url_id for click in clicks)
+        return []
+
+    async def databases_available():
+        return state.available
+
+    monkeypatch.setattr(click_spool, "create_clicks_bulk", create_clicks_bulk)
+    monkeypatch.setattr(click_spool, "_databases_available", databases_available)
+    return state
+
+
+def spool_with(tmp_path, url_ids: list[int]) -> tuple[ClickSpool, SpoolLog]:
+    spool = ClickSpool(
+        str(tmp_path),
+        segment_size=4096,
+        batch_size=100,
+        replay_interval=0.1,
+        max_attempts=3,
+    )
+    log = SpoolLog(tmp_path / "slot-0", segment_size=4096)
+    for url_id in url_ids:
+        log.append(spooled(url_id).model_dump_json().encode())
+    return spool, log
+
+
+async def test_poison_batch_goes_to_dead_letter_after_max_attempts(tmp_path, database):
+    spool, log = spool_with(tmp_path, [1, 2, POISON_URL_ID, 4])
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await spool._replay(log)
+    assert log.read_offset == (0, 0)
+
+    assert await spool._replay(log) == 4
+    assert database.stored == [1, 2, 4]
+    assert not log.has_pending
+    dead = (log.directory / "dead-letter.jsonl").read_bytes().splitlines()
+    assert [SpooledClick.model_validate_json(line).url_id for line in dead] == [
+        POISON_URL_ID
+    ]
+    log.close()
+
+
+async def test_batch_is_kept_while_the_database_is_down(tmp_path, database):
+    database.available = False
+    spool, log = spool_with(tmp_path, [1, POISON_URL_ID])
+    for _ in range(10):
+        with pytest.raises(ConnectionRefusedError):
+            await spool._replay(log)
+    assert log.read_offset == (0, 0)
+    assert not (log.directory / "dead-letter.jsonl").exists()
+
+    # БД вернулась: счетчик попыток продолжается, ядовитая запись отделяется
+    database.available = True
+    assert await spool._replay(log) == 2
+    assert database.stored == [1]
+    log.close()
+
+
+async def test_unparsable_record_goes_to_dead_letter(tmp_path, database):
+    spool, log = spool_with(tmp_path, [1])
+    log.append(b'{"url_id": "not a number"}')
+    assert await spool._replay(log) == 2
+    assert database.stored == [1]
+    dead = (log.directory / "dead-letter.jsonl").read_bytes()
+    assert dead == b'{"url_id": "not a number"}\n'
+    log.close()
@@ -0,0 +1,122 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from src.click_stream import CLICKS_CHANNEL, WATCH_CHANNEL, ClickStream
+from src.schemas import ClickDTO
+
+
+class RecordingBus:
+    """NotificationBus double: keeps published payloads instead of sending them."""
+
+    def __init__(self):
+        self.listening_since: float | None = None
+        self.handlers: dict[str, list] = {}
+        self.published: list[tuple[str, dict]] = []
+
+    def subscribe(self, channel, handler):
+        self.handlers.setdefault(channel, []).append(handler)
+
+    def on_reconnect(self, handler):
+        pass
+
+    async def publish(self, db, channel, payload):
+        self.published.append((channel, json.loads(payload)))
+
+    def deliver(self):
+        """Loop published notifications back, like LISTEN on the same database."""
+        published, self.published = self.published, []
+        for channel, message in published:
+            for handler in self.handlers.get(channel, []):
+                handler(json.dumps(message))
+        return published
+
+
+def click(url_id: int, is_bot: bool = False) -> ClickDTO:
+    return ClickDTO(
+        id=1,
+        url_id=url_id,
+        ip_address=None,
+        user_agent=None,
+        referer=None,
+        ua_family=0,
+        ua_os=0,
+        ua_device=0,
+        is_bot=is_bot,
+        sample_weight=1,
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+async def test_unwatched_links_are_published_only_as_counts():
+    bus = RecordingBus()
+    stream = ClickStream(bus)
+    stream.record("abc", click(1))
+
+    await stream.publish(counts=False)
+    assert bus.published == []
+
+    await stream.publish(counts=True)
+    assert bus.published == [(CLICKS_CHANNEL, {"1": {"code": "abc", "count": 1}})]
+
+
+async def test_listeners_get_bot_counts():
+    bus = RecordingBus()
+    stream, other = ClickStream(bus), ClickStream(bus)
+    received = []
+    other.on_clicks(lambda *batch: received.append(batch))
+
+    stream.record("abc", click(1))
+    stream.record("abc", click(1, is_bot=True))
+    await stream.publish(counts=True)
+    bus.deliver()
+    assert received == [(1, "abc", 2, 1)]
+
+
+async def test_links_watched_on_another_worker_are_published_with_events():
+    bus = RecordingBus()
+    stream, other = ClickStream(bus), ClickStream(bus)
+
+    async with other.subscribe(1) as queue:
+        assert bus.deliver() == [(WATCH_CHANNEL, {"watch": [1]})]
+        stream.record("abc", click(1))
+        stream.record("xyz", click(2))
+        await stream.publish(counts=False)
+
+        [(channel, batch)] = bus.deliver()
+        assert channel == CLICKS_CHANNEL
+        assert list(batch) == ["1"]
+        assert len(batch["1"]["events"]) == 1
+        message = queue.get_nowait()
+        assert json.loads(message.split("data: ")[1])["new_clicks"] == 1
+
+
+async def test_subscriber_gets_counts_before_its_announcement_arrives():
+    bus = RecordingBus()
+    stream, other = ClickStream(bus), ClickStream(bus)
+
+    async with other.subscribe(1) as queue:
+        bus.published.clear()  # объявление еще не доставлено
+        stream.record("abc", click(1))
+        await stream.publish(counts=True)
+        bus.deliver()
+        data = json.loads(queue.get_nowait().split("data: ")[1])
+        assert data == {"new_clicks": 1, "events": []}
+
+
+async def test_new_listen_connection_asks_workers_to_announce_again():
+    bus = RecordingBus()
+    stream, other = ClickStream(bus), ClickStream(bus)
+
+    async with other.subscribe(7):
+        bus.published.clear()  # объявление потеряно: stream еще не слушал
+        bus.listening_since = 1.0
+        await stream._tick()
+        assert bus.deliver() == [(WATCH_CHANNEL, {"watch": [], "hello": True})]
+        # other отвечает фоновой задачей
+        for _ in range(10):
+            if bus.published:
+                break
+            await asyncio.sleep(0.01)
+        assert bus.deliver() == [(WATCH_CHANNEL, {"watch": [7]})]
+        assert stream.is_watched(7)
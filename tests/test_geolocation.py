@@ -0,0 +1,144 @@
+import asyncio
+import socket
+import time
+
+import pytest
+import uvicorn
+from fastapi import FastAPI, HTTPException
+
+from src.geolocation import (
+    GeolocationProvider,
+    GeolocationService,
+    IpApiComProvider,
+    IpapiCoProvider,
+)
+
+
+class StubProviders:
+    """Local HTTP server speaking the ip-api.com and ipapi.co protocols.
+
+    Each provider lives under its own prefix; `delay` and `fail` change its
+    behaviour per test, `requests` counts calls per provider.
+    """
+
+    def __init__(self):
+        self.delay = {"ip-api": 0.0, "ipapi": 0.0}
+        self.fail = {"ip-api": False, "ipapi": False}
+        self.requests = {"ip-api": 0, "ipapi": 0}
+        self.app = FastAPI()
+        self.app.get("/ip-api/json/{ip}")(self.ip_api_single)
+        self.app.post("/ip-api/batch")(self.ip_api_batch)
+        self.app.get("/ipapi/{ip}/json/")(self.ipapi_single)
+
+    async def _handle(self, provider: str) -> None:
+        self.requests[provider] += 1
+        await asyncio.sleep(self.delay[provider])
+        if self.fail[provider]:
+            raise HTTPException(status_code=503)
+
+    @staticmethod
+    def _ip_api(ip: str) -> dict:
+        return {
+            "status": "success",
+            "query": ip,
+            "country": "Нидерланды",
+            "regionName": "Северная Голландия",
+            "city": "Амстердам",
+            "lat": 52.37,
+            "lon": 4.89,
+        }
+
+    async def ip_api_single(self, ip: str) -> dict:
+        await self._handle("ip-api")
+        return self._ip_api(ip)
+
+    async def ip_api_batch(self, queries: list[dict]) -> list[dict]:
+        await self._handle("ip-api")
+        return [self._ip_api(query["query"]) for query in queries]
+
+    async def ipapi_single(self, ip: str) -> dict:
+        await self._handle("ipapi")
+        return {"country_name": "Германия", "region": "Гессен", "city": "Франкфурт"}
+
+
+@pytest.fixture
+async def stub():
+    stub = StubProviders()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(stub.app, log_level="warning"))
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+    stub.url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    yield stub
+    server.should_exit = True
+    await task
+
+
+@pytest.fixture
+async def service(stub):
+    service = GeolocationService(
+        providers=[
+            IpApiComProvider(f"{stub.url}/ip-api"),
+            IpapiCoProvider(f"{stub.url}/ipapi"),
+        ],
+        timeout=2.0,
+        hedge_delay=0.05,
+    )
+    yield service
+    await service.close()
+
+
+def test_provider_must_implement_lookup():
+    with pytest.raises(TypeError):
+        GeolocationProvider("http://example.com")
+
+
+async def test_many_ips_resolved_by_one_batch_request(stub, service):
+    ips = [f"8.8.{i}.{i}" for i in range(50)]
+    locations = await service.get_locations(ips)
+    assert {locations[ip]["city"] for ip in ips} == {"Амстердам"}
+    assert stub.requests == {"ip-api": 1, "ipapi": 0}
+
+
+async def test_slow_provider_is_hedged(stub, service):
+    stub.delay["ip-api"] = 1.0
+    started = time.monotonic()
+    location = await service.get_location("8.8.8.8")
+    assert location["city"] == "Франкфурт"
+    assert time.monotonic() - started < 0.5
+
+
+async def test_half_open_breaker_lets_a_single_probe_through(stub, service):
+    ip_api = service.providers[0]
+    ip_api.breaker.reset_timeout = 0.2
+    stub.fail["ip-api"] = True
+    for i in range(ip_api.breaker.failure_threshold):
+        await service.get_location(f"1.1.1.{i}")
+    assert not ip_api.breaker.available
+
+    # Пока открыт - провайдер не вызывается вовсе
+    failed_calls = stub.requests["ip-api"]
+    await service.get_locations([f"9.9.9.{i}" for i in range(5)])
+    assert stub.requests["ip-api"] == failed_calls
+
+    # Half-open: из десяти параллельных запросов до провайдера доходит один
+    await asyncio.sleep(0.25)
+    stub.fail["ip-api"] = False
+    await asyncio.gather(*(service.get_location(f"8.8.4.{i}") for i in range(10)))
+    assert stub.requests["ip-api"] == failed_calls + 1
+    assert ip_api.breaker.opened_at is None
+
+
+async def test_cancelled_probe_frees_the_slot(stub, service):
+    ip_api = service.providers[0]
+    ip_api.breaker.failures = ip_api.breaker.failure_threshold
+    ip_api.breaker.opened_at = time.monotonic() - ip_api.breaker.reset_timeout
+    stub.delay["ip-api"] = 1.0
+
+    # Пробу отменяет хеджирование: ответил второй провайдер
+    location = await service.get_location("8.8.8.8")
+    assert location["city"] == "Франкфурт"
+    await asyncio.sleep(0.01)  # отмена пробы доходит до задачи
+    assert ip_api.breaker.available
@@ -0,0 +1,66 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import event, select
+
+from src.database import AsyncSessionLocal, engine
+from src.interning import Interner
+from src.models import UserAgent
+from src.sharding import shard_router
+
+
+@pytest.fixture
+def interner(database_url) -> Interner:
+    return Interner(UserAgent, maxsize=100)
+
+
+@pytest.fixture
+def statements():
+    executed: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+async def test_batch_of_misses_is_resolved_in_one_query(interner, statements):
+    shard = shard_router.shards[0]
+    prefix = uuid.uuid4().hex
+    values = [f"{prefix} agent {i}" for i in range(50)]
+    # Часть значений уже есть в словаре (например, записана другим воркером)
+    existing = await Interner(UserAgent, maxsize=100).get_ids(shard, values[:10])
+
+    statements.clear()
+    ids = await interner.get_ids(shard, [*values, None, "", values[0]])
+    resolving = [sql for sql in statements if "user_agents" in sql]
+    assert len(resolving) == 1
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(UserAgent.value, UserAgent.id).where(UserAgent.value.in_(values))
+        )
+        assert ids == dict(result.all())
+    assert {value: ids[value] for value in values[:10]} == existing
+
+    # Повторно - только из кэша
+    statements.clear()
+    assert await interner.get_ids(shard, values) == ids
+    assert not statements
+
+
+async def test_concurrent_batches_agree_on_ids(database_url):
+    shard = shard_router.shards[0]
+    prefix = uuid.uuid4().hex
+    values = [f"{prefix} agent {i}" for i in range(200)]
+    results = await asyncio.gather(
+        *(
+            Interner(UserAgent, maxsize=1000).get_ids(shard, values[i::-1] + values)
+            for i in range(0, 200, 40)
+        )
+    )
+    assert all(ids == results[0] for ids in results)
+    assert set(results[0]) == set(values)
@@ -0,0 +1,61 @@
+import asyncio
+import multiprocessing
+import queue
+
+import pytest
+
+from src.invalidation import cache_invalidator
+
+
+def _listen(ready, received) -> None:
+    """Worker process: evicted keys go to `received`."""
+
+    async def main() -> None:
+        from src.invalidation import cache_invalidator
+        from src.notifications import notification_bus
+
+        cache_invalidator.register(
+            "url", lambda keys: received.put(sorted(keys)), lambda: None
+        )
+        await notification_bus.start()
+        ready.set()
+        await asyncio.sleep(60)
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def worker():
+    context = multiprocessing.get_context("spawn")
+    ready, received = context.Event(), context.Queue()
+    process = context.Process(target=_listen, args=(ready, received), daemon=True)
+    process.start()
+    assert ready.wait(30)
+    yield received
+    process.terminate()
+    process.join()
+
+
+async def _publish_until_received(received, kind: str, keys: list[str]) -> list:
+    # LISTEN в другом процессе поднимается не мгновенно: повторяем публикацию
+    for _ in range(50):
+        await cache_invalidator.publish_after_commit(kind, keys)
+        try:
+            return await asyncio.to_thread(received.get, timeout=0.2)
+        except queue.Empty:
+            continue
+    raise AssertionError("событие не дошло до другого процесса")
+
+
+async def test_eviction_reaches_other_process(database_url, worker):
+    assert await _publish_until_received(worker, "url", ["abc", "xyz"]) == [
+        "abc",
+        "xyz",
+    ]
+
+
+async def test_other_kinds_do_not_evict(database_url, worker):
+    await _publish_until_received(worker, "url", ["warm"])
+    await cache_invalidator.publish_after_commit("url_created", ["new"])
+    await cache_invalidator.publish_after_commit("url", ["gone"])
+    assert await asyncio.to_thread(worker.get, timeout=5) == ["gone"]
@@ -0,0 +1,189 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from src import online_migrations
+from src.online_migrations import (
+    PROGRESS_TABLE,
+    add_shadow_column,
+    backfill,
+    change_column_type,
+    copy_indexes_to_shadow,
+    create_index_concurrently,
+    swap_shadow_column,
+)
+
+
+@pytest.fixture
+def migration(database_url):
+    """Alembic operations on a scratch table of 25 rows (id, value, created)."""
+    engine = sa.create_engine(database_url)
+    table = f"online_migration_test_{uuid.uuid4().hex[:8]}"
+    with engine.connect() as conn:
+        conn.exec_driver_sql(
+            f"CREATE TABLE {table} "
+            "(id serial PRIMARY KEY, value integer, created timestamp)"
+        )
+        conn.exec_driver_sql(
+            f"INSERT INTO {table} (value, created) "
+            "SELECT g, timestamp '2026-10-19 12:00' + g * interval '1 minute' "
+            "FROM generate_series(1, 25) g"
+        )
+        conn.commit()
+        with Operations.context(MigrationContext.configure(conn)):
+            yield SimpleNamespace(conn=conn, table=table)
+        conn.rollback()
+        conn.exec_driver_sql(f"DROP TABLE {table}")
+        conn.exec_driver_sql(f"DROP FUNCTION IF EXISTS {table}_created_shadow_sync()")
+        conn.execute(
+            sa.text(f"DELETE FROM {PROGRESS_TABLE} WHERE starts_with(job, :table)"),
+            {"table": table},
+        )
+        conn.commit()
+    engine.dispose()
+
+
+def execute(migration, sql: str) -> sa.CursorResult:
+    result = migration.conn.execute(sa.text(sql))
+    migration.conn.commit()
+    return result
+
+
+def rows(migration, sql: str) -> list:
+    return execute(migration, sql).all()
+
+
+def indexes(migration) -> dict[str, str]:
+    return dict(
+        rows(
+            migration,
+            "SELECT indexname, indexdef FROM pg_indexes "
+            f"WHERE tablename = '{migration.table}'",
+        )
+    )
+
+
+def column_type(migration, column: str) -> str:
+    return rows(
+        migration,
+        "SELECT data_type FROM information_schema.columns "
+        f"WHERE table_name = '{migration.table}' AND column_name = '{column}'",
+    )[0][0]
+
+
+def test_backfill_walks_keys_in_batches_and_resumes(migration):
+    table = migration.table
+    # Прерванный прогон дошел до id 20
+    backfill(table, "value = -value", job=table, batch_size=10, pause=0)
+    execute(migration, f"UPDATE {table} SET value = abs(value)")
+    execute(
+        migration,
+        f"INSERT INTO {PROGRESS_TABLE} (job, last_key, rows_done) "
+        f"VALUES ('{table}', 20, 20)",
+    )
+
+    done = backfill(
+        table,
+        "value = value * 10",
+        job=table,
+        where="value > 22",
+        batch_size=2,
+        pause=0,
+    )
+    assert done == 20 + 3
+    assert rows(
+        migration, f"SELECT id FROM {table} WHERE value >= 230 ORDER BY id"
+    ) == [
+        (23,),
+        (24,),
+        (25,),
+    ]
+    assert (
+        rows(migration, f"SELECT 1 FROM {PROGRESS_TABLE} WHERE job = '{table}'") == []
+    )
+
+
+def test_create_index_concurrently_is_idempotent(migration):
+    table = migration.table
+    for _ in range(2):
+        create_index_concurrently(
+            f"ix_{table}_value", table, ["value"], where="value IS NOT NULL"
+        )
+    assert "WHERE (value IS NOT NULL)" in indexes(migration)[f"ix_{table}_value"]
+    assert rows(
+        migration,
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        f"WHERE c.relname = 'ix_{table}_value'",
+    ) == [(True,)]
+
+
+def test_change_column_type_keeps_indexes_and_new_writes(migration):
+    table = migration.table
+    create_index_concurrently(f"ix_{table}_created", table, ["created"])
+    create_index_concurrently(
+        f"ix_{table}_recent", table, ["value"], where="created IS NOT NULL"
+    )
+
+    add_shadow_column(
+        table, "created", "timestamptz", using="{column} AT TIME ZONE 'UTC'", pause=0
+    )
+    # Запись между заполнением и подменой переносит триггер
+    execute(
+        migration, f"INSERT INTO {table} (value, created) VALUES (26, '2026-10-20')"
+    )
+    copy_indexes_to_shadow(table, "created")
+    swap_shadow_column(table, "created")
+
+    assert column_type(migration, "created") == "timestamp with time zone"
+    assert set(indexes(migration)) == {
+        f"{table}_pkey",
+        f"ix_{table}_created",
+        f"ix_{table}_recent",
+    }
+    assert "(created)" in indexes(migration)[f"ix_{table}_created"]
+    assert "WHERE (created IS NOT NULL)" in indexes(migration)[f"ix_{table}_recent"]
+    assert (
+        rows(
+            migration,
+            f"SELECT count(*), max(created) FROM {table} "
+            "WHERE created >= timestamptz '2026-10-19 12:01+00'",
+        )[0][0]
+        == 26
+    )
+
+
+def test_swap_refuses_to_drop_uncopied_indexes_or_constraints(migration):
+    table = migration.table
+    create_index_concurrently(f"ix_{table}_created", table, ["created"])
+    add_shadow_column(table, "created", "timestamptz", pause=0)
+    with pytest.raises(RuntimeError, match="copy_indexes_to_shadow"):
+        swap_shadow_column(table, "created")
+
+    execute(
+        migration,
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_recent "
+        "CHECK (created > '2000-01-01')",
+    )
+    with pytest.raises(RuntimeError, match=f"{table}_recent"):
+        change_column_type(table, "created", "timestamptz", pause=0)
+    assert column_type(migration, "created") == "timestamp without time zone"
+    assert f"ix_{table}_created" in indexes(migration)
+
+
+def test_hidden_replication_lag_is_reported(migration, monkeypatch, capsys):
+    monkeypatch.setattr(online_migrations, "_lag_hidden_reported", False)
+    conn = migration.conn
+    role = f"{migration.table}_reader"
+    conn.exec_driver_sql(f"CREATE ROLE {role}")
+    try:
+        conn.exec_driver_sql(f"SET ROLE {role}")
+        for _ in range(2):
+            assert online_migrations._replication_lag(conn) == 0.0
+        conn.exec_driver_sql("RESET ROLE")
+    finally:
+        conn.rollback()
+    assert capsys.readouterr().out.count("pg_read_all_stats") == 1
@@ -0,0 +1,118 @@
+import time
+
+import httpx
+import pytest
+from sqlalchemy import delete
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from src import rate_limit
+from src.database import AsyncSessionLocal
+from src.models import RateLimitHit
+from src.rate_limit import WINDOW_SECONDS, RateLimiter, RateLimitRule
+from src.utils import get_real_ip
+
+
+def make_limiter(per_minute: int = 2, **kwargs) -> RateLimiter:
+    return RateLimiter({"redirect": RateLimitRule(per_minute)}, **kwargs)
+
+
+def test_spraying_new_ips_does_not_reset_active_clients():
+    limiter = make_limiter(max_keys=3)
+    assert limiter.hit("redirect", "1.1.1.1")
+    assert limiter.hit("redirect", "1.1.1.1")
+    assert not limiter.hit("redirect", "1.1.1.1")
+
+    for i in range(100):
+        limiter.hit("redirect", f"10.0.0.{i}")
+        # Активный клиент продолжает стучаться и не вытесняется
+        assert not limiter.hit("redirect", "1.1.1.1")
+    assert len(limiter._buckets) == 3
+
+
+def test_hits_are_counted_in_the_window_of_the_request(monkeypatch):
+    limiter = make_limiter(per_minute=100, shared=True)
+    monkeypatch.setattr(time, "time", lambda: 10 * WINDOW_SECONDS + 59.5)
+    limiter.hit("redirect", "1.1.1.1")
+    monkeypatch.setattr(time, "time", lambda: 11 * WINDOW_SECONDS + 0.5)
+    limiter.hit("redirect", "1.1.1.1")
+    assert limiter._unsynced == {
+        ("redirect", "1.1.1.1", 10 * WINDOW_SECONDS): 1,
+        ("redirect", "1.1.1.1", 11 * WINDOW_SECONDS): 1,
+    }
+
+
+async def test_failed_sync_puts_hits_back():
+    limiter = make_limiter(per_minute=100, shared=True)
+    limiter.hit("redirect", "1.1.1.1")
+    unsynced = dict(limiter._unsynced)
+
+    async def failing_flush(unsynced):
+        raise ConnectionError("db is down")
+
+    limiter._flush = failing_flush
+    with pytest.raises(ConnectionError):
+        await limiter.sync()
+    assert limiter._unsynced == unsynced
+
+
+@pytest.fixture
+async def clean_hits(database_url):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(RateLimitHit))
+        await db.commit()
+    yield
+
+
+async def test_sync_of_many_keys_stays_under_parameter_limit(
+    clean_hits, monkeypatch
+):
+    monkeypatch.setattr(rate_limit, "SYNC_CHUNK_SIZE", 3000)
+    limiter = make_limiter(per_minute=2, shared=True, max_keys=20_000)
+    # 12 000 ключей: одним INSERT это 36 000 параметров
+    for i in range(12_000):
+        limiter.hit("redirect", f"10.{i // 256}.{i % 256}.1")
+    for _ in range(2):
+        limiter.hit("redirect", "1.1.1.1")
+    # Второй воркер: вместе ключ превышает лимит
+    other = make_limiter(per_minute=2, shared=True)
+    other.hit("redirect", "1.1.1.1")
+
+    await other.sync()
+    await limiter.sync()
+
+    assert not limiter._unsynced
+    assert ("redirect", "1.1.1.1") in limiter._blocked
+    assert ("redirect", "10.0.0.1") not in limiter._blocked
+
+
+async def client_ip(peer: str, forwarded_for: str) -> str:
+    """IP that get_real_ip() sees behind uvicorn with the default trusted proxy."""
+
+    async def app(request: Request):
+        return PlainTextResponse(get_real_ip(request))
+
+    transport = httpx.ASGITransport(
+        app=ProxyHeadersMiddleware(Starlette(routes=[Route("/", app)]), "127.0.0.1"),
+        client=(peer, 40000),
+    )
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        response = await http.get("/", headers={"X-Forwarded-For": forwarded_for})
+    return response.text
+
+
+async def test_forwarded_for_from_clients_cannot_pick_the_rate_limit_key():
+    limiter = make_limiter(per_minute=2)
+    hits = [
+        limiter.hit("redirect", await client_ip("203.0.113.7", f"10.0.0.{i}"))
+        for i in range(5)
+    ]
+    assert hits == [True, True, False, False, False]
+
+
+async def test_trusted_proxy_key_is_the_hop_it_appended():
+    # Клиент подставил свой адрес в начало цепочки, nginx дописал настоящий
+    assert await client_ip("127.0.0.1", "10.0.0.1, 203.0.113.7") == "203.0.113.7"
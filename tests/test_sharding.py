@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+from src import reshard, sharding
+from src.config import settings
+from src.sharding import SHARD_BUCKETS, SHARD_MAP_CHANNEL, ShardRouter
+
+
+class RecordingBus:
+    """NotificationBus double: lets a test deliver notifications by hand."""
+
+    def __init__(self):
+        self.listening_since: float | None = None
+        self.handlers: dict[str, list] = {}
+
+    def subscribe(self, channel, handler):
+        self.handlers.setdefault(channel, []).append(handler)
+
+    def notify(self, channel, payload):
+        for handler in self.handlers[channel]:
+            handler(payload)
+
+
+async def test_map_broadcast_switches_routing():
+    bus = RecordingBus()
+    router = ShardRouter([settings.database_url, settings.database_url], bus)
+    # Пока карты нет, все ссылки в шарде 0
+    assert router.stats()["buckets"] == [1024, 0]
+
+    bus.notify(SHARD_MAP_CHANNEL, json.dumps([1] * SHARD_BUCKETS))
+    assert router.stats()["buckets"] == [0, 1024]
+    assert router.for_short_code("abc").index == 1
+    await router.close()
+
+
+async def test_reload_does_not_override_a_newer_broadcast(monkeypatch):
+    bus = RecordingBus()
+    router = ShardRouter([settings.database_url, settings.database_url], bus)
+    reading = asyncio.Event()
+
+    async def slow_load(shard_count):
+        # Уведомление пришло, пока перечитывание ждало ответа БД
+        bus.notify(SHARD_MAP_CHANNEL, json.dumps([1] * SHARD_BUCKETS))
+        reading.set()
+        return [0] * SHARD_BUCKETS
+
+    monkeypatch.setattr(sharding, "load_bucket_map", slow_load)
+    await router.reload_map()
+    assert reading.is_set()
+    assert router.stats()["buckets"] == [0, 1024]
+    await router.close()
+
+
+async def test_only_complete_copies_are_verified(monkeypatch):
+    source, target = object(), object()
+    totals = {
+        # url_id -> (строк clicks, счетчик)
+        source: {1: (3, 3), 2: (2, 2), 3: (1, 1), 4: (0, 0)},
+        target: {1: (3, 5), 2: (1, 2), 4: (0, 0)},
+    }
+
+    async def link_totals(shard, url_ids, batch_size):
+        return {i: totals[shard][i] for i in url_ids if i in totals[shard]}
+
+    monkeypatch.setattr(reshard, "_link_totals", link_totals)
+    copied, pending = await reshard._verify_copies(source, target, [1, 2, 3, 4], 2)
+    assert copied == [1, 4]
+    # 2 - догнаны не все переходы, 3 - ссылки в новом шарде нет
+    assert pending == [2, 3]
@@ -0,0 +1,164 @@
+import asyncio
+
+import asyncpg
+import pytest
+from sqlalchemy import delete, func, select
+
+from src import services, short_code_filter as filter_module
+from src.bloom import BloomFilter
+from src.database import AsyncSessionLocal
+from src.invalidation import INVALIDATION_CHANNEL, cache_invalidator
+from src.models import URL, WarmupSnapshot
+from src.notifications import notification_bus
+from src.schemas import URLCreate
+from src.services import create_url, get_url_by_short_code
+from src.short_code_filter import ShortCodeFilter, short_code_filter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(10_000, 0.01)
+    codes = [f"code{i}" for i in range(10_000)]
+    bloom.update(codes)
+    assert all(code in bloom for code in codes)
+    assert bloom.count == len(codes)
+
+
+def test_update_matches_add_and_bits_round_trip():
+    codes = [f"code{i}" for i in range(1000)]
+    one_by_one, batched = BloomFilter(1000), BloomFilter(1000)
+    for code in codes:
+        one_by_one.add(code)
+    batched.update(codes)
+    assert one_by_one.bits == batched.bits
+
+    restored = BloomFilter(1000, bits=bytes(batched.bits))
+    assert all(code in restored for code in codes)
+    with pytest.raises(ValueError):
+        BloomFilter(2000, bits=bytes(batched.bits))
+
+
+@pytest.fixture
+async def listening(database_url):
+    await notification_bus.start()
+    for _ in range(100):
+        if notification_bus.listening_since is not None:
+            break
+        await asyncio.sleep(0.05)
+    short_code_filter._filter = BloomFilter(1000)
+    yield database_url
+    short_code_filter._filter = None
+    await notification_bus.close()
+
+
+async def test_miss_waits_for_notifications_in_flight(listening):
+    # Другой воркер создал код и уже ответил клиенту; NOTIFY еще не разобран
+    connection = await asyncpg.connect(listening)
+    await connection.execute(
+        "SELECT pg_notify($1, $2)",
+        INVALIDATION_CHANNEL,
+        '{"kind":"url_created","keys":["fresh123"]}',
+    )
+    await connection.close()
+
+    assert not short_code_filter.might_exist("fresh123")
+    assert await cache_invalidator.sync()
+    assert short_code_filter.might_exist("fresh123")
+
+
+async def test_unknown_code_is_answered_by_filter(listening):
+    assert await get_url_by_short_code("nosuchcode") is None
+    assert short_code_filter.ready
+
+
+async def test_filter_disabled_when_listen_connection_is_lost(listening):
+    connection = await asyncpg.connect(listening)
+    await connection.execute(
+        "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+        "WHERE query LIKE 'LISTEN%' AND pid <> pg_backend_pid()"
+    )
+    await connection.close()
+    for _ in range(100):
+        if not short_code_filter.ready:
+            break
+        await asyncio.sleep(0.02)
+    assert not short_code_filter.ready
+    assert short_code_filter.might_exist("anything")
+
+
+async def test_one_worker_scans_the_others_load_the_snapshot(listening, monkeypatch):
+    monkeypatch.setattr(filter_module, "EVENT_MARGIN_SECONDS", 0.0)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            delete(WarmupSnapshot).where(
+                WarmupSnapshot.key == filter_module.SNAPSHOT_KEY
+            )
+        )
+        await db.commit()
+    url = await create_url(URLCreate(original_url="https://example.com/bloom"))
+
+    scans = 0
+    scan = ShortCodeFilter._scan
+
+    async def counting_scan(self):
+        nonlocal scans
+        scans += 1
+        return await scan(self)
+
+    monkeypatch.setattr(ShortCodeFilter, "_scan", counting_scan)
+    first, second = (
+        ShortCodeFilter(notification_bus, 1000, 0.01, 3600) for _ in range(2)
+    )
+    await first.rebuild()
+    # Код создан после скана: второй воркер узнал о нем из события
+    second.add({"created-after-scan"})
+    await second.rebuild()
+
+    assert scans == 1
+    assert first.might_exist(url.short_code) and second.might_exist(url.short_code)
+    assert second.might_exist("created-after-scan")
+
+
+@pytest.fixture
+def flaky_publish(monkeypatch):
+    """Make "url_created" fail a given number of times; records what was sent."""
+    state = {"failures": 0, "sent": [], "attempts": 0}
+    publish = cache_invalidator.publish_after_commit
+
+    async def failing_publish(kind, keys):
+        state["attempts"] += 1
+        if state["attempts"] <= state["failures"]:
+            raise ConnectionError("main database is down")
+        state["sent"].extend(keys)
+        await publish(kind, keys)
+
+    monkeypatch.setattr(cache_invalidator, "publish_after_commit", failing_publish)
+    monkeypatch.setattr(services, "URL_CREATED_RETRY_DELAY", 0.0)
+    return state
+
+
+async def test_url_created_is_retried(database_url, flaky_publish):
+    flaky_publish["failures"] = services.URL_CREATED_PUBLISH_ATTEMPTS - 1
+    url = await create_url(URLCreate(original_url="https://example.com/retry"))
+    assert flaky_publish["sent"] == [url.short_code]
+
+
+async def test_link_is_not_created_when_it_cannot_be_announced(
+    database_url, flaky_publish, monkeypatch
+):
+    flaky_publish["failures"] = services.URL_CREATED_PUBLISH_ATTEMPTS
+    codes = []
+    generate = services.generate_short_code
+
+    def recording_generate():
+        codes.append(generate())
+        return codes[-1]
+
+    monkeypatch.setattr(services, "generate_short_code", recording_generate)
+    with pytest.raises(ConnectionError):
+        await create_url(URLCreate(original_url="https://example.com/lost"))
+    # Другие воркеры не узнали бы код - ссылки нет, клиент получил ошибку
+    async with AsyncSessionLocal() as db:
+        created = await db.scalar(
+            select(func.count(URL.id)).where(URL.short_code == codes[-1])
+        )
+    assert created == 0
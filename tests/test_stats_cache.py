@@ -0,0 +1,131 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from src.routes import stats
+from src.schemas import URLStatsDTO
+from src.stats_cache import ResponseCache
+
+
+class Counter:
+    """compute() double returning a new body on every call."""
+
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self) -> bytes:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return f'{{"calls": {self.calls}}}'.encode()
+
+
+def make_cache() -> ResponseCache:
+    return ResponseCache(ttl=30.0, stale_ttl=300.0, maxsize=100)
+
+
+def age(cache: ResponseCache, key: str, seconds: float) -> None:
+    cache._entries.get(key).created -= seconds
+
+
+async def test_fresh_entry_is_served_without_recomputing():
+    cache, compute = make_cache(), Counter()
+    first = await cache.get("stats:abc", "0:1", compute)
+    second = await cache.get("stats:abc", "0:1", compute)
+    assert second is first
+    assert compute.calls == 1
+
+
+async def test_concurrent_misses_share_one_computation():
+    cache, compute = make_cache(), Counter(delay=0.05)
+    entries = await asyncio.gather(
+        *(cache.get("stats:abc", "0:1", compute) for _ in range(20))
+    )
+    assert compute.calls == 1
+    assert {entry.etag for entry in entries} == {entries[0].etag}
+
+
+async def test_new_version_serves_stale_entry_and_refreshes_in_background():
+    cache, compute = make_cache(), Counter(delay=0.05)
+    stale = await cache.get("stats:abc", "0:1", compute)
+
+    # Новый переход: отвечаем сразу старым телом, пересчет идет фоном
+    assert await cache.get("stats:abc", "0:2", compute) is stale
+    assert await cache.get("stats:abc", "0:2", compute) is stale
+    await asyncio.sleep(0.1)
+    assert compute.calls == 2
+
+    fresh = await cache.get("stats:abc", "0:2", compute)
+    assert fresh.body == b'{"calls": 2}'
+    assert fresh.etag != stale.etag
+
+
+async def test_entry_past_stale_ttl_is_recomputed_inline():
+    cache, compute = make_cache(), Counter()
+    await cache.get("stats:abc", "0:1", compute)
+    age(cache, "stats:abc", 301.0)
+    entry = await cache.get("stats:abc", "0:1", compute)
+    assert entry.body == b'{"calls": 2}'
+
+
+async def test_missing_link_is_not_cached():
+    cache = make_cache()
+
+    async def missing() -> None:
+        return None
+
+    assert await cache.get("stats:abc", "0:1", missing) is None
+    assert cache._entries.get("stats:abc") is None
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    calls = []
+
+    async def get_url_stats(short_code: str) -> URLStatsDTO | None:
+        calls.append(short_code)
+        if short_code != "abc":
+            return None
+        return URLStatsDTO(
+            url_id=1,
+            short_code="abc",
+            original_url="https://example.com",
+            short_url="http://test/abc",
+            total_clicks=3,
+            created_at="2026-10-19T12:00:00Z",
+            last_click=None,
+        )
+
+    monkeypatch.setattr(stats, "get_url_stats", get_url_stats)
+    monkeypatch.setattr(stats, "stats_cache", make_cache())
+    app = FastAPI()
+    app.include_router(stats.router)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        client.calls = calls
+        yield client
+
+
+async def test_matching_etag_gets_304_without_body(client):
+    response = await client.get("/stats/abc")
+    assert response.status_code == 200
+    assert response.json()["total_clicks"] == 3
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "no-cache"
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}'):
+        revalidated = await client.get(
+            "/stats/abc", headers={"If-None-Match": if_none_match}
+        )
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+    assert client.calls == ["abc"]
+
+
+async def test_unknown_link_is_404(client):
+    assert (await client.get("/stats/nope")).status_code == 404
+    assert (await client.get("/stats/nope")).status_code == 404
+    assert client.calls == ["nope", "nope"]
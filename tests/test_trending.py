@@ -0,0 +1,51 @@
+import json
+
+from src.trending import TrendingTracker
+
+
+class RecordingStream:
+    def on_clicks(self, listener):
+        self.listener = listener
+
+
+class RecordingInvalidator:
+    def register(self, kind, evict, clear):
+        self.kind, self.evict = kind, evict
+
+
+def tracker(tmp_path) -> tuple[TrendingTracker, RecordingStream, RecordingInvalidator]:
+    stream, invalidator = RecordingStream(), RecordingInvalidator()
+    trending = TrendingTracker(
+        stream,
+        invalidator,
+        top_k=10,
+        refresh_interval=60.0,
+        checkpoint_path=str(tmp_path / "trending.json"),
+        checkpoint_interval=60.0,
+    )
+    return trending, stream, invalidator
+
+
+def top(trending: TrendingTracker, window: str = "1h") -> list[tuple[str, int]]:
+    trending.refresh()
+    links = json.loads(trending.get(window))["links"]
+    return [(link["short_code"], link["clicks"]) for link in links]
+
+
+def test_only_human_clicks_are_counted(tmp_path):
+    trending, stream, _ = tracker(tmp_path)
+    stream.listener(1, "abc", 10, 4)
+    stream.listener(2, "bot", 3, 3)
+    assert top(trending) == [("abc", 6)]
+
+
+def test_deleted_links_leave_every_window(tmp_path):
+    trending, stream, invalidator = tracker(tmp_path)
+    stream.listener(1, "abc", 5, 0)
+    stream.listener(2, "xyz", 2, 0)
+
+    assert invalidator.kind == "url"
+    invalidator.evict({"abc", "never-clicked"})
+    for window in ("5m", "1h", "24h"):
+        assert top(trending, window) == [("xyz", 2)]
+    assert [counts for _, counts in trending._snapshot()["buckets"]] == [{"2": 2}]
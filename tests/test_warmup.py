@@ -0,0 +1,60 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+
+from src.database import AsyncSessionLocal
+from src.models import URL, WarmupSnapshot
+from src.schemas import URLDTO
+from src.services import get_shared_hot_urls
+
+
+async def test_snapshot_skips_links_deleted_or_expired_since(database_url):
+    now = datetime.now(timezone.utc)
+    prefix = uuid.uuid4().hex[:6]
+    live = URL(original_url="https://example.com/live", short_code=f"{prefix}lv")
+    expired = URL(
+        original_url="https://example.com/expired",
+        short_code=f"{prefix}ex",
+        expires_at=now + timedelta(days=1),
+    )
+    deleted = URL(original_url="https://example.com/deleted", short_code=f"{prefix}dl")
+    async with AsyncSessionLocal() as db:
+        db.add_all([live, expired, deleted])
+        await db.flush()
+        snapshot = [
+            URLDTO(
+                id=url.id,
+                original_url=url.original_url,
+                short_code=url.short_code,
+                created_at=url.created_at,
+                expires_at=url.expires_at,
+            ).model_dump(mode="json")
+            for url in (deleted, live, expired)
+        ]
+        stmt = insert(WarmupSnapshot).values(
+            key="hot_links", computed_at=now, payload=snapshot
+        )
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[WarmupSnapshot.key],
+                set_={"computed_at": now, "payload": stmt.excluded.payload},
+            )
+        )
+        # Снимок уже посчитан, после этого одну ссылку удалили, другая истекла
+        live_code, ids = live.short_code, [live.id, expired.id]
+        await db.execute(delete(URL).where(URL.id == deleted.id))
+        expired.expires_at = now - timedelta(minutes=1)
+        await db.commit()
+
+    try:
+        hot_urls = await get_shared_hot_urls(limit=10)
+        assert [url_dto.short_code for url_dto in hot_urls] == [live_code]
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(WarmupSnapshot).where(WarmupSnapshot.key == "hot_links")
+            )
+            await db.execute(delete(URL).where(URL.id.in_(ids)))
+            await db.commit()